@@ -101,6 +101,10 @@ export default defineConfig({
                   label: "Shuffle",
                   slug: "dataloader/shuffle",
                 },
+                {
+                  label: "Mixture",
+                  slug: "dataloader/mixture",
+                },
                 {
                   label: "Cache",
                   slug: "dataloader/cache",
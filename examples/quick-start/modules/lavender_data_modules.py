@@ -12,7 +12,7 @@ class UidModFilter(Filter, name="uid_mod"):
 
 
 class PyListCollater(Collater, name="pylist"):
-    def collate(self, samples: list[dict]) -> dict:
+    def collate(self, samples: list[dict], **kwargs) -> dict:
         return {
             "uid": [sample["uid"] for sample in samples],
             "text": [sample["text"] for sample in samples],
@@ -67,6 +67,9 @@ from openapi_lavender_data_rest.models.iteration_collater import IterationCollat
 from openapi_lavender_data_rest.models.iteration_preprocessor import (
     IterationPreprocessor,
 )
+from openapi_lavender_data_rest.models.iteration_mixture_component import (
+    IterationMixtureComponent,
+)
 from openapi_lavender_data_rest.models.preprocess_dataset_params import (
     PreprocessDatasetParams,
 )
@@ -306,12 +309,18 @@ class LavenderDataClient:
         shuffle: bool = False,
         shuffle_seed: Optional[int] = None,
         shuffle_block_size: Optional[int] = None,
+        shuffle_mode: Optional[str] = None,
+        shuffle_buffer_size: Optional[int] = None,
         batch_size: Optional[int] = None,
+        batch_token_budget: Optional[int] = None,
+        batch_length_column: Optional[str] = None,
+        batch_window_size: Optional[int] = None,
         replication_pg: Optional[list[list[int]]] = None,
         filters: Optional[list[IterationFilter]] = None,
         categorizer: Optional[IterationCategorizer] = None,
         collater: Optional[IterationCollater] = None,
         preprocessors: Optional[list[IterationPreprocessor]] = None,
+        mixture: Optional[list[IterationMixtureComponent]] = None,
         max_retry_count: int = 0,
         rank: int = 0,
         world_size: Optional[int] = None,
@@ -319,6 +328,8 @@ class LavenderDataClient:
         no_cache: Optional[bool] = None,
         num_workers: Optional[int] = None,
         prefetch_factor: Optional[int] = None,
+        prefetch_autotune: Optional[bool] = None,
+        prefetch_priority: Optional[float] = None,
         in_order: Optional[bool] = None,
     ):
         with self._get_client() as client:
@@ -330,11 +341,17 @@ class LavenderDataClient:
                     shuffle=shuffle,
                     shuffle_seed=shuffle_seed,
                     shuffle_block_size=shuffle_block_size,
+                    shuffle_mode=shuffle_mode,
+                    shuffle_buffer_size=shuffle_buffer_size,
                     batch_size=batch_size,
+                    batch_token_budget=batch_token_budget,
+                    batch_length_column=batch_length_column,
+                    batch_window_size=batch_window_size,
                     filters=filters,
                     categorizer=categorizer,
                     collater=collater,
                     preprocessors=preprocessors,
+                    mixture=mixture,
                     replication_pg=replication_pg,
                     max_retry_count=max_retry_count,
                     rank=rank,
@@ -343,6 +360,8 @@ class LavenderDataClient:
                     no_cache=no_cache,
                     num_workers=num_workers,
                     prefetch_factor=prefetch_factor,
+                    prefetch_autotune=prefetch_autotune,
+                    prefetch_priority=prefetch_priority,
                     in_order=in_order,
                 ),
             )
@@ -594,12 +613,18 @@ def create_iteration(
     shuffle: bool = False,
     shuffle_seed: Optional[int] = None,
     shuffle_block_size: Optional[int] = None,
+    shuffle_mode: Optional[str] = None,
+    shuffle_buffer_size: Optional[int] = None,
     batch_size: Optional[int] = None,
+    batch_token_budget: Optional[int] = None,
+    batch_length_column: Optional[str] = None,
+    batch_window_size: Optional[int] = None,
     replication_pg: Optional[list[list[int]]] = None,
     filters: Optional[list[IterationFilter]] = None,
     categorizer: Optional[IterationCategorizer] = None,
     collater: Optional[IterationCollater] = None,
     preprocessors: Optional[list[IterationPreprocessor]] = None,
+    mixture: Optional[list[IterationMixtureComponent]] = None,
     max_retry_count: int = 0,
     rank: int = 0,
     world_size: Optional[int] = None,
@@ -607,6 +632,8 @@ def create_iteration(
     no_cache: Optional[bool] = None,
     num_workers: Optional[int] = None,
     prefetch_factor: Optional[int] = None,
+    prefetch_autotune: Optional[bool] = None,
+    prefetch_priority: Optional[float] = None,
     in_order: Optional[bool] = None,
 ):
     return _client_instance.create_iteration(
@@ -615,12 +642,18 @@ def create_iteration(
         shuffle=shuffle,
         shuffle_seed=shuffle_seed,
         shuffle_block_size=shuffle_block_size,
+        shuffle_mode=shuffle_mode,
+        shuffle_buffer_size=shuffle_buffer_size,
         batch_size=batch_size,
+        batch_token_budget=batch_token_budget,
+        batch_length_column=batch_length_column,
+        batch_window_size=batch_window_size,
         replication_pg=replication_pg,
         filters=filters,
         categorizer=categorizer,
         collater=collater,
         preprocessors=preprocessors,
+        mixture=mixture,
         max_retry_count=max_retry_count,
         rank=rank,
         world_size=world_size,
@@ -628,6 +661,8 @@ def create_iteration(
         no_cache=no_cache,
         num_workers=num_workers,
         prefetch_factor=prefetch_factor,
+        prefetch_autotune=prefetch_autotune,
+        prefetch_priority=prefetch_priority,
         in_order=in_order,
     )
 
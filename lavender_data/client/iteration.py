@@ -14,6 +14,7 @@ from lavender_data.client.api import (
     IterationPreprocessor,
     IterationCollater,
     IterationCategorizer,
+    IterationMixtureComponent,
     LavenderDataStillProcessingError,
 )
 
@@ -69,12 +70,18 @@ class LavenderDataLoader:
         categorizer: Optional[Union[tuple[str, dict], str]] = None,
         collater: Optional[Union[tuple[str, dict], str]] = None,
         preprocessors: Optional[list[Union[tuple[str, dict], str]]] = None,
+        mixture: Optional[list[dict]] = None,
         max_retry_count: int = 0,
         skip_on_failure: bool = False,
         shuffle: Optional[bool] = None,
         shuffle_seed: Optional[int] = None,
         shuffle_block_size: Optional[int] = None,
+        shuffle_mode: Optional[str] = None,
+        shuffle_buffer_size: Optional[int] = None,
         batch_size: Optional[int] = None,
+        batch_token_budget: Optional[int] = None,
+        batch_length_column: Optional[str] = None,
+        batch_window_size: Optional[int] = None,
         replication_pg: Optional[list[list[int]]] = None,
         rank: int = 0,
         world_size: Optional[int] = None,
@@ -83,6 +90,8 @@ class LavenderDataLoader:
         no_cache: Optional[bool] = None,
         num_workers: Optional[int] = None,
         prefetch_factor: Optional[int] = None,
+        prefetch_autotune: Optional[bool] = None,
+        prefetch_priority: Optional[float] = None,
         poll_interval: Optional[float] = None,
         in_order: Optional[bool] = None,
         api_url: Optional[str] = None,
@@ -107,6 +116,8 @@ class LavenderDataLoader:
         self._api = _api(self._api_url, self._api_key)
 
         if iteration_id is None:
+            if dataset_id is None and mixture is not None and len(mixture) > 0:
+                dataset_id = mixture[0]["dataset_id"]
             if dataset_id is None:
                 if dataset_name is None:
                     raise ValueError(
@@ -137,10 +148,20 @@ class LavenderDataLoader:
                     if preprocessors is not None
                     else None
                 ),
+                mixture=(
+                    [IterationMixtureComponent.from_dict(c) for c in mixture]
+                    if mixture is not None
+                    else None
+                ),
                 shuffle=shuffle,
                 shuffle_seed=shuffle_seed,
                 shuffle_block_size=shuffle_block_size,
+                shuffle_mode=shuffle_mode,
+                shuffle_buffer_size=shuffle_buffer_size,
                 batch_size=batch_size,
+                batch_token_budget=batch_token_budget,
+                batch_length_column=batch_length_column,
+                batch_window_size=batch_window_size,
                 replication_pg=replication_pg,
                 rank=rank,
                 world_size=world_size,
@@ -148,6 +169,8 @@ class LavenderDataLoader:
                 no_cache=no_cache,
                 num_workers=num_workers,
                 prefetch_factor=prefetch_factor,
+                prefetch_autotune=prefetch_autotune,
+                prefetch_priority=prefetch_priority,
                 max_retry_count=max_retry_count,
                 in_order=in_order,
             )
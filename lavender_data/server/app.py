@@ -13,7 +13,7 @@ from .ui import setup_ui
 from .db import setup_db
 from .cache import setup_cache
 from .distributed import setup_cluster, cleanup_cluster, get_cluster
-from .reader import setup_reader
+from .reader import setup_reader, shutdown_reader
 from .background_worker import (
     setup_background_worker,
     shutdown_background_worker,
@@ -23,6 +23,8 @@ from .background_worker import (
 from .iteration import (
     setup_iteration_prefetcher_pool,
     shutdown_iteration_prefetcher_pool,
+    setup_preprocessor_executor,
+    shutdown_preprocessor_executor,
 )
 from .routes import (
     datasets_router,
@@ -31,6 +33,7 @@ from .routes import (
     cluster_router,
     root_router,
     background_tasks_router,
+    reader_router,
 )
 
 from .registries import setup_registries
@@ -51,7 +54,16 @@ async def lifespan(app: FastAPI):
         settings.lavender_data_modules_reload_interval,
     )
 
-    setup_reader(settings.lavender_data_reader_disk_cache_size)
+    setup_reader(
+        settings.lavender_data_reader_disk_cache_size,
+        settings.lavender_data_reader_memory_cache_size,
+        settings.lavender_data_reader_disk_cache_index,
+        settings.lavender_data_reader_lookahead_workers,
+        settings.lavender_data_reader_lookahead_start_rate,
+        settings.lavender_data_reader_remote_read,
+        # verified by the main process only
+        scrub_interval=settings.lavender_data_reader_disk_cache_scrub_interval,
+    )
 
     setup_cluster(
         enabled=settings.lavender_data_cluster_enabled,
@@ -69,7 +81,9 @@ async def lifespan(app: FastAPI):
 
     setup_background_worker(settings.lavender_data_num_workers)
 
-    setup_iteration_prefetcher_pool()
+    setup_preprocessor_executor(settings.lavender_data_preprocess_workers)
+
+    setup_iteration_prefetcher_pool(settings.lavender_data_prefetch_workers)
 
     if settings.lavender_data_disable_ui:
         logger.warning("UI is disabled")
@@ -119,6 +133,16 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Iteration prefetcher pool failed to shutdown: {e}")
 
+    try:
+        shutdown_preprocessor_executor()
+    except Exception as e:
+        logger.warning(f"Preprocessor executor failed to shutdown: {e}")
+
+    try:
+        shutdown_reader()
+    except Exception as e:
+        logger.warning(f"Reader failed to shutdown: {e}")
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -170,3 +194,4 @@ app.include_router(iterations_router)
 app.include_router(registries_router)
 app.include_router(cluster_router)
 app.include_router(background_tasks_router)
+app.include_router(reader_router)
@@ -13,6 +13,10 @@ from .memory import (
     setup_shared_memory,
     get_shared_memory,
     shutdown_shared_memory,
+    share_arrays,
+    load_arrays,
+    mapped_arrays,
+    free_arrays,
 )
 from .process_pool import ProcessPool, pool_task
 
@@ -28,6 +32,10 @@ __all__ = [
     "setup_shared_memory",
     "get_shared_memory",
     "shutdown_shared_memory",
+    "share_arrays",
+    "load_arrays",
+    "mapped_arrays",
+    "free_arrays",
     "ProcessPool",
     "get_process_pool",
     "pool_task",
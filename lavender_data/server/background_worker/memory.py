@@ -1,10 +1,19 @@
-from multiprocessing import shared_memory as mp_shared_memory
-from typing import Union, Optional
+from multiprocessing import shared_memory as mp_shared_memory, resource_tracker
+from typing import Any, NamedTuple, Union, Optional
+import contextlib
 import time
 import threading
 import hashlib
+
+import numpy as np
+
 from lavender_data.logging import get_logger
 
+try:
+    import torch
+except ImportError:
+    torch = None
+
 EOF_SIGNATURE = b"EOF"
 
 
@@ -131,3 +140,174 @@ def shutdown_shared_memory():
     if _shared_memory is not None:
         _shared_memory.clear()
         _shared_memory = None
+
+
+# smaller arrays are cheaper to pickle than to put in a segment of their own
+_min_shared_array_nbytes = 64 * 1024
+
+
+class SharedArray(NamedTuple):
+    """An array moved to a shared memory segment, which is pickled in place
+    of the array. The segment is owned, and unlinked, by the process that
+    reads the array back."""
+
+    name: str
+    dtype: str
+    shape: tuple[int, ...]
+    is_tensor: bool
+
+
+def _share_array(value: Any) -> Any:
+    is_tensor = torch is not None and isinstance(value, torch.Tensor)
+    if is_tensor:
+        if value.device.type != "cpu" or value.requires_grad:
+            return value
+        array = value.numpy()
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        array = value
+    else:
+        return value
+
+    if array.nbytes < _min_shared_array_nbytes:
+        return value
+
+    memory = mp_shared_memory.SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    shared = SharedArray(
+        name=memory.name,
+        dtype=array.dtype.str,
+        shape=array.shape,
+        is_tensor=is_tensor,
+    )
+    memory.close()
+    # handed over to the reading process, which unlinks it. otherwise the
+    # resource tracker of this process would report it as leaked and unlink
+    # it again on exit
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return shared
+
+
+def _load_array(value: Any) -> Any:
+    if not isinstance(value, SharedArray):
+        return value
+
+    memory = mp_shared_memory.SharedMemory(name=value.name)
+    try:
+        # copied out, so that the segment can be unlinked right away
+        array = np.ndarray(
+            value.shape, dtype=np.dtype(value.dtype), buffer=memory.buf
+        ).copy()
+    finally:
+        memory.close()
+        memory.unlink()
+    if value.is_tensor:
+        return torch.from_numpy(array)
+    return array
+
+
+def _free_array(value: Any) -> None:
+    if not isinstance(value, SharedArray):
+        return
+    try:
+        memory = mp_shared_memory.SharedMemory(name=value.name)
+    except FileNotFoundError:
+        return
+    memory.close()
+    try:
+        memory.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# mappings that were still referenced when their batch was done with, closed
+# on the next batch
+_unclosed_memories: list[mp_shared_memory.SharedMemory] = []
+
+
+def _close_memories(memories: list[mp_shared_memory.SharedMemory]) -> None:
+    for memory in memories:
+        try:
+            memory.close()
+        except BufferError:
+            _unclosed_memories.append(memory)
+
+
+def _map_array(value: Any, memories: list[mp_shared_memory.SharedMemory]) -> Any:
+    if not isinstance(value, SharedArray):
+        return value
+
+    memory = mp_shared_memory.SharedMemory(name=value.name)
+    memories.append(memory)
+    # the mapping stays valid after the segment is unlinked
+    memory.unlink()
+    # unlike np.ndarray, the view holds the buffer so that the memory is not
+    # unmapped under it
+    array = np.frombuffer(
+        memory.buf, dtype=np.dtype(value.dtype), count=int(np.prod(value.shape))
+    ).reshape(value.shape)
+    if value.is_tensor:
+        return torch.from_numpy(array)
+    return array
+
+
+def share_arrays(batch: dict) -> dict:
+    """The batch with its arrays and tensors, and those in its lists, copied
+    to shared memory so that they are not pickled when the batch is sent to
+    another process. ``load_arrays`` copies them back and frees the memory,
+    ``mapped_arrays`` maps them without copying, or ``free_arrays`` frees it
+    if the batch is not loaded."""
+    shared = {}
+    for key, value in batch.items():
+        if isinstance(value, (list, tuple)):
+            shared[key] = type(value)(_share_array(v) for v in value)
+        else:
+            shared[key] = _share_array(value)
+    return shared
+
+
+def load_arrays(batch: dict) -> dict:
+    """The batch of ``share_arrays`` with the arrays copied back from, and
+    removed from, shared memory."""
+    loaded = {}
+    for key, value in batch.items():
+        if isinstance(value, (list, tuple)) and not isinstance(value, SharedArray):
+            loaded[key] = type(value)(_load_array(v) for v in value)
+        else:
+            loaded[key] = _load_array(value)
+    return loaded
+
+
+def free_arrays(batch: dict) -> None:
+    """Frees the shared memory of a batch of ``share_arrays`` that was not,
+    or only partly, loaded."""
+    for value in batch.values():
+        if isinstance(value, (list, tuple)) and not isinstance(value, SharedArray):
+            for v in value:
+                _free_array(v)
+        else:
+            _free_array(value)
+
+
+@contextlib.contextmanager
+def mapped_arrays(batch: dict):
+    """The batch of ``share_arrays`` with its arrays as views on the shared
+    memory instead of copies, to be used within the context. The segments
+    are unlinked right away and unmapped on exit, or on a later batch for the
+    views still referenced then."""
+    memories = _unclosed_memories[:]
+    _unclosed_memories.clear()
+    _close_memories(memories)
+
+    memories = []
+    mapped = {}
+    try:
+        for key, value in batch.items():
+            if isinstance(value, (list, tuple)) and not isinstance(value, SharedArray):
+                mapped[key] = type(value)(_map_array(v, memories) for v in value)
+            else:
+                mapped[key] = _map_array(value, memories)
+        yield mapped
+    finally:
+        # drops the views of the batch, so that the memory can be unmapped
+        mapped.clear()
+        _close_memories(memories)
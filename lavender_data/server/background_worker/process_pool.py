@@ -30,7 +30,18 @@ def _initializer(settings: Settings, kill_switch):
         settings.lavender_data_modules_dir,
         settings.lavender_data_modules_reload_interval,
     )
-    setup_reader(settings.lavender_data_reader_disk_cache_size)
+    setup_reader(
+        settings.lavender_data_reader_disk_cache_size,
+        settings.lavender_data_reader_memory_cache_size,
+        settings.lavender_data_reader_disk_cache_index,
+        settings.lavender_data_reader_lookahead_workers,
+        settings.lavender_data_reader_lookahead_start_rate,
+        settings.lavender_data_reader_remote_read,
+    )
+    # imported here, the iteration module depends on the background worker
+    from lavender_data.server.iteration.executor import setup_preprocessor_executor
+
+    setup_preprocessor_executor(settings.lavender_data_preprocess_workers)
 
     def _abort_on_kill_switch():
         while True:
@@ -103,6 +114,9 @@ def _worker_process(
             )
 
         result_queue.put(result_item)
+        # the result is sent, only the work in progress is reported aborted.
+        # otherwise the result would be replaced, and its shared memory leaked
+        work_item = None
 
     if work_item is not None:
         result_queue.put(
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
-from typing import Optional, Iterator, Any, Union
+from typing import Optional, Iterator, Any, Set, Union
 
 
 class CacheOperations(ABC):
@@ -74,8 +74,31 @@ class CacheOperations(ABC):
     @abstractmethod
     def lrem(self, name: str, count: int, value: str) -> int: ...
 
+    @abstractmethod
+    def sadd(self, name: str, *values: str) -> int: ...
+
+    @abstractmethod
+    def smembers(self, name: str) -> Set[bytes]: ...
+
 
 class CacheInterface(CacheOperations):
+    @abstractmethod
+    def lpop_hset(
+        self, list_name: str, hash_name: str, count: int, value: str
+    ) -> list[bytes]:
+        """Atomically pops up to ``count`` items from the head of the list
+        ``list_name`` and sets each of them to ``value`` in the hash
+        ``hash_name``. Returns the popped items."""
+        ...
+
+    @abstractmethod
+    def lpop_random(self, name: str, keep: int, fractions: list[float]) -> list[bytes]:
+        """Atomically pops one item for each of ``fractions``, until ``keep``
+        items are left in the list ``name``. Each pops the item at
+        ``floor(fraction * length)`` and moves the last item in its place.
+        Returns the popped items."""
+        ...
+
     @contextmanager
     @abstractmethod
     def lock(self, key: str, timeout: Optional[int] = None) -> Iterator[None]: ...
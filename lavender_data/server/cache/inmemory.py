@@ -1,6 +1,6 @@
 import time
 import threading
-from typing import Optional, Any, Iterator, Union
+from typing import Optional, Any, Iterator, Set, Union
 from contextlib import contextmanager
 from fnmatch import fnmatch
 from .abc import CacheInterface, CacheOperations
@@ -21,6 +21,8 @@ class InMemoryCache(CacheInterface):
         self._hash_data: dict[str, dict[str, str]] = {}
         # For lists
         self._list_data: dict[str, list[str]] = {}
+        # For sets
+        self._set_data: dict[str, set[str]] = {}
         # For locks
         self._lock_data: dict[str, threading.Lock] = {}
         # Lock for thread safety
@@ -104,6 +106,7 @@ class InMemoryCache(CacheInterface):
                     set(self._data.keys())
                     | set(self._hash_data.keys())
                     | set(self._list_data.keys())
+                    | set(self._set_data.keys())
                 )
                 if fnmatch(k.decode("utf-8"), pattern)
             ]
@@ -124,6 +127,9 @@ class InMemoryCache(CacheInterface):
                 if _key in self._list_data:
                     del self._list_data[_key]
                     deleted += 1
+                if _key in self._set_data:
+                    del self._set_data[_key]
+                    deleted += 1
                 if _key in self._expiry:
                     del self._expiry[_key]
         return deleted
@@ -135,7 +141,10 @@ class InMemoryCache(CacheInterface):
             if self._check_expiry(_key):
                 return False
             return (
-                _key in self._data or _key in self._hash_data or _key in self._list_data
+                _key in self._data
+                or _key in self._hash_data
+                or _key in self._list_data
+                or _key in self._set_data
             )
 
     def expire(self, key: str, seconds: int) -> bool:
@@ -277,7 +286,7 @@ class InMemoryCache(CacheInterface):
                 value = self._list_data[_name].pop(0)
             else:
                 values = []
-                for _ in range(count):
+                for _ in range(min(count, len(self._list_data[_name]))):
                     values.append(self._list_data[_name].pop(0))
                 value = values
 
@@ -356,6 +365,63 @@ class InMemoryCache(CacheInterface):
             if count != 0:
                 raise ValueError("Non-zero count not supported in in-memory cache yet")
 
+    # Set operations
+    def sadd(self, name: str, *values: str) -> int:
+        """Add values to the set name"""
+        with self._lock:
+            _name = self._ensure_bytes(name)
+            if _name not in self._set_data:
+                self._set_data[_name] = set()
+
+            added = 0
+            for value in values:
+                _value = self._ensure_bytes(value)
+                if _value not in self._set_data[_name]:
+                    self._set_data[_name].add(_value)
+                    added += 1
+            return added
+
+    def smembers(self, name: str) -> Set[bytes]:
+        """Get all the members of the set name"""
+        with self._lock:
+            _name = self._ensure_bytes(name)
+            if self._check_expiry(_name):
+                return set()
+            return self._set_data.get(_name, set()).copy()
+
+    def lpop_hset(
+        self, list_name: str, hash_name: str, count: int, value: str
+    ) -> list[bytes]:
+        """Pop up to count items from the list and set them in the hash, atomically"""
+        with self._lock:
+            items = self.lpop(list_name, count) or []
+            if items:
+                self.hset(hash_name, mapping={item: value for item in items})
+            return items
+
+    def lpop_random(self, name: str, keep: int, fractions: list[float]) -> list[bytes]:
+        """Pop items at random positions of the list, swapped with the last
+        item, until keep items are left, atomically"""
+        with self._lock:
+            _name = self._ensure_bytes(name)
+            if self._check_expiry(_name):
+                return []
+            items = self._list_data.get(_name, [])
+            popped = []
+            for fraction in fractions:
+                if len(items) <= keep:
+                    break
+                position = int(fraction * len(items))
+                last = items.pop()
+                if position < len(items):
+                    popped.append(items[position])
+                    items[position] = last
+                else:
+                    popped.append(last)
+            if _name in self._list_data and not items:
+                del self._list_data[_name]
+            return popped
+
     @contextmanager
     def lock(self, key: str, timeout: Optional[int] = None) -> Iterator[None]:
         """Lock a key for a given timeout"""
@@ -478,6 +544,14 @@ class InMemoryPipeline(CacheOperations):
     def lrem(self, name: str, count: int, value: str) -> int:
         return self.cache.lrem(name, count, value)
 
+    @append_result
+    def sadd(self, name: str, *values: str) -> int:
+        return self.cache.sadd(name, *values)
+
+    @append_result
+    def smembers(self, name: str) -> Set[bytes]:
+        return self.cache.smembers(name)
+
     def execute(self) -> list[Any]:
         r = self.results
         self.results = []
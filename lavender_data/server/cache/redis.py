@@ -2,7 +2,38 @@ import contextlib
 from urllib.parse import urlparse
 
 from .abc import CacheInterface, PipelineInterface
-from typing import Optional, Iterator, Union
+from typing import Optional, Iterator, Set, Union
+
+_lpop_hset_script = """
+local items = redis.call("LPOP", KEYS[1], ARGV[1])
+if not items then
+    return {}
+end
+for _, item in ipairs(items) do
+    redis.call("HSET", KEYS[2], item, ARGV[2])
+end
+return items
+"""
+
+_lpop_random_script = """
+local keep = tonumber(ARGV[1])
+local items = {}
+for i = 2, #ARGV do
+    local length = redis.call("LLEN", KEYS[1])
+    if length <= keep then
+        break
+    end
+    local position = math.floor(tonumber(ARGV[i]) * length)
+    local last = redis.call("RPOP", KEYS[1])
+    if position < length - 1 then
+        items[#items + 1] = redis.call("LINDEX", KEYS[1], position)
+        redis.call("LSET", KEYS[1], position, last)
+    else
+        items[#items + 1] = last
+    end
+end
+return items
+"""
 
 
 class RedisCache(CacheInterface):
@@ -23,6 +54,8 @@ class RedisCache(CacheInterface):
             username=url.username,
             password=url.password,
         )
+        self._lpop_hset = self.redis.register_script(_lpop_hset_script)
+        self._lpop_random = self.redis.register_script(_lpop_random_script)
 
     def set(self, key: str, value: Union[str, bytes], ex: Optional[int] = None) -> None:
         self.redis.set(key, value, ex=ex)
@@ -92,6 +125,20 @@ class RedisCache(CacheInterface):
     def lrem(self, name: str, count: int, value: str) -> int:
         return self.redis.lrem(name, count, value)
 
+    def sadd(self, name: str, *values: str) -> int:
+        return self.redis.sadd(name, *values)
+
+    def smembers(self, name: str) -> Set[bytes]:
+        return self.redis.smembers(name)
+
+    def lpop_hset(
+        self, list_name: str, hash_name: str, count: int, value: str
+    ) -> list[bytes]:
+        return self._lpop_hset(keys=[list_name, hash_name], args=[count, value])
+
+    def lpop_random(self, name: str, keep: int, fractions: list[float]) -> list[bytes]:
+        return self._lpop_random(keys=[name], args=[keep, *fractions])
+
     @contextlib.contextmanager
     def lock(self, key: str, timeout: Optional[int] = None) -> Iterator[None]:
         with self.redis.lock(key, timeout=timeout):
@@ -6,9 +6,9 @@ import sys
 from typing import Optional, Any
 
 if sys.version_info >= (3, 12):
-    from typing import TypedDict
+    from typing import TypedDict, NotRequired
 else:
-    from typing_extensions import TypedDict
+    from typing_extensions import TypedDict, NotRequired
 
 from datetime import datetime
 from sqlmodel import (
@@ -212,6 +212,12 @@ class IterationPreprocessor(TypedDict):
     params: dict[str, Any]
 
 
+class IterationMixtureComponent(TypedDict):
+    dataset_id: str
+    weight: float
+    shardsets: NotRequired[Optional[list[str]]]
+
+
 class IterationBase(SQLModel):
     id: str = Field(primary_key=True, default_factory=generate_uid("it"))
     dataset_id: str = Field(foreign_key="dataset.id")
@@ -223,12 +229,20 @@ class IterationBase(SQLModel):
     preprocessors: Optional[list[IterationPreprocessor]] = Field(
         default=None, sa_type=JSON
     )
+    mixture: Optional[list[IterationMixtureComponent]] = Field(
+        default=None, sa_type=JSON
+    )
 
     shuffle: bool = Field(default=False)
     shuffle_seed: Optional[int] = Field(default=None)
     shuffle_block_size: Optional[int] = Field(default=None)
+    shuffle_mode: Optional[str] = Field(default=None)
+    shuffle_buffer_size: Optional[int] = Field(default=None)
 
     batch_size: int = Field(default=0)
+    batch_token_budget: Optional[int] = Field(default=None)
+    batch_length_column: Optional[str] = Field(default=None)
+    batch_window_size: Optional[int] = Field(default=None)
 
     replication_pg: Optional[list[list[int]]] = Field(default=None, sa_type=JSON)
 
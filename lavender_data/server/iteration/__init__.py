@@ -21,11 +21,26 @@ from .iteration_state import (
     IterationStateException,
     IterationStateOps,
     IterationState,
+    MixtureIterationState,
+    open_iteration_state,
     IterationStateClusterOps,
 )
+from .executor import (
+    PreprocessorExecutor,
+    PreprocessorExecutorStats,
+    setup_preprocessor_executor,
+    shutdown_preprocessor_executor,
+    get_preprocessor_executor,
+)
+from .scheduler import (
+    PrefetchScheduler,
+    PrefetchSchedulerStats,
+    PrefetchOwnerStats,
+)
 from .prefetcher import (
     IterationPrefetcherPool,
     IterationPrefetcher,
+    PrefetcherRankStats,
     NotFetchedYet,
 )
 
@@ -41,6 +56,8 @@ __all__ = [
     "IterationStateException",
     "IterationStateOps",
     "IterationState",
+    "MixtureIterationState",
+    "open_iteration_state",
     "IterationStateClusterOps",
     "get_iteration_state",
     "CurrentIterationState",
@@ -48,7 +65,17 @@ __all__ = [
     "CurrentIterationPrefetcherPool",
     "setup_iteration_prefetcher_pool",
     "shutdown_iteration_prefetcher_pool",
+    "PrefetcherRankStats",
+    "PrefetchScheduler",
+    "PrefetchSchedulerStats",
+    "PrefetchOwnerStats",
     "NotFetchedYet",
+    "PreprocessorExecutor",
+    "PreprocessorExecutorStats",
+    "setup_preprocessor_executor",
+    "shutdown_preprocessor_executor",
+    "get_preprocessor_executor",
+    "CurrentPreprocessorExecutor",
 ]
 
 
@@ -61,7 +88,7 @@ def get_iteration_state(
         state = IterationStateClusterOps(iteration_id, cluster)
 
     if state is None:
-        state = IterationState(iteration_id, cache)
+        state = open_iteration_state(iteration_id, cache)
 
     if not state.exists():
         raise HTTPException(status_code=404, detail="Iteration not initialized")
@@ -75,9 +102,9 @@ CurrentIterationState = Annotated[IterationStateOps, Depends(get_iteration_state
 iteration_prefetcher_pool = None
 
 
-def setup_iteration_prefetcher_pool():
+def setup_iteration_prefetcher_pool(workers: int = 0):
     global iteration_prefetcher_pool
-    iteration_prefetcher_pool = IterationPrefetcherPool()
+    iteration_prefetcher_pool = IterationPrefetcherPool(workers)
 
 
 def shutdown_iteration_prefetcher_pool():
@@ -110,3 +137,8 @@ def get_iteration_prefetcher(iteration_id: str) -> IterationPrefetcher:
 CurrentIterationPrefetcher = Annotated[
     IterationPrefetcher, Depends(get_iteration_prefetcher)
 ]
+
+
+CurrentPreprocessorExecutor = Annotated[
+    PreprocessorExecutor, Depends(get_preprocessor_executor)
+]
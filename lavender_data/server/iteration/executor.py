@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait, FIRST_EXCEPTION
+from typing import Callable, Hashable, Optional
+
+from pydantic import BaseModel
+
+from lavender_data.server.registries import Preprocessor
+
+__all__ = [
+    "PreprocessorExecutor",
+    "PreprocessorExecutorStats",
+    "PreprocessorLatencyStats",
+    "setup_preprocessor_executor",
+    "shutdown_preprocessor_executor",
+    "get_preprocessor_executor",
+]
+
+
+class PreprocessorLatencyStats(BaseModel):
+    count: int
+    failed: int
+    total_seconds: float
+    max_seconds: float
+
+
+class PreprocessorExecutorStats(BaseModel):
+    workers: int
+    queued: int
+    running: int
+    preprocessors: dict[str, PreprocessorLatencyStats]
+
+
+class PreprocessorExecutor:
+    """Runs the preprocessors of every iteration on a fixed set of threads.
+
+    Tasks are queued by their owner (an iteration and rank) and the threads
+    take the next task of each owner in turn, so that an owner with many
+    batches in flight does not hold up the others. The threads are started
+    on the first task and kept for the lifetime of the server.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers if workers > 0 else min(32, (os.cpu_count() or 1) + 4)
+
+        self._queues: OrderedDict[Hashable, deque] = OrderedDict()
+        self._condition = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._shutdown = False
+
+        self._queued = 0
+        self._running = 0
+        self._latencies: dict[str, PreprocessorLatencyStats] = {}
+
+    def _start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"preprocessor-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self) -> Optional[tuple]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._shutdown or self._queued > 0)
+            if self._shutdown:
+                return None
+            owner, queue = next(iter(self._queues.items()))
+            task = queue.popleft()
+            if len(queue) == 0:
+                del self._queues[owner]
+            else:
+                # the other owners go first
+                self._queues.move_to_end(owner)
+            self._queued -= 1
+            self._running += 1
+            return task
+
+    def _record(self, name: str, seconds: float, failed: bool) -> None:
+        with self._condition:
+            self._running -= 1
+            latency = self._latencies.get(name)
+            if latency is None:
+                latency = PreprocessorLatencyStats(
+                    count=0, failed=0, total_seconds=0.0, max_seconds=0.0
+                )
+                self._latencies[name] = latency
+            latency.count += 1
+            latency.failed += int(failed)
+            latency.total_seconds += seconds
+            latency.max_seconds = max(latency.max_seconds, seconds)
+
+    def _work(self) -> None:
+        while True:
+            task = self._next_task()
+            if task is None:
+                break
+
+            future, name, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                with self._condition:
+                    self._running -= 1
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                self._record(name, time.perf_counter() - start, True)
+                future.set_exception(e)
+            else:
+                self._record(name, time.perf_counter() - start, False)
+                future.set_result(result)
+
+    def submit(
+        self, owner: Hashable, name: str, fn: Callable, *args, **kwargs
+    ) -> Future:
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Preprocessor executor is shut down")
+            if len(self._threads) == 0:
+                self._start()
+            self._queues.setdefault(owner, deque()).append(
+                (future, name, fn, args, kwargs)
+            )
+            self._queued += 1
+            self._condition.notify()
+        return future
+
+    def process(
+        self,
+        owner: Hashable,
+        preprocessor_group: list[tuple[Preprocessor, dict]],
+        batch: dict,
+    ) -> dict:
+        """Runs the preprocessors of a group on the batch at the same time and
+        updates the batch with their results."""
+        futures = [
+            self.submit(owner, preprocessor.name, preprocessor.process, batch, **params)
+            for preprocessor, params in preprocessor_group
+        ]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                for other in not_done:
+                    other.cancel()
+                raise future.exception()
+        for future in futures:
+            batch.update(future.result())
+        return batch
+
+    def stats(self) -> PreprocessorExecutorStats:
+        with self._condition:
+            return PreprocessorExecutorStats(
+                workers=self.workers,
+                queued=self._queued,
+                running=self._running,
+                preprocessors={
+                    name: latency.model_copy()
+                    for name, latency in self._latencies.items()
+                },
+            )
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._shutdown = True
+            for queue in self._queues.values():
+                for future, *_ in queue:
+                    future.cancel()
+            self._queues.clear()
+            self._queued = 0
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
+
+
+preprocessor_executor: Optional[PreprocessorExecutor] = None
+
+
+def setup_preprocessor_executor(workers: int = 0):
+    global preprocessor_executor
+    preprocessor_executor = PreprocessorExecutor(workers)
+
+
+def shutdown_preprocessor_executor():
+    if preprocessor_executor is not None:
+        preprocessor_executor.shutdown()
+
+
+def get_preprocessor_executor() -> PreprocessorExecutor:
+    if preprocessor_executor is None:
+        raise RuntimeError("Preprocessor executor not initialized")
+    return preprocessor_executor
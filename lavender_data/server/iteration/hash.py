@@ -26,6 +26,27 @@ def get_iteration_hash(iteration: Iteration, dataset_id: Optional[str] = None) -
             "shuffle_seed": iteration.shuffle_seed,
             "shuffle_block_size": iteration.shuffle_block_size,
             "replication_pg": iteration.replication_pg,
+            # only when set, so that the hashes of existing iterations are kept
+            **(
+                {"shuffle_mode": iteration.shuffle_mode}
+                if iteration.shuffle_mode is not None
+                else {}
+            ),
+            **(
+                {"shuffle_buffer_size": iteration.shuffle_buffer_size}
+                if iteration.shuffle_buffer_size is not None
+                else {}
+            ),
+            **({"mixture": iteration.mixture} if iteration.mixture is not None else {}),
+            **(
+                {
+                    "batch_token_budget": iteration.batch_token_budget,
+                    "batch_length_column": iteration.batch_length_column,
+                    "batch_window_size": iteration.batch_window_size,
+                }
+                if iteration.batch_token_budget is not None
+                else {}
+            ),
         }
     )
 
@@ -1,15 +1,17 @@
 from .abc import Progress, InProgressIndex, IterationStateException, IterationStateOps
 from .default import IterationState
+from .mixture import MixtureIterationState, open_iteration_state
 from .cluster import (
     IterationStateClusterOps,
 )
 
-
 __all__ = [
     "Progress",
     "InProgressIndex",
     "IterationStateException",
     "IterationStateOps",
     "IterationState",
+    "MixtureIterationState",
+    "open_iteration_state",
     "IterationStateClusterOps",
 ]
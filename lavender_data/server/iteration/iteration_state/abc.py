@@ -6,6 +6,7 @@ from pydantic import BaseModel
 
 from lavender_data.server.reader import (
     GlobalSampleIndex,
+    ShardInfo,
 )
 from lavender_data.server.iteration import ProcessNextSamplesParams
 
@@ -28,6 +29,9 @@ class Progress(BaseModel):
     completed: int
     filtered: int
     failed: int
+    # the tokens of the batches packed by a token budget, and with padding
+    batched_tokens: int = 0
+    padded_tokens: int = 0
 
 
 class IterationStateOps(ABC):
@@ -49,11 +53,17 @@ class IterationStateOps(ABC):
     @abstractmethod
     def next_item(self, rank: int) -> GlobalSampleIndex: ...
 
+    @abstractmethod
+    def next_items(self, rank: int, count: int) -> list[GlobalSampleIndex]: ...
+
     @abstractmethod
     def get_ranks(self) -> list[int]: ...
 
     @abstractmethod
     def get_progress(self) -> Progress: ...
 
+    @abstractmethod
+    def get_upcoming_shards(self, count: int) -> list[ShardInfo]: ...
+
     @abstractmethod
     def get_next_samples(self, rank: int) -> tuple[str, ProcessNextSamplesParams]: ...
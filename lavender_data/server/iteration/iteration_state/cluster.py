@@ -1,6 +1,7 @@
 from lavender_data.server.distributed import CurrentCluster
 from lavender_data.server.reader import (
     GlobalSampleIndex,
+    ShardInfo,
 )
 
 from lavender_data.server.iteration import ProcessNextSamplesParams
@@ -41,12 +42,24 @@ class IterationStateClusterOps(IterationStateOps):
     def next_item(self, rank: int) -> GlobalSampleIndex:
         return GlobalSampleIndex(**self._head("next_item", {"rank": rank}))
 
+    def next_items(self, rank: int, count: int) -> list[GlobalSampleIndex]:
+        return [
+            GlobalSampleIndex(**item)
+            for item in self._head("next_items", {"rank": rank, "count": count})
+        ]
+
     def get_ranks(self) -> list[int]:
         return self._head("get_ranks", {})
 
     def get_progress(self) -> Progress:
         return Progress(**self._head("get_progress", {}))
 
+    def get_upcoming_shards(self, count: int) -> list[ShardInfo]:
+        return [
+            ShardInfo(**shard)
+            for shard in self._head("get_upcoming_shards", {"count": count})
+        ]
+
     def get_next_samples(self, rank: int) -> tuple[str, ProcessNextSamplesParams]:
         cache_key, params = self._head("get_next_samples", {"rank": rank})
         return cache_key, ProcessNextSamplesParams(**params)
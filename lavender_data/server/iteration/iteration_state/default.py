@@ -1,5 +1,6 @@
 import contextlib
 import time
+import uuid
 import numpy as np
 import ujson as json
 from typing import Optional
@@ -20,7 +21,6 @@ from lavender_data.server.db.models import (
 from lavender_data.server.reader import (
     get_reader_instance,
     ShardInfo,
-    MainShardInfo,
     GlobalSampleIndex,
     InnerJoinSampleInsufficient,
 )
@@ -28,12 +28,17 @@ from lavender_data.server.registries import (
     FilterRegistry,
     CategorizerRegistry,
 )
-from lavender_data.server.shardset import get_main_shardset, span
+from lavender_data.server.registries.abc import to_columns
+from lavender_data.server.settings import get_settings
+from lavender_data.server.shardset import get_main_shardset
 from lavender_data.server.iteration.process import ProcessNextSamplesParams
 from lavender_data.server.iteration.hash import _hash, get_iteration_hash
-from lavender_data.serialize import serialize_sample, deserialize_sample
+from lavender_data.server.iteration.prune import get_pruned_shards
 
 from .abc import IterationStateOps, Progress, InProgressIndex, IterationStateException
+from .layout import ShardLayout, get_shard_layout
+from .permutation import permuted_indices
+from .packing import sample_length, pack_by_length
 
 
 @contextlib.contextmanager
@@ -80,13 +85,22 @@ class IterationState(IterationStateOps):
             pipe.delete(self._key("pushed"))
             pipe.delete(self._key("filtered"))
             pipe.delete(self._key("failed"))
+            pipe.delete(self._key("batched_tokens"))
+            pipe.delete(self._key("padded_tokens"))
             pipe.incr(self._key("completed"), 0)
             pipe.incr(self._key("pushed"), 0)
             pipe.incr(self._key("filtered"), 0)
             pipe.incr(self._key("failed"), 0)
+            pipe.incr(self._key("batched_tokens"), 0)
+            pipe.incr(self._key("padded_tokens"), 0)
             if iteration.shuffle:
                 pipe.set(self._key("shuffle_seed"), iteration.shuffle_seed)
                 pipe.set(self._key("shuffle_block_size"), iteration.shuffle_block_size)
+                pipe.set(self._key("shuffle_mode"), iteration.shuffle_mode or "block")
+                if iteration.shuffle_buffer_size is not None:
+                    pipe.set(
+                        self._key("shuffle_buffer_size"), iteration.shuffle_buffer_size
+                    )
 
             if iteration.replication_pg is not None:
                 pipe.set(
@@ -102,6 +116,18 @@ class IterationState(IterationStateOps):
             if iteration.collater is not None:
                 pipe.set(self._key("collater"), json.dumps(iteration.collater))
 
+            if iteration.batch_token_budget is not None:
+                pipe.set(
+                    self._key("token_batching"),
+                    json.dumps(
+                        {
+                            "budget": iteration.batch_token_budget,
+                            "length_column": iteration.batch_length_column,
+                            "window_size": iteration.batch_window_size,
+                        }
+                    ),
+                )
+
             if iteration.preprocessors is not None:
                 pipe.set(
                     self._key("preprocessors"), json.dumps(iteration.preprocessors)
@@ -147,6 +173,12 @@ class IterationState(IterationStateOps):
             return None
         return json.loads(v)
 
+    def _token_batching(self) -> Optional[dict]:
+        v = self.cache.get(self._key("token_batching"))
+        if v is None:
+            return None
+        return json.loads(v)
+
     def _set_shardsets_info(self, shardsets: list[Shardset]) -> None:
         with self.cache.pipeline() as pipe:
             pipe.rpush(
@@ -180,13 +212,24 @@ class IterationState(IterationStateOps):
                 pipe.execute()
 
     def _set_main_shardset_info(
-        self, shardset: Shardset, shuffle: bool, shuffle_seed: int
+        self,
+        shardset: Shardset,
+        shuffle: bool,
+        shuffle_seed: int,
+        pruned: Optional[set[int]] = None,
     ) -> None:
         shards = sorted(shardset.shards, key=lambda s: s.index)
+        pruned = pruned or set()
 
         last_end = 0
+        pruned_samples = 0
         shard_sample_ranges = []
         for shard in shards:
+            if shard.index in pruned:
+                # counted as filtered, as if each of the samples was read
+                pruned_samples += shard.samples
+                last_end += shard.samples
+                continue
             shard_sample_ranges.append(
                 {
                     "shard": shard.index,
@@ -207,32 +250,76 @@ class IterationState(IterationStateOps):
                 shard_samples.extend(
                     [shard_sample_range["start"], shard_sample_range["end"]]
                 )
-            pipe.rpush(self._key("shard_samples"), *shard_samples)
+            if len(shard_samples) > 0:
+                pipe.rpush(self._key("shard_samples"), *shard_samples)
+            pipe.incr(self._key("filtered"), pruned_samples)
             pipe.execute()
 
-    def _get_shard_info(self, shardset_id: str, shard_index: int) -> ShardInfo:
-        with self.cache.pipeline() as pipe:
-            pipe.get(self._key(f"shardsets:{shardset_id}:columns"))
-            pipe.lindex(self._key(f"shardsets:{shardset_id}:samples"), shard_index)
-            pipe.lindex(self._key(f"shardsets:{shardset_id}:location"), shard_index)
-            pipe.lindex(self._key(f"shardsets:{shardset_id}:format"), shard_index)
-            pipe.lindex(self._key(f"shardsets:{shardset_id}:filesize"), shard_index)
-            [columns, samples, location, format, filesize] = pipe.execute()
-        if samples is None:
-            raise IterationStateException(
-                f"Shard {shard_index} of shardset {shardset_id} not found"
+    def _shuffle_mode(self) -> Optional[str]:
+        v = self.cache.get(self._key("shuffle_mode"))
+        if v is None:
+            return None
+        return v.decode("utf-8")
+
+    def _pop_shard_ranges(self, count: int) -> list[tuple[int, int]]:
+        ranges = []
+        for _ in range(count):
+            retrieved = self.cache.lpop(self._key("shard_samples"), 2)
+            if retrieved is None:
+                continue
+            ranges.append((int(retrieved[0]), int(retrieved[1])))
+        return ranges
+
+    def _replica_ranks(self, rank: int) -> list[int]:
+        """The ranks that are given the same indices as ``rank``."""
+        replication_pg = self.cache.get(self._key("replication_pg"))
+        if replication_pg is None:
+            return [rank]
+
+        for pg in json.loads(replication_pg):
+            if rank in pg:
+                return pg
+        raise IterationStateException(f"Replication pg not found for rank {rank}")
+
+    def _draw_from_buffer(self, shuffle_seed: int, block_size: int) -> list[int]:
+        """Draws indices at random from a shuffle buffer shared by the ranks.
+
+        The buffer is refilled with ``block_size`` shards at a time until it
+        holds more than ``shuffle_buffer_size`` indices, and as many indices
+        as were added are drawn from it, so that it stays at the same size
+        while samples of a few open shards are mixed with all of the ones
+        before them. Each draw is seeded with its own step. The buffer is
+        drained once there are no more shards.
+        """
+        buffer_key = self._key("shuffle_buffer")
+        buffer_size = int(self.cache.get(self._key("shuffle_buffer_size")))
+
+        length = self.cache.llen(buffer_key)
+        exhausted = False
+        while length <= buffer_size:
+            ranges = self._pop_shard_ranges(block_size)
+            if len(ranges) == 0:
+                exhausted = True
+                break
+            length = self.cache.rpush(
+                buffer_key,
+                *[i for start, end in ranges for i in range(start, end + 1)],
             )
-        return ShardInfo(
-            shardset_id=shardset_id,
-            columns=json.loads(columns),
-            index=shard_index,
-            samples=int(samples),
-            location=location.decode("utf-8"),
-            format=format.decode("utf-8"),
-            filesize=int(filesize),
+
+        if length == 0:
+            return []
+
+        step = int(self.cache.incr(self._key("shuffle_step"), 1))
+        rng = np.random.default_rng([shuffle_seed, step])
+        keep = 0 if exhausted else buffer_size
+        # the positions are picked as the items are popped, so that ranks
+        # drawing at the same time never pop the same item
+        drawn = self.cache.lpop_random(
+            buffer_key, keep, rng.random(length - keep).tolist()
         )
+        return [int(i) for i in drawn]
 
-    def _push_indices(self, rank: int) -> None:
+    def _push_indices(self, rank: int) -> int:
         retrieved_shuffle_seed = self.cache.get(self._key("shuffle_seed"))
         shuffle = retrieved_shuffle_seed is not None
         shuffle_seed = int(retrieved_shuffle_seed) if shuffle else None
@@ -240,96 +327,160 @@ class IterationState(IterationStateOps):
             int(self.cache.get(self._key("shuffle_block_size"))) if shuffle else 1
         )
 
-        indices = []
-        for _ in range(block_size):
-            retrieved = self.cache.lpop(self._key("shard_samples"), 2)
-            if retrieved is None:
-                continue
-            start = int(retrieved[0])
-            end = int(retrieved[1])
-            indices.extend(range(start, end + 1))
-
-        if len(indices) == 0:
-            return
+        if shuffle and self._shuffle_mode() == "buffer":
+            indices = self._draw_from_buffer(shuffle_seed, block_size)
+        else:
+            indices = []
+            for start, end in self._pop_shard_ranges(block_size):
+                indices.extend(range(start, end + 1))
 
-        # TODO shuffle leftovers with more randomness
-        if shuffle:
-            with np_seed(shuffle_seed):
-                np.random.shuffle(indices)
+            if shuffle and len(indices) > 0:
+                # a new permutation for each block, still reproducible by the seed
+                step = int(self.cache.incr(self._key("shuffle_step"), 1))
+                np.random.default_rng([shuffle_seed, step]).shuffle(indices)
 
-        replication_pg = self.cache.get(self._key("replication_pg"))
-        if replication_pg is not None:
-            replication_pg = json.loads(replication_pg)
+        if len(indices) == 0:
+            return 0
 
+        ranks = self._replica_ranks(rank)
         with self.cache.pipeline() as pipe:
-            if replication_pg is not None:
-                rank_pg = None
-                for pg in replication_pg:
-                    if rank in pg:
-                        rank_pg = pg
-                        break
-                if rank_pg is None:
-                    raise IterationStateException(
-                        f"Replication pg not found for rank {rank}"
-                    )
-                for rank in rank_pg:
-                    pipe.rpush(self._key(f"indices:{rank}"), *indices)
-            else:
+            for rank in ranks:
                 pipe.rpush(self._key(f"indices:{rank}"), *indices)
-
+            pipe.sadd(self._key("ranks"), *ranks)
             pipe.incr(self._key("pushed"), len(indices))
             pipe.execute()
 
-    def _pop_index(self, rank: int) -> int:
-        retrieved = self.cache.lpop(self._key(f"indices:{rank}"), 1)
-        if retrieved is None:
-            self._push_indices(rank)
-            retrieved = self.cache.lpop(self._key(f"indices:{rank}"), 1)
+        return len(indices)
 
-        if retrieved is None:
-            raise IterationStateException("No more indices to pop")
+    def _push_block(self, rank: int) -> int:
+        """Pushes the next ``shuffle_block_size`` shards to the rank as a
+        single block, to be permuted on demand by ``_pop_permuted``. Only the
+        sample ranges of the block are stored, not its indices."""
+        block_size = int(self.cache.get(self._key("shuffle_block_size")))
+        ranges = self._pop_shard_ranges(block_size)
+        size = sum(end - start + 1 for start, end in ranges)
+        if size == 0:
+            return 0
 
-        index = int(retrieved[0])
-        now = time.time()
-        self.cache.hset(self._key("inprogress"), index, f"{rank}:{now}")
+        block = json.dumps(
+            {
+                "seq": int(self.cache.incr(self._key("block_seq"), 1)),
+                "ranges": ranges,
+                "size": size,
+            }
+        )
+        ranks = self._replica_ranks(rank)
+        with self.cache.pipeline() as pipe:
+            for rank in ranks:
+                pipe.rpush(self._key(f"blocks:{rank}"), block)
+            pipe.sadd(self._key("ranks"), *ranks)
+            pipe.incr(self._key("pushed"), size)
+            pipe.execute()
 
-        return index
+        return size
+
+    def _pop_permuted(self, rank: int, count: int, inprogress: str) -> list[int]:
+        """Claims up to ``count`` positions of the blocks of the rank by
+        advancing its cursor on the head block, and maps them to indices
+        with the permutation of the block."""
+        blocks_key = self._key(f"blocks:{rank}")
+        shuffle_seed = int(self.cache.get(self._key("shuffle_seed")))
+
+        indices: list[int] = []
+        while len(indices) < count:
+            head = self.cache.lindex(blocks_key, 0)
+            if head is None:
+                with self.cache.lock(f"next_item:{self.iteration_id}"):
+                    if (
+                        self.cache.lindex(blocks_key, 0) is None
+                        and self._push_block(rank) == 0
+                    ):
+                        break
+                continue
 
-    def _get_shards_from_index(
-        self, index: int
-    ) -> tuple[MainShardInfo, list[ShardInfo]]:
-        main_shardset_id = self.cache.get(self._key("main_shardset")).decode("utf-8")
-        shard_samples = [
-            int(s)
-            for s in self.cache.lrange(
-                self._key(f"shardsets:{main_shardset_id}:samples"), 0, -1
+            block = json.loads(head)
+            cursor_key = self._key(f"cursor:{rank}:{block['seq']}")
+            need = count - len(indices)
+            end = int(self.cache.incr(cursor_key, need))
+            start = end - need
+            if start < block["size"]:
+                indices.extend(
+                    permuted_indices(
+                        block["ranges"],
+                        [shuffle_seed, block["seq"]],
+                        start,
+                        min(end, block["size"]),
+                    )
+                )
+            if end >= block["size"]:
+                with self.cache.lock(f"next_item:{self.iteration_id}"):
+                    # the cursor is kept, a thread that still reads this
+                    # block as the head must find it exhausted
+                    if self.cache.lindex(blocks_key, 0) == head:
+                        self.cache.lpop(blocks_key)
+
+        if len(indices) > 0:
+            self.cache.hset(
+                self._key("inprogress"),
+                mapping={index: inprogress for index in indices},
             )
-        ]
-        shard_index, sample_index = span(index, shard_samples)
-        main_shard = MainShardInfo(
-            sample_index=sample_index,
-            **self._get_shard_info(main_shardset_id, shard_index).model_dump(),
+        return indices
+
+    def _pop_indices(self, rank: int, count: int) -> list[int]:
+        """Claims up to ``count`` indices of the rank and marks them in
+        progress in a single atomic call. The lock is only taken to push more
+        indices when the rank runs out of them."""
+        indices_key = self._key(f"indices:{rank}")
+        inprogress_key = self._key("inprogress")
+        inprogress = f"{rank}:{time.time()}"
+
+        retrieved = list(
+            self.cache.lpop_hset(indices_key, inprogress_key, count, inprogress)
         )
+        if len(retrieved) < count and self._shuffle_mode() == "permutation":
+            # the queue only holds indices that were pushed back
+            retrieved.extend(
+                self._pop_permuted(rank, count - len(retrieved), inprogress)
+            )
+        elif len(retrieved) < count:
+            with self.cache.lock(f"next_item:{self.iteration_id}"):
+                while len(retrieved) < count:
+                    retrieved.extend(
+                        self.cache.lpop_hset(
+                            indices_key,
+                            inprogress_key,
+                            count - len(retrieved),
+                            inprogress,
+                        )
+                    )
+                    if len(retrieved) < count and self._push_indices(rank) == 0:
+                        break
 
-        shardsets = [
-            s.decode("utf-8") for s in self.cache.lrange(self._key("shardsets"), 0, -1)
-        ]
-        shards: list[ShardInfo] = []
-        for shardset_id in shardsets:
-            if shardset_id == main_shardset_id:
-                continue
-            try:
-                shards.append(self._get_shard_info(shardset_id, shard_index))
-            except IterationStateException:
-                pass
-            except Exception as e:
-                # TODO handle error
-                pass
+        if len(retrieved) == 0:
+            raise IterationStateException("No more indices to pop")
+
+        return [int(index) for index in retrieved]
 
-        if main_shard is None:
-            raise IterationStateException("Main shard not found")
+    def _pop_index(self, rank: int) -> int:
+        return self._pop_indices(rank, 1)[0]
 
-        return main_shard, shards
+    def _pushback_indices(self, rank: int, indices: list[int]) -> None:
+        """Returns indices that were popped but not used to the head of the queue."""
+        if len(indices) == 0:
+            return
+        with self.cache.pipeline() as pipe:
+            pipe.lpush(self._key(f"indices:{rank}"), *reversed(indices))
+            pipe.hdel(self._key("inprogress"), *indices)
+            pipe.execute()
+
+    def _layout(self, version: Optional[bytes] = None) -> ShardLayout:
+        if version is None:
+            version = self.cache.get(self._key("layout_version"))
+        return get_shard_layout(
+            self.iteration_id,
+            (version or b"").decode("utf-8"),
+            lambda: ShardLayout.load(self.cache, self._key),
+        )
 
     def _get_inprogress(self) -> list[InProgressIndex]:
         return [
@@ -341,6 +492,16 @@ class IterationState(IterationStateOps):
             for k, v in self.cache.hgetall(self._key("inprogress")).items()
         ]
 
+    def _get_blocks_inqueue(self, rank: int) -> int:
+        blocks = [
+            json.loads(b) for b in self.cache.lrange(self._key(f"blocks:{rank}"), 0, -1)
+        ]
+        if len(blocks) == 0:
+            return 0
+        cursor = self.cache.get(self._key(f"cursor:{rank}:{blocks[0]['seq']}"))
+        consumed = min(int(cursor or 0), blocks[0]["size"])
+        return sum(b["size"] for b in blocks) - consumed
+
     def _get_current(self) -> int:
         pushed = self.cache.incr(self._key("pushed"), 0)
         inqueue = 0
@@ -350,16 +511,17 @@ class IterationState(IterationStateOps):
             replication_pg = json.loads(replication_pg)
 
         if replication_pg is not None:
-            with self.cache.pipeline() as pipe:
-                for pg in replication_pg:
-                    pipe.llen(self._key(f"indices:{pg[0]}"))
-                inqueue = sum(pipe.execute())
+            ranks = [pg[0] for pg in replication_pg]
         else:
             ranks = self.get_ranks()
-            with self.cache.pipeline() as pipe:
-                for rank in ranks:
-                    pipe.llen(self._key(f"indices:{rank}"))
-                inqueue = sum(pipe.execute())
+
+        with self.cache.pipeline() as pipe:
+            for rank in ranks:
+                pipe.llen(self._key(f"indices:{rank}"))
+            inqueue = sum(pipe.execute())
+
+        if self._shuffle_mode() == "permutation":
+            inqueue += sum(self._get_blocks_inqueue(rank) for rank in ranks)
 
         return pushed - inqueue
 
@@ -394,8 +556,13 @@ class IterationState(IterationStateOps):
             self._set_iteration_info(iteration)
             self._set_shardsets_info(shardsets)
             self._set_main_shardset_info(
-                main_shardset, iteration.shuffle, iteration.shuffle_seed
+                main_shardset,
+                iteration.shuffle,
+                iteration.shuffle_seed,
+                get_pruned_shards(iteration.filters or [], shardsets),
             )
+            # set last, the layout cached by each process is loaded again
+            self.cache.set(self._key("layout_version"), uuid.uuid4().hex)
 
     def pushback_inprogress(self) -> None:
         for inprogress in self._get_inprogress():
@@ -422,30 +589,36 @@ class IterationState(IterationStateOps):
         self.cache.incr(self._key("failed"), 1)
 
     def next_item(self, rank: int) -> GlobalSampleIndex:
+        return self.next_items(rank, 1)[0]
+
+    def next_items(self, rank: int, count: int) -> list[GlobalSampleIndex]:
         with self.cache.pipeline() as pipe:
             pipe.get(self._key("uid_column_name"))
             pipe.get(self._key("uid_column_type"))
-            [uid_column_name, uid_column_type] = pipe.execute()
+            pipe.get(self._key("layout_version"))
+            [uid_column_name, uid_column_type, layout_version] = pipe.execute()
         uid_column_name = uid_column_name.decode("utf-8")
         uid_column_type = uid_column_type.decode("utf-8")
-
-        with self.cache.lock(f"next_item:{self.iteration_id}"):
-            index = self._pop_index(rank)
-
-        main_shard, feature_shards = self._get_shards_from_index(index)
-        return GlobalSampleIndex(
-            index=index,
-            uid_column_name=uid_column_name,
-            uid_column_type=uid_column_type,
-            main_shard=main_shard,
-            feature_shards=feature_shards,
-        )
+        layout = self._layout(layout_version)
+
+        items = []
+        for index in self._pop_indices(rank, count):
+            main_shard, feature_shards = layout.get_shards_from_index(index)
+            items.append(
+                GlobalSampleIndex(
+                    index=index,
+                    uid_column_name=uid_column_name,
+                    uid_column_type=uid_column_type,
+                    main_shard=main_shard,
+                    feature_shards=feature_shards,
+                )
+            )
+        return items
 
     def get_ranks(self) -> list[int]:
-        return [
-            int(k.decode("utf-8").split("indices:", 1)[1])
-            for k in self.cache.keys(self._key("indices:*"))
-        ]
+        """The ranks that indices were pushed to, registered when they are
+        pushed so that the keyspace is never scanned."""
+        return sorted(int(r) for r in self.cache.smembers(self._key("ranks")))
 
     def get_progress(self) -> Progress:
         total = int(self.cache.get(self._key("total")))
@@ -455,7 +628,11 @@ class IterationState(IterationStateOps):
             pipe.incr(self._key("completed"), 0)
             pipe.incr(self._key("filtered"), 0)
             pipe.incr(self._key("failed"), 0)
-            [completed, filtered, failed] = pipe.execute()
+            pipe.incr(self._key("batched_tokens"), 0)
+            pipe.incr(self._key("padded_tokens"), 0)
+            [completed, filtered, failed, batched_tokens, padded_tokens] = (
+                pipe.execute()
+            )
         completed = int(completed)
         filtered = int(filtered)
         failed = int(failed)
@@ -467,83 +644,345 @@ class IterationState(IterationStateOps):
             filtered=filtered,
             failed=failed,
             total=total,
+            batched_tokens=int(batched_tokens),
+            padded_tokens=int(padded_tokens),
+        )
+
+    def get_upcoming_shards(self, count: int) -> list[ShardInfo]:
+        """Main and feature shards of the next ``count`` shards in the
+        iteration order that are not popped yet."""
+        if count <= 0:
+            return []
+
+        shard_samples = self.cache.lrange(self._key("shard_samples"), 0, count * 2 - 1)
+        layout = self._layout()
+        shards: list[ShardInfo] = []
+        for start in shard_samples[::2]:
+            main_shard, feature_shards = layout.get_shards_from_index(int(start))
+            shards.append(ShardInfo(**main_shard.model_dump()))
+            shards.extend(feature_shards)
+        return shards
+
+    def _read_samples(self, items: list[GlobalSampleIndex]) -> list[Optional[dict]]:
+        """Reads the samples of ``items`` in order, pinning each shard once
+        for all of its items. The items that are not in all of the
+        feature shards are marked filtered and read as ``None``. An item that
+        fails to be read is marked failed, and only the items that are not
+        marked yet are left in ``items``."""
+        reader = get_reader_instance()
+        logger = get_logger(__name__)
+
+        positions: dict[int, list[int]] = {}
+        for i, item in enumerate(items):
+            positions.setdefault(item.main_shard.index, []).append(i)
+
+        samples: list[Optional[dict]] = [None] * len(items)
+        filtered: set[int] = set()
+        for shard_positions in positions.values():
+            first = items[shard_positions[0]]
+            # pinned once for all of the items of the shard, so that reading
+            # each item only counts the pins in memory. No lock is needed,
+            # the readers load and download a shard once for all threads.
+            with reader.pinned(first.main_shard, *first.feature_shards):
+                for i in shard_positions:
+                    item = items[i]
+                    try:
+                        samples[i] = reader.get_sample(item, join="inner")
+                    except InnerJoinSampleInsufficient:
+                        self.filtered(item.index)
+                        filtered.add(i)
+                    except Exception as e:
+                        self.failed(item.index)
+                        items[:] = [
+                            other
+                            for j, other in enumerate(items)
+                            if j != i and j not in filtered
+                        ]
+                        msg = f"Failed to read sample {item.index} (sample {item.main_shard.sample_index} of shard {item.main_shard.index}): {e.__class__.__name__}({str(e)})"
+                        logger.exception(msg)
+                        raise HTTPException(status_code=400, detail=msg)
+        return samples
+
+    def _filter_samples(
+        self,
+        filters: list[IterationFilter],
+        items: list[GlobalSampleIndex],
+        samples: list[dict],
+    ) -> tuple[list[GlobalSampleIndex], list[dict]]:
+        """Applies the filters to the samples at once, each filter to the
+        samples the ones before it kept. The rest are marked filtered."""
+        for f in filters:
+            if len(samples) == 0:
+                break
+            mask = FilterRegistry.get(f["name"]).filter_batch(
+                to_columns(samples), **f["params"]
+            )
+            for item, keep in zip(items, mask):
+                if not keep:
+                    self.filtered(item.index)
+            items = [item for item, keep in zip(items, mask) if keep]
+            samples = [sample for sample, keep in zip(samples, mask) if keep]
+        return items, samples
+
+    def _add_to_bucket(
+        self, bucket: str, item: GlobalSampleIndex, batch_size: int
+    ) -> list[GlobalSampleIndex]:
+        """Adds the item to its bucket, and pops a batch of the bucket once it
+        is full. Only the indices are kept, the samples are read again when
+        they are popped."""
+        with self.cache.pipeline() as pipe:
+            pipe.rpush(self._key(f"buckets:{bucket}"), item.model_dump_json())
+            pipe.hset(self._key("bucket-updated"), bucket, time.time())
+            pipe.incr(self._key("bucketed"), 1)
+            [bucket_size, _, _] = pipe.execute()
+
+        if bucket_size < batch_size:
+            return []
+        return self._pop_bucket(bucket, batch_size)
+
+    def _pop_bucket(self, bucket: str, count: int) -> list[GlobalSampleIndex]:
+        popped = self.cache.lpop(self._key(f"buckets:{bucket}"), count) or []
+        if len(popped) > 0:
+            self.cache.decr(self._key("bucketed"), len(popped))
+        return [GlobalSampleIndex(**json.loads(i)) for i in popped]
+
+    def _flush_bucket(
+        self,
+        batch_size: int,
+        budget: int = 0,
+        ttl: int = 0,
+    ) -> list[GlobalSampleIndex]:
+        """Pops a partial batch of the least recently updated bucket if the
+        buckets hold more than ``budget`` samples or if it was not updated for
+        ``ttl`` seconds. 0 disables the budget or the ttl."""
+        updated = {
+            bucket.decode("utf-8"): float(updated_at)
+            for bucket, updated_at in self.cache.hgetall(
+                self._key("bucket-updated")
+            ).items()
+        }
+        if len(updated) == 0:
+            return []
+
+        over_budget = (
+            budget > 0 and int(self.cache.incr(self._key("bucketed"), 0)) > budget
         )
+        for bucket, updated_at in sorted(updated.items(), key=lambda b: b[1]):
+            if not (over_budget or (ttl > 0 and time.time() - updated_at > ttl)):
+                break
+            flushed = self._pop_bucket(bucket, batch_size)
+            if len(flushed) > 0:
+                return flushed
+        return []
+
+    def _read_bucketed(
+        self, rank: int, items: list[GlobalSampleIndex]
+    ) -> tuple[list[GlobalSampleIndex], list[dict]]:
+        """Reads the samples of items popped from a bucket again, through the
+        reader cache. If one fails, the others are pushed back to the rank."""
+        try:
+            read = self._read_samples(items)
+        except HTTPException:
+            self._pushback_indices(rank, [item.index for item in items])
+            raise
+        return (
+            [item for item, sample in zip(items, read) if sample is not None],
+            [sample for sample in read if sample is not None],
+        )
+
+    def _get_token_batch(
+        self,
+        rank: int,
+        batch_size: int,
+        filters: Optional[list[IterationFilter]],
+        token_batching: dict,
+    ) -> tuple[list[GlobalSampleIndex], list[dict]]:
+        """Packs a window of samples sorted by length into batches of at most
+        ``batch_size`` samples and the token budget, and returns the batch
+        that holds the sample waiting the longest. The rest are pushed back
+        to be packed again with the next window, and only their lengths are
+        kept."""
+        logger = get_logger(__name__)
+        lengths_key = self._key("lengths")
+        length_column = token_batching["length_column"]
+
+        items = self.next_items(rank, token_batching["window_size"])
+        pending = items
+        try:
+            with self.cache.pipeline() as pipe:
+                for item in items:
+                    pipe.hget(lengths_key, item.index)
+                cached = pipe.execute()
+            lengths = {
+                item.index: int(length)
+                for item, length in zip(items, cached)
+                if length is not None
+            }
+
+            # samples read for their lengths, kept in case they are packed now
+            read_samples: dict[int, dict] = {}
+            unknown = [item for item in items if item.index not in lengths]
+            if len(unknown) > 0:
+                try:
+                    read = self._read_samples(unknown)
+                except HTTPException:
+                    # only the items that are not marked failed are left
+                    pending = [
+                        item for item in items if item.index in lengths
+                    ] + unknown
+                    raise
+                read_items = [
+                    item for item, sample in zip(unknown, read) if sample is not None
+                ]
+                chunk = [sample for sample in read if sample is not None]
+                if filters is not None:
+                    read_items, chunk = self._filter_samples(filters, read_items, chunk)
+                pending = [item for item in items if item.index in lengths] + read_items
+                for item, sample in zip(read_items, chunk):
+                    if length_column not in sample:
+                        msg = f'Length column "{length_column}" not found in sample {item.index}'
+                        logger.error(msg)
+                        raise HTTPException(status_code=400, detail=msg)
+                    lengths[item.index] = sample_length(sample[length_column])
+                    read_samples[item.index] = sample
+
+            candidates = [item for item in items if item.index in lengths]
+            pending = candidates
+            if len(candidates) == 0:
+                return [], []
+
+            batches = pack_by_length(
+                [lengths[item.index] for item in candidates],
+                token_batching["budget"],
+                batch_size,
+            )
+            # the first candidate was popped first
+            batch = set(next(b for b in batches if 0 in b))
+            emitted = [item for i, item in enumerate(candidates) if i in batch]
+            rest = [item for i, item in enumerate(candidates) if i not in batch]
+
+            with self.cache.pipeline() as pipe:
+                new_lengths = {
+                    item.index: lengths[item.index]
+                    for item in rest
+                    if item.index in read_samples
+                }
+                if len(new_lengths) > 0:
+                    pipe.hset(lengths_key, mapping=new_lengths)
+                packed_from_lengths = [
+                    item for item in emitted if item.index not in read_samples
+                ]
+                if len(packed_from_lengths) > 0:
+                    pipe.hdel(
+                        lengths_key, *[item.index for item in packed_from_lengths]
+                    )
+                pipe.execute()
+
+            # the ones packed from their lengths alone are read again
+            pending = rest + [item for item in emitted if item.index in read_samples]
+            reread_items, reread_samples = self._read_bucketed(
+                rank, packed_from_lengths
+            )
+            pending = rest
+        finally:
+            self._pushback_indices(rank, [item.index for item in pending])
+
+        global_sample_indices = [
+            item for item in emitted if item.index in read_samples
+        ] + reread_items
+        samples = [
+            read_samples[item.index] for item in emitted if item.index in read_samples
+        ] + reread_samples
+
+        batch_lengths = [lengths[item.index] for item in global_sample_indices]
+        if len(batch_lengths) > 0:
+            with self.cache.pipeline() as pipe:
+                pipe.incr(self._key("batched_tokens"), sum(batch_lengths))
+                pipe.incr(
+                    self._key("padded_tokens"), max(batch_lengths) * len(batch_lengths)
+                )
+                pipe.execute()
+        return global_sample_indices, samples
 
     def get_next_samples(
         self,
         rank: int,
     ) -> tuple[str, ProcessNextSamplesParams]:
-        reader = get_reader_instance()
         logger = get_logger(__name__)
+        settings = get_settings()
 
         batch_size = self._batch_size()
         filters = self._filters()
         categorizer = self._categorizer()
+        token_batching = self._token_batching()
 
         current = int(self.cache.incr(self._key(f"batch_count:{rank}"), 1)) - 1
         global_sample_indices = []
         samples = []
-        while len(samples) < max(batch_size, 1):
-            next_item = self.next_item(rank)
-
-            try:
-                with self.cache.lock(
-                    f"get_sample:{self.iteration_id}:{next_item.main_shard.index}"
-                ):
-                    sample = reader.get_sample(next_item, join="inner")
-            except InnerJoinSampleInsufficient:
-                self.filtered(next_item.index)
-                continue
-            except Exception as e:
-                self.failed(next_item.index)
-                msg = f"Failed to read sample {next_item.index} (sample {next_item.main_shard.sample_index} of shard {next_item.main_shard.index}): {e.__class__.__name__}({str(e)})"
-                logger.exception(msg)
-                raise HTTPException(status_code=400, detail=msg)
-
-            should_include = True
-            if filters is not None:
-                for f in filters:
-                    should_include = FilterRegistry.get(f["name"]).filter(
-                        sample, **f["params"]
-                    )
-                    if not should_include:
-                        break
-
-            if not should_include:
-                self.filtered(next_item.index)
-                continue
-
+        # popped at once for the rest of the batch, the unused ones are pushed back
+        pending: list[GlobalSampleIndex] = []
+        try:
             if categorizer is not None:
-                bucket = CategorizerRegistry.get(categorizer["name"]).categorize(
-                    sample, **categorizer["params"]
+                flushed = self._flush_bucket(
+                    max(batch_size, 1),
+                    budget=settings.lavender_data_categorizer_bucket_budget,
+                    ttl=settings.lavender_data_categorizer_bucket_ttl,
                 )
-                if not isinstance(bucket, str):
-                    msg = f"Categorizer {categorizer['name']} returned {type(bucket)} instead of str"
-                    logger.error(msg)
-                    raise HTTPException(status_code=400, detail=msg)
-
-                bucket_key = self._key(f"buckets:{bucket}")
-                bucket_samples_key = self._key(f"bucket-samples:{bucket}")
-                bucket_size = self.cache.llen(bucket_key)
-                if bucket_size >= batch_size:
-                    global_sample_indices.extend(
-                        [
-                            GlobalSampleIndex(**json.loads(i))
-                            for i in self.cache.lpop(bucket_key, batch_size)
-                        ]
-                    )
-                    samples.extend(
-                        [
-                            deserialize_sample(s)
-                            for s in self.cache.lpop(bucket_samples_key, batch_size)
-                        ]
+                if len(flushed) > 0:
+                    global_sample_indices, samples = self._read_bucketed(rank, flushed)
+
+            if token_batching is not None:
+                while len(samples) == 0:
+                    global_sample_indices, samples = self._get_token_batch(
+                        rank, max(batch_size, 1), filters, token_batching
                     )
-                else:
-                    self.cache.rpush(bucket_key, next_item.model_dump_json())
-                    self.cache.rpush(bucket_samples_key, serialize_sample(sample))
-            else:
-                global_sample_indices.append(next_item)
-                samples.append(sample)
+
+            while (
+                token_batching is None
+                and len(samples) < max(batch_size, 1)
+                and not (categorizer is not None and len(global_sample_indices) > 0)
+            ):
+                pending = self.next_items(rank, max(batch_size, 1) - len(samples))
+                read = self._read_samples(pending)
+                items = [
+                    item for item, sample in zip(pending, read) if sample is not None
+                ]
+                chunk = [sample for sample in read if sample is not None]
+                pending = []
+
+                if filters is not None:
+                    items, chunk = self._filter_samples(filters, items, chunk)
+
+                if categorizer is None:
+                    global_sample_indices.extend(items)
+                    samples.extend(chunk)
+                    continue
+
+                buckets = CategorizerRegistry.get(categorizer["name"]).categorize_batch(
+                    to_columns(chunk), **categorizer["params"]
+                )
+                for bucket in buckets:
+                    if not isinstance(bucket, str):
+                        msg = f"Categorizer {categorizer['name']} returned {type(bucket)} instead of str"
+                        logger.error(msg)
+                        pending = items
+                        raise HTTPException(status_code=400, detail=msg)
+
+                for i, (next_item, bucket) in enumerate(zip(items, buckets)):
+                    if len(samples) > 0:
+                        pending = items[i:]
+                        break
+                    emitted = self._add_to_bucket(bucket, next_item, max(batch_size, 1))
+                    if len(emitted) > 0:
+                        pending = items[i + 1 :]
+                        emitted_items, emitted_samples = self._read_bucketed(
+                            rank, emitted
+                        )
+                        pending = []
+                        global_sample_indices.extend(emitted_items)
+                        samples.extend(emitted_samples)
+        finally:
+            self._pushback_indices(rank, [item.index for item in pending])
 
         cache_key = self._cache_key([i.index for i in global_sample_indices])
         return cache_key, ProcessNextSamplesParams(
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+import ujson as json
+
+from lavender_data.server.cache import CacheInterface
+from lavender_data.server.reader import ShardInfo, MainShardInfo
+
+from .abc import IterationStateException
+
+__all__ = ["ShardLayout", "get_shard_layout"]
+
+
+class ShardLayout:
+    """The shards of an iteration, which do not change while it runs.
+
+    The sample counts of the main shardset are kept as prefix sums so that
+    a global index is resolved to its shard with a binary search.
+    """
+
+    def __init__(self, main_shardset_id: str, shardsets: dict[str, list[ShardInfo]]):
+        self.main_shardset_id = main_shardset_id
+        self.shardsets = shardsets
+        self.offsets = np.cumsum(
+            [0] + [shard.samples for shard in shardsets[main_shardset_id]]
+        )
+
+    @classmethod
+    def load(cls, cache: CacheInterface, key: Callable[[str], str]) -> "ShardLayout":
+        with cache.pipeline() as pipe:
+            pipe.get(key("main_shardset"))
+            pipe.lrange(key("shardsets"), 0, -1)
+            [main_shardset_id, shardset_ids] = pipe.execute()
+        if main_shardset_id is None:
+            raise IterationStateException("Main shardset not found")
+        main_shardset_id = main_shardset_id.decode("utf-8")
+        shardset_ids = [s.decode("utf-8") for s in shardset_ids]
+
+        with cache.pipeline() as pipe:
+            for shardset_id in shardset_ids:
+                pipe.get(key(f"shardsets:{shardset_id}:columns"))
+                pipe.lrange(key(f"shardsets:{shardset_id}:samples"), 0, -1)
+                pipe.lrange(key(f"shardsets:{shardset_id}:location"), 0, -1)
+                pipe.lrange(key(f"shardsets:{shardset_id}:format"), 0, -1)
+                pipe.lrange(key(f"shardsets:{shardset_id}:filesize"), 0, -1)
+            results = pipe.execute()
+
+        shardsets: dict[str, list[ShardInfo]] = {}
+        for i, shardset_id in enumerate(shardset_ids):
+            [columns, samples, location, format, filesize] = results[i * 5 : i * 5 + 5]
+            columns = json.loads(columns)
+            shardsets[shardset_id] = [
+                ShardInfo(
+                    shardset_id=shardset_id,
+                    columns=columns,
+                    index=shard_index,
+                    samples=int(samples[shard_index]),
+                    location=location[shard_index].decode("utf-8"),
+                    format=format[shard_index].decode("utf-8"),
+                    filesize=int(filesize[shard_index]),
+                )
+                for shard_index in range(len(samples))
+            ]
+
+        if main_shardset_id not in shardsets:
+            raise IterationStateException("Main shard not found")
+
+        return cls(main_shardset_id, shardsets)
+
+    def get_shard_info(self, shardset_id: str, shard_index: int) -> ShardInfo:
+        shards = self.shardsets.get(shardset_id, [])
+        if shard_index < 0 or shard_index >= len(shards):
+            raise IterationStateException(
+                f"Shard {shard_index} of shardset {shardset_id} not found"
+            )
+        return shards[shard_index]
+
+    def get_shards_from_index(
+        self, index: int
+    ) -> tuple[MainShardInfo, list[ShardInfo]]:
+        # the last shard that starts at or before the index, skipping empty ones
+        shard_index = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        main_shard = MainShardInfo(
+            sample_index=index - int(self.offsets[shard_index]),
+            **self.get_shard_info(self.main_shardset_id, shard_index).model_dump(),
+        )
+
+        feature_shards: list[ShardInfo] = []
+        for shardset_id, shards in self.shardsets.items():
+            if shardset_id == self.main_shardset_id:
+                continue
+            if shard_index < len(shards):
+                feature_shards.append(shards[shard_index])
+
+        return main_shard, feature_shards
+
+
+# the most recently used ones, an iteration that is evicted is loaded again
+_max_layouts = 64
+_layouts: OrderedDict[str, tuple[str, ShardLayout]] = OrderedDict()
+_layouts_lock = threading.Lock()
+
+
+def get_shard_layout(
+    iteration_id: str,
+    version: str,
+    load: Callable[[], ShardLayout],
+) -> ShardLayout:
+    """Returns the layout of the iteration cached in this process. It is
+    loaded again only when the iteration was initialized again, which gives
+    it a new ``version``."""
+    with _layouts_lock:
+        cached = _layouts.get(iteration_id)
+        if cached is not None and cached[0] == version:
+            _layouts.move_to_end(iteration_id)
+            return cached[1]
+
+    layout = load()
+    with _layouts_lock:
+        _layouts[iteration_id] = (version, layout)
+        _layouts.move_to_end(iteration_id)
+        while len(_layouts) > _max_layouts:
+            _layouts.popitem(last=False)
+    return layout
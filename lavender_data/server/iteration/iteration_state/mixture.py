@@ -0,0 +1,239 @@
+import bisect
+import ujson as json
+from typing import Optional
+
+from lavender_data.server.cache import CacheClient
+from lavender_data.server.db.models import (
+    Dataset,
+    Shardset,
+    Iteration,
+    IterationBase,
+)
+from lavender_data.server.reader import ShardInfo, GlobalSampleIndex
+from lavender_data.server.shardset import get_main_shardset
+
+from .abc import Progress, InProgressIndex, IterationStateException
+from .default import IterationState
+
+__all__ = ["MixtureIterationState", "open_iteration_state"]
+
+
+def _stride_schedule(
+    drawn: list[int], weights: list[float], count: int, exclude: set[int]
+) -> list[int]:
+    """The components of the next ``count`` draws, each the one with the
+    least draws for its weight so far."""
+    drawn = list(drawn)
+    candidates = [i for i in range(len(weights)) if i not in exclude]
+    schedule = []
+    for _ in range(count):
+        i = min(candidates, key=lambda i: ((drawn[i] + 1) / weights[i], i))
+        drawn[i] += 1
+        schedule.append(i)
+    return schedule
+
+
+class _ComponentIteration(IterationBase):
+    """The iteration of a single dataset of a mixture, which is not stored."""
+
+    dataset: Dataset
+    shardsets: list[Shardset]
+
+
+class MixtureIterationState(IterationState):
+    """An iteration over a mixture of datasets.
+
+    Each dataset is iterated by an ``IterationState`` of its own, with its
+    own shuffled order, and each rank draws from them in proportion to their
+    weights with a stride schedule: the next sample comes from the dataset
+    with the least samples drawn for its weight. The indices of a dataset
+    are offset by the samples of the datasets before it.
+    """
+
+    def __init__(self, iteration_id: str, cache: CacheClient):
+        super().__init__(iteration_id, cache)
+        self._mixture_info: Optional[list[dict]] = None
+
+    def _mixture(self) -> list[dict]:
+        # does not change once initialized
+        if self._mixture_info is None:
+            v = self.cache.get(self._key("mixture"))
+            if v is None:
+                raise IterationStateException("Mixture not found")
+            self._mixture_info = json.loads(v)
+        return self._mixture_info
+
+    def _component(self, i: int) -> IterationState:
+        return IterationState(self._key(f"components:{i}"), self.cache)
+
+    def _components(self) -> list[IterationState]:
+        return [self._component(i) for i in range(len(self._mixture()))]
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        offsets = [c["offset"] for c in self._mixture()]
+        i = bisect.bisect_right(offsets, index) - 1
+        return i, index - offsets[i]
+
+    def init(self, iteration: Iteration) -> None:
+        with self.cache.lock(self._key("init")):
+            if self.exists():
+                return
+
+            mixture = []
+            offset = 0
+            for i, component in enumerate(iteration.mixture):
+                shardsets = [
+                    s for s in iteration.shardsets if s.id in component["shardsets"]
+                ]
+                total = sum(
+                    shard.samples for shard in get_main_shardset(shardsets).shards
+                )
+                self._component(i).init(
+                    _ComponentIteration.model_construct(
+                        **iteration.model_dump(
+                            include={
+                                "filters",
+                                "shuffle",
+                                "shuffle_seed",
+                                "shuffle_block_size",
+                                "shuffle_mode",
+                                "shuffle_buffer_size",
+                                "batch_size",
+                                "replication_pg",
+                            }
+                        ),
+                        id=self._key(f"components:{i}"),
+                        dataset_id=component["dataset_id"],
+                        total=total,
+                        dataset=shardsets[0].dataset,
+                        shardsets=shardsets,
+                    )
+                )
+                mixture.append(
+                    {"weight": component["weight"], "offset": offset, "total": total}
+                )
+                offset += total
+
+            # set before the total, by which the iteration is found initialized
+            self.cache.set(self._key("mixture"), json.dumps(mixture))
+            self._set_iteration_info(iteration)
+
+    def pushback_inprogress(self) -> None:
+        for component in self._components():
+            component.pushback_inprogress()
+
+    def complete(self, index: int) -> None:
+        i, index = self._locate(index)
+        self._component(i).complete(index)
+
+    def filtered(self, index: int) -> None:
+        i, index = self._locate(index)
+        self._component(i).filtered(index)
+
+    def failed(self, index: int) -> None:
+        i, index = self._locate(index)
+        self._component(i).failed(index)
+
+    def _pushback_indices(self, rank: int, indices: list[int]) -> None:
+        by_component: dict[int, list[int]] = {}
+        for index in indices:
+            i, index = self._locate(index)
+            by_component.setdefault(i, []).append(index)
+        for i, component_indices in by_component.items():
+            self._component(i)._pushback_indices(rank, component_indices)
+
+    def next_items(self, rank: int, count: int) -> list[GlobalSampleIndex]:
+        mixture = self._mixture()
+        weights = [c["weight"] for c in mixture]
+
+        items: list[GlobalSampleIndex] = []
+        with self.cache.lock(self._key(f"draw:{rank}")):
+            with self.cache.pipeline() as pipe:
+                for i in range(len(mixture)):
+                    pipe.get(self._key(f"drawn:{rank}:{i}"))
+                drawn = [int(d or 0) for d in pipe.execute()]
+
+            # the datasets that ran out of indices for the rank, for this call
+            exhausted: set[int] = set()
+            while len(items) < count and len(exhausted) < len(mixture):
+                schedule = _stride_schedule(
+                    drawn, weights, count - len(items), exhausted
+                )
+                popped: dict[int, list[GlobalSampleIndex]] = {}
+                for i in sorted(set(schedule)):
+                    wanted = schedule.count(i)
+                    try:
+                        popped[i] = self._component(i).next_items(rank, wanted)
+                    except IterationStateException:
+                        popped[i] = []
+                    if len(popped[i]) < wanted:
+                        exhausted.add(i)
+
+                for i in schedule:
+                    if len(popped[i]) == 0:
+                        continue
+                    item = popped[i].pop(0)
+                    items.append(
+                        item.model_copy(
+                            update={"index": item.index + mixture[i]["offset"]}
+                        )
+                    )
+                    drawn[i] += 1
+
+            with self.cache.pipeline() as pipe:
+                for i in range(len(mixture)):
+                    pipe.set(self._key(f"drawn:{rank}:{i}"), drawn[i])
+                pipe.execute()
+
+        if len(items) == 0:
+            raise IterationStateException("No more indices to pop")
+        return items
+
+    def get_ranks(self) -> list[int]:
+        return sorted(set(r for c in self._components() for r in c.get_ranks()))
+
+    def get_progress(self) -> Progress:
+        mixture = self._mixture()
+        progresses = [component.get_progress() for component in self._components()]
+        with self.cache.pipeline() as pipe:
+            pipe.incr(self._key("batched_tokens"), 0)
+            pipe.incr(self._key("padded_tokens"), 0)
+            [batched_tokens, padded_tokens] = pipe.execute()
+
+        return Progress(
+            total=sum(p.total for p in progresses),
+            current=sum(p.current for p in progresses),
+            inprogress=[
+                InProgressIndex(
+                    index=inprogress.index + c["offset"],
+                    rank=inprogress.rank,
+                    started_at=inprogress.started_at,
+                )
+                for p, c in zip(progresses, mixture)
+                for inprogress in p.inprogress
+            ],
+            completed=sum(p.completed for p in progresses),
+            filtered=sum(p.filtered for p in progresses),
+            failed=sum(p.failed for p in progresses),
+            batched_tokens=int(batched_tokens),
+            padded_tokens=int(padded_tokens),
+        )
+
+    def get_upcoming_shards(self, count: int) -> list[ShardInfo]:
+        return [
+            shard
+            for component in self._components()
+            for shard in component.get_upcoming_shards(count)
+        ]
+
+
+def open_iteration_state(
+    iteration_id: str, cache: CacheClient, mixture: Optional[bool] = None
+) -> IterationState:
+    """The state of the iteration, of a mixture of datasets if it is
+    initialized as one or if ``mixture``."""
+    if mixture is None:
+        mixture = cache.exists(f"{iteration_id}:mixture")
+    if mixture:
+        return MixtureIterationState(iteration_id, cache)
+    return IterationState(iteration_id, cache)
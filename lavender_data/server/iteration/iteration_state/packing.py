@@ -0,0 +1,39 @@
+from typing import Any
+
+import numpy as np
+
+__all__ = ["sample_length", "pack_by_length"]
+
+
+def sample_length(value: Any) -> int:
+    """The length of a sample, given the value of its length column. An
+    integer is taken as the length itself, anything else is measured with
+    ``len`` (tokens, bytes or the first dimension of an array)."""
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return len(value)
+
+
+def pack_by_length(
+    lengths: list[int], budget: int, max_samples: int
+) -> list[list[int]]:
+    """Groups the positions of ``lengths`` into batches of at most
+    ``max_samples`` samples, padded to the longest one of them in at most
+    ``budget`` tokens. The positions are sorted by length first so that the
+    samples of a batch need little padding. A sample longer than the budget
+    is a batch of its own."""
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # sorted, so the sample being added is the longest one of the batch
+        if len(batch) > 0 and (
+            len(batch) >= max_samples or lengths[i] * (len(batch) + 1) > budget
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,68 @@
+import numpy as np
+
+__all__ = ["FeistelPermutation", "permuted_indices"]
+
+
+def _mix(x: np.ndarray, key: np.uint64) -> np.ndarray:
+    # splitmix64 finalizer
+    x = x ^ key
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class FeistelPermutation:
+    """A keyed bijection of ``range(size)``, computed on demand.
+
+    A balanced Feistel network permutes the smallest power of 4 that covers
+    ``size``, and positions that land outside of ``range(size)`` are mapped
+    again until they fall inside (cycle walking). The same ``seed`` gives
+    the same permutation, so nothing but a position has to be stored.
+    """
+
+    def __init__(self, size: int, seed: list[int], rounds: int = 4):
+        self.size = size
+        self.half_bits = max((max(size - 1, 1).bit_length() + 1) // 2, 1)
+        self.half_mask = np.uint64((1 << self.half_bits) - 1)
+        self.keys = np.random.default_rng(seed).integers(
+            0, 2**63, size=rounds, dtype=np.uint64
+        )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _round_trip(self, x: np.ndarray) -> np.ndarray:
+        shift = np.uint64(self.half_bits)
+        left = x >> shift
+        right = x & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ (_mix(right, key) & self.half_mask)
+        return (left << shift) | right
+
+    def __call__(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.uint64)
+        if np.any(positions >= np.uint64(self.size)):
+            raise IndexError(f"Position out of range ({self.size})")
+
+        with np.errstate(over="ignore"):
+            permuted = self._round_trip(positions)
+            outside = permuted >= np.uint64(self.size)
+            while np.any(outside):
+                permuted[outside] = self._round_trip(permuted[outside])
+                outside = permuted >= np.uint64(self.size)
+        return permuted.astype(np.int64)
+
+
+def permuted_indices(
+    ranges: list[tuple[int, int]], seed: list[int], start: int, end: int
+) -> list[int]:
+    """The global indices at positions ``start`` to ``end`` (exclusive) of a
+    permutation of the samples in the inclusive index ``ranges``."""
+    lengths = np.array([e - s + 1 for s, e in ranges], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    permutation = FeistelPermutation(int(offsets[-1]), seed)
+
+    permuted = permutation(np.arange(start, end))
+    range_indices = np.searchsorted(offsets, permuted, side="right") - 1
+    starts = np.array([s for s, _ in ranges], dtype=np.int64)
+    return (starts[range_indices] + permuted - offsets[range_indices]).tolist()
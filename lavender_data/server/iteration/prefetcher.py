@@ -1,8 +1,9 @@
+import math
 import time
 import threading
 from typing import Literal, Optional
-from queue import Empty, Queue
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pydantic import BaseModel
 
 from lavender_data.serialize import serialize_sample
 from lavender_data.logging import get_logger
@@ -10,12 +11,22 @@ from lavender_data.logging import get_logger
 from lavender_data.server.distributed import get_cluster
 from lavender_data.server.settings import get_settings
 from lavender_data.server.cache import get_cache
+from lavender_data.server.reader import get_reader_instance
 from lavender_data.server.iteration.iteration_state import (
     IterationStateOps,
     IterationStateException,
 )
+from lavender_data.server.iteration.executor import get_preprocessor_executor
+from lavender_data.server.iteration.scheduler import PrefetchScheduler
+from lavender_data.server.background_worker import (
+    get_process_pool,
+    share_arrays,
+    load_arrays,
+    free_arrays,
+)
 from lavender_data.server.iteration.process import (
     ProcessNextSamplesException,
+    process_preprocessor_group,
     gather_samples,
     organize_preprocessors,
     decollate,
@@ -28,6 +39,92 @@ class NotFetchedYet(Exception):
     pass
 
 
+class PrefetcherRankStats(BaseModel):
+    autotune: bool
+    depth: int
+    fetching: int
+    fetched: int
+    consume_interval: Optional[float]
+    produce_latency: Optional[float]
+
+
+class PrefetchDepthTuner:
+    """Chooses how many batches of a rank are prefetched ahead of the consumer.
+
+    By Little's law, the batches in flight needed to hide the produce latency
+    are the latency over the interval between the consumer's requests. The
+    latency is taken with twice its mean deviation as a margin for spikes,
+    and every request that finds no batch ready adds one more batch of
+    headroom, which is given back after a depth of requests that do not.
+    The depth is kept under ``max_depth`` and under what the consumer takes
+    within half the batch cache TTL, so that prefetched batches do not expire.
+    """
+
+    smoothing: float = 0.2
+
+    def __init__(self, initial_depth: int, max_depth: int, cache_ttl: int):
+        self.max_depth = max(1, max_depth)
+        self.cache_ttl = cache_ttl
+        self.depth = min(max(1, initial_depth), self.max_depth)
+
+        self.consume_interval: Optional[float] = None
+        self.produce_latency: Optional[float] = None
+        self.produce_latency_deviation = 0.0
+
+        self._last_consumed_at: Optional[float] = None
+        self._starved = False
+        self._headroom = 0
+        self._satisfied = 0
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+    def produced(self, latency: float) -> None:
+        if self.produce_latency is not None:
+            self.produce_latency_deviation = self._smooth(
+                self.produce_latency_deviation, abs(latency - self.produce_latency)
+            )
+        self.produce_latency = self._smooth(self.produce_latency, latency)
+        self._retune()
+
+    def starved(self) -> None:
+        self._starved = True
+
+    def consumed(self, now: Optional[float] = None) -> None:
+        now = now if now is not None else time.monotonic()
+        if self._last_consumed_at is not None:
+            self.consume_interval = self._smooth(
+                self.consume_interval, now - self._last_consumed_at
+            )
+        self._last_consumed_at = now
+
+        if self._starved:
+            self._headroom += 1
+            self._satisfied = 0
+        else:
+            self._satisfied += 1
+            if self._headroom > 0 and self._satisfied >= self.depth:
+                self._headroom -= 1
+                self._satisfied = 0
+        self._starved = False
+        self._retune()
+
+    def _retune(self) -> None:
+        if self.consume_interval is None or self.produce_latency is None:
+            return
+
+        interval = max(self.consume_interval, 1e-3)
+        latency = self.produce_latency + 2 * self.produce_latency_deviation
+        depth = math.ceil(latency / interval) + self._headroom
+
+        max_depth = self.max_depth
+        if self.cache_ttl > 0:
+            max_depth = min(max_depth, int(self.cache_ttl / 2 / interval))
+        self.depth = min(max(1, depth), max(1, max_depth))
+
+
 class IterationPrefetcher:
     def __init__(
         self,
@@ -38,9 +135,14 @@ class IterationPrefetcher:
         num_workers: int,
         prefetch_factor: int,
         in_order: bool,
+        scheduler: PrefetchScheduler,
+        autotune: bool = False,
+        priority: float = 1.0,
     ):
         if max_retry_count < 0:
             raise ValueError("max_retry_count must be >= 0")
+        if priority <= 0:
+            raise ValueError("priority must be > 0")
 
         self.iteration_id = iteration_id
         self.state = state
@@ -49,6 +151,9 @@ class IterationPrefetcher:
         self.num_workers = num_workers
         self.prefetch_factor = prefetch_factor
         self.in_order = in_order
+        self.scheduler = scheduler
+        self.autotune = autotune
+        self.priority = priority
 
         self.cache = next(get_cache())
         self.settings = get_settings()
@@ -58,18 +163,28 @@ class IterationPrefetcher:
         self.fetching: dict[int, list[int]] = {}
         self.fetched: dict[int, dict[int, str]] = {}
         self.current: dict[int, int] = {}
+        # when the batches being fetched were submitted, for the tuners
+        self.submitted_at: dict[int, dict[int, float]] = {}
+        self.tuners: dict[int, PrefetchDepthTuner] = {}
 
-        self.submit_threads: dict[int, threading.Thread] = {}
-        self.process_threads: dict[int, list[threading.Thread]] = {}
+        # whether a submit of the rank is queued or running in the scheduler
+        self.submitting: dict[int, bool] = {}
         self.stop_event: dict[int, threading.Event] = {}
         self.all_submitted_event: dict[int, threading.Event] = {}
         self.done_event: dict[int, threading.Event] = {}
-
-        self.process_queues: dict[int, Queue] = {}
+        # why nothing more is submitted for a rank, raised by get_next
+        self.errors: dict[int, Exception] = {}
+        # guards fetching, fetched and submitting of a rank
+        self.locks: dict[int, threading.Lock] = {}
 
         self._node_map: dict[int, dict[str, list[int]]] = {}
         self._sync_node_map_thread = None
 
+        self._lookahead_thread = None
+        self._lookahead_stop_event = threading.Event()
+        # set when indices are popped, which may open the upcoming shards
+        self._lookahead_event = threading.Event()
+
     def _log(
         self,
         rank: Optional[int],
@@ -94,13 +209,71 @@ class IterationPrefetcher:
             self.cache.set(
                 cache_key, content, ex=self.settings.lavender_data_batch_cache_ttl
             )
-        self.fetching[rank].remove(current)
-        self.fetched[rank][current] = cache_key
+        with self.locks[rank]:
+            self.fetching[rank].remove(current)
+            self.fetched[rank][current] = cache_key
+            submitted_at = self.submitted_at[rank].pop(current, None)
+            if self.autotune and submitted_at is not None:
+                self.tuners[rank].produced(time.monotonic() - submitted_at)
 
         if self.cluster is not None and self.cluster.is_head:
             self._cleanup_node_map(rank, self.cluster.node_url, current)
 
-    def _submit_prefetch(self, rank: int, queue: Queue):
+        # the retuned depth may leave room for another batch
+        self._schedule_submit(rank)
+        self._check_done(rank)
+
+    def _owner(self, rank: int) -> str:
+        return f"{self.iteration_id}:{rank}"
+
+    def _schedule_submit(self, rank: int) -> None:
+        """Queues a submit for the rank if it has room for another batch.
+        A rank has one submit at a time, which queues the next when it ends."""
+        with self.locks[rank]:
+            if (
+                self.stop_event[rank].is_set()
+                or self.all_submitted_event[rank].is_set()
+                or self.submitting[rank]
+                or len(self.fetching[rank]) + len(self.fetched[rank])
+                >= self.depth(rank)
+            ):
+                return
+            self.submitting[rank] = True
+        self.scheduler.submit(self._owner(rank), self._submit, rank)
+
+    def _check_done(self, rank: int) -> None:
+        with self.locks[rank]:
+            if (
+                self.stop_event[rank].is_set()
+                or self.done_event[rank].is_set()
+                or not self.all_submitted_event[rank].is_set()
+                or self.submitting[rank]
+                or len(self.fetching[rank]) > 0
+            ):
+                return
+            self.done_event[rank].set()
+        self._log(rank, "Iteration finished")
+
+    def _submit(self, rank: int) -> None:
+        try:
+            self._submit_prefetch(rank)
+        except StopIteration:
+            self.all_submitted_event[rank].set()
+        except Exception as e:
+            # nothing more is submitted for the rank, its requests are
+            # answered with the error once the batches in flight are taken
+            self._log(rank, f"Error submitting prefetch: {e}", level="exception")
+            with self.locks[rank]:
+                self.errors[rank] = e
+            self.all_submitted_event[rank].set()
+
+        with self.locks[rank]:
+            self.submitting[rank] = False
+        self._schedule_submit(rank)
+        self._check_done(rank)
+
+    def _submit_prefetch(self, rank: int):
+        submitted_at = time.monotonic()
         try:
             cache_key, params = self.state.get_next_samples(rank)
         except IterationStateException as e:
@@ -111,8 +284,11 @@ class IterationPrefetcher:
         except Exception as e:
             self._log(rank, f"Error prefetching {rank}: {e}")
             raise e
+        self._lookahead_event.set()
 
-        self.fetching[rank].append(params.current)
+        with self.locks[rank]:
+            self.fetching[rank].append(params.current)
+            self.submitted_at[rank][params.current] = submitted_at
         if self.cluster is not None and self.cluster.is_head:
             self.set_node_map(rank, self.cluster.node_url, params.current)
 
@@ -132,7 +308,11 @@ class IterationPrefetcher:
             return
 
         preprocessors = organize_preprocessors(params.preprocessors)
-        queue.put(
+        # ahead of the next submit, to finish the batches in flight first
+        self.scheduler.submit(
+            self._owner(rank),
+            self._process,
+            rank,
             (
                 params.current,
                 cache_key,
@@ -141,154 +321,144 @@ class IterationPrefetcher:
                 0,
                 params.batch_size,
                 params.global_sample_indices,
-            )
+            ),
+            first=True,
         )
 
-    def _keep_submitting(
-        self,
-        rank: int,
-        stop_event: threading.Event,
-        all_submitted_event: threading.Event,
-        queue: Queue,
-    ) -> None:
-        while not stop_event.is_set():
-            while (
-                len(self.upcoming_samples(rank))
-                >= (self.prefetch_factor * self.num_workers)
-                and not stop_event.is_set()
-            ):
-                time.sleep(0.01)
-
-            if stop_event.is_set():
-                break
-
-            try:
-                self._submit_prefetch(rank, queue)
-            except StopIteration:
-                break
-
-        all_submitted_event.set()
-
     def _process_prefetch(
         self,
+        rank: int,
         batch: dict,
         preprocessors: list[list[tuple[Preprocessor, dict]]],
         preprocessor_group_index: int,
     ):
-        _start = time.time()
+        preprocessor_group = preprocessors[preprocessor_group_index]
+        if self.settings.lavender_data_preprocess_mode == "process":
+            process_pool = get_process_pool()
+            shared = share_arrays(batch)
+            try:
+                work_id = process_pool.submit(
+                    process_preprocessor_group,
+                    preprocessor_group=[
+                        (p.name, params) for p, params in preprocessor_group
+                    ],
+                    batch=shared,
+                )
+                result = process_pool.result(work_id)
+            finally:
+                # already unlinked by the worker, unless it failed before
+                # mapping the batch
+                free_arrays(shared)
+            try:
+                return load_arrays(result)
+            except BaseException:
+                free_arrays(result)
+                raise
 
-        executor = ThreadPoolExecutor()
-        futures = []
-        for preprocessor, args in preprocessors[preprocessor_group_index]:
-            futures.append(executor.submit(preprocessor.process, batch, **args))
+        return get_preprocessor_executor().process(
+            (self.iteration_id, rank), preprocessor_group, batch
+        )
 
-        for future in as_completed(futures):
-            batch.update(future.result())
+    def _process(self, rank: int, item: tuple) -> None:
+        if self.stop_event[rank].is_set():
+            return
 
-        executor.shutdown()
-        return batch
+        try:
+            (
+                current,
+                cache_key,
+                batch,
+                preprocessors,
+                preprocessor_group_index,
+                batch_size,
+                global_sample_indices,
+            ) = item
+            for i in range(self.max_retry_count + 1):
+                try:
+                    next_batch = self._process_prefetch(
+                        rank, batch, preprocessors, preprocessor_group_index
+                    )
+                    break
+                except Exception as e:
+                    if i == self.max_retry_count:
+                        error = ProcessNextSamplesException(
+                            e=e,
+                            current=current,
+                            global_sample_indices=global_sample_indices,
+                        )
+                        self._set_cache(
+                            rank,
+                            current,
+                            cache_key,
+                            f"processing_error:{error.json()}".encode("utf-8"),
+                        )
+                        raise e
+                    else:
+                        self._log(
+                            rank,
+                            f"Error prefetching: {e} (retrying... {i + 1}/{self.max_retry_count})",
+                            level="warning",
+                        )
 
-    def _keep_prefetching(
-        self,
-        rank: int,
-        stop_event: threading.Event,
-        all_submitted_event: threading.Event,
-        done_event: threading.Event,
-        queue: Queue,
-    ) -> None:
-        while not stop_event.is_set() and not done_event.is_set():
-            try:
+            if next_batch is None:
+                # error occurred
+                return
+
+            if preprocessor_group_index == len(preprocessors) - 1:
+                # this one done
+                if batch_size == 0:
+                    next_batch = decollate(next_batch)
+                self._set_cache(rank, current, cache_key, serialize_sample(next_batch))
+                return
+
+            # proceed to next preprocessor group
+            self.scheduler.submit(
+                self._owner(rank),
+                self._process,
+                rank,
                 (
                     current,
                     cache_key,
-                    batch,
+                    next_batch,
                     preprocessors,
-                    preprocessor_group_index,
+                    preprocessor_group_index + 1,
                     batch_size,
                     global_sample_indices,
-                ) = queue.get(timeout=1.0)
-                for i in range(self.max_retry_count + 1):
-                    try:
-                        next_batch = self._process_prefetch(
-                            batch, preprocessors, preprocessor_group_index
-                        )
-                        break
-                    except Exception as e:
-                        if i == self.max_retry_count:
-                            error = ProcessNextSamplesException(
-                                e=e,
-                                current=current,
-                                global_sample_indices=global_sample_indices,
-                            )
-                            self._set_cache(
-                                rank,
-                                current,
-                                cache_key,
-                                f"processing_error:{error.json()}".encode("utf-8"),
-                            )
-                            raise e
-                        else:
-                            self._log(
-                                rank,
-                                f"Error prefetching: {e} (retrying... {i + 1}/{self.max_retry_count})",
-                                level="warning",
-                            )
-
-                if next_batch is None:
-                    # error occurred
-                    continue
-
-                if preprocessor_group_index == len(preprocessors) - 1:
-                    # this one done
-                    if batch_size == 0:
-                        next_batch = decollate(next_batch)
-                    self._set_cache(
-                        rank, current, cache_key, serialize_sample(next_batch)
-                    )
-                    continue
-
-                # proceed to next preprocessor group
-                preprocessor_group_index += 1
-                queue.put(
-                    (
-                        current,
-                        cache_key,
-                        next_batch,
-                        preprocessors,
-                        preprocessor_group_index,
-                        batch_size,
-                        global_sample_indices,
-                    )
-                )
-            except Empty:
-                if all_submitted_event.is_set() and len(self.fetching[rank]) == 0:
-                    self._log(rank, "Iteration finished")
-                    break
-                continue
-            except Exception as e:
-                self._log(rank, f"Error prefetching: {e}", level="exception")
-                continue
-
-        done_event.set()
+                ),
+                first=True,
+            )
+        except Exception as e:
+            self._log(rank, f"Error prefetching: {e}", level="exception")
 
     def get_next(self, rank: int, seq: Optional[int] = None) -> tuple[int, bytes]:
         try:
-            if self.in_order and seq is None:
-                current = self.current[rank]
-                cache_key = self.fetched[rank].pop(current)
-                self.current[rank] += 1
-            elif seq is not None:
-                current = seq
-                # TODO possible infinite waiting
-                cache_key = self.fetched[rank].pop(seq)
-                self.current[rank] = current + 1
-            else:
-                current, cache_key = self.fetched[rank].popitem()
+            with self.locks[rank]:
+                if self.in_order and seq is None:
+                    current = self.current[rank]
+                    cache_key = self.fetched[rank].pop(current)
+                    self.current[rank] += 1
+                elif seq is not None:
+                    current = seq
+                    # TODO possible infinite waiting
+                    cache_key = self.fetched[rank].pop(seq)
+                    self.current[rank] = current + 1
+                else:
+                    current, cache_key = self.fetched[rank].popitem()
+                if self.autotune:
+                    self.tuners[rank].consumed()
         except KeyError:
+            if rank in self.errors:
+                raise self.errors[rank]
             if self.done_event[rank].is_set():
                 raise StopIteration
+            if self.autotune:
+                with self.locks[rank]:
+                    self.tuners[rank].starved()
             raise NotFetchedYet()
 
+        # room to prefetch the next batch
+        self._schedule_submit(rank)
+
         content = self.cache.get(cache_key)
         if not content:
             raise Exception(f"Cache expired")
@@ -299,6 +469,27 @@ class IterationPrefetcher:
 
         return current, content
 
+    def depth(self, rank: int) -> int:
+        """The number of batches of the rank that may be fetching or fetched."""
+        if self.autotune:
+            return self.tuners[rank].depth
+        return self.prefetch_factor * self.num_workers
+
+    def stats(self) -> dict[int, PrefetcherRankStats]:
+        stats = {}
+        for rank in self.ranks():
+            with self.locks[rank]:
+                tuner = self.tuners[rank] if self.autotune else None
+                stats[rank] = PrefetcherRankStats(
+                    autotune=self.autotune,
+                    depth=self.depth(rank),
+                    fetching=len(self.fetching[rank]),
+                    fetched=len(self.fetched[rank]),
+                    consume_interval=tuner.consume_interval if tuner else None,
+                    produce_latency=tuner.produce_latency if tuner else None,
+                )
+        return stats
+
     def set_node_map(self, rank: int, node_url: str, seq: int) -> None:
         if rank not in self._node_map:
             self._node_map[rank] = {}
@@ -346,50 +537,67 @@ class IterationPrefetcher:
     ):
         while not stop_event.is_set() and not done_event.is_set():
             self._sync_node_map()
-            time.sleep(5.0)
+            stop_event.wait(5.0)
+
+    def _keep_looking_ahead(self, stop_event: threading.Event):
+        reader = get_reader_instance()
+        count = self.settings.lavender_data_reader_lookahead_shards
+        while True:
+            # the batches submitted while looking ahead are coalesced
+            self._lookahead_event.wait()
+            if stop_event.is_set():
+                break
+            self._lookahead_event.clear()
+            try:
+                shards = self.state.get_upcoming_shards(count)
+                if len(shards) == 0:
+                    # every shard is popped already
+                    break
+                reader.prefetch(*shards)
+            except Exception as e:
+                self._log(None, f"Error looking ahead shards: {e}", level="warning")
 
     def upcoming_samples(self, rank: int) -> list[int]:
-        return self.fetching[rank] + list(self.fetched[rank].keys())
+        with self.locks[rank]:
+            return self.fetching[rank] + list(self.fetched[rank].keys())
 
     def ranks(self) -> list[int]:
         return list(self.current.keys())
 
+    def _reweight(self) -> None:
+        # the priority of the iteration is shared by its ranks, each of which
+        # runs a submit and up to num_workers preprocessings at a time
+        weight = self.priority / max(1, len(self.ranks()))
+        for rank in self.ranks():
+            self.scheduler.register(
+                self._owner(rank), weight=weight, concurrency=self.num_workers + 1
+            )
+
     def start(self, rank: int) -> None:
+        if rank in self.stop_event:
+            # the rank is restarted
+            self.stop(rank)
+
         self.current[rank] = 0
         self.fetching[rank] = []
         self.fetched[rank] = {}
-        self.process_queues[rank] = Queue()
+        self.submitted_at[rank] = {}
+        if self.autotune:
+            self.tuners[rank] = PrefetchDepthTuner(
+                self.prefetch_factor * self.num_workers,
+                self.settings.lavender_data_prefetch_max_depth,
+                self.settings.lavender_data_batch_cache_ttl,
+            )
+        self.submitting[rank] = False
+        self.errors.pop(rank, None)
+        self.locks[rank] = threading.Lock()
 
         self.stop_event[rank] = threading.Event()
         self.done_event[rank] = threading.Event()
         self.all_submitted_event[rank] = threading.Event()
 
-        self.submit_threads[rank] = threading.Thread(
-            target=self._keep_submitting,
-            args=(
-                rank,
-                self.stop_event[rank],
-                self.all_submitted_event[rank],
-                self.process_queues[rank],
-            ),
-        )
-        self.submit_threads[rank].start()
-
-        self.process_threads[rank] = [
-            threading.Thread(
-                target=self._keep_prefetching,
-                args=(
-                    rank,
-                    self.stop_event[rank],
-                    self.all_submitted_event[rank],
-                    self.done_event[rank],
-                    self.process_queues[rank],
-                ),
-            )
-            for _ in range(self.num_workers)
-        ]
-        for thread in self.process_threads[rank]:
-            thread.start()
+        self._reweight()
+        self._schedule_submit(rank)
 
         if (
             self.cluster is not None
@@ -403,25 +611,27 @@ class IterationPrefetcher:
             )
             self._sync_node_map_thread.start()
 
-    def join(self, rank: int) -> None:
-        self.submit_threads[rank].join(timeout=5.0)
-        if self.submit_threads[rank].is_alive():
-            self._log(
-                rank,
-                f"Warning: Submit thread did not terminate within timeout",
+        if (
+            self.settings.lavender_data_reader_lookahead_shards > 0
+            and self._lookahead_thread is None
+        ):
+            self._lookahead_thread = threading.Thread(
+                target=self._keep_looking_ahead,
+                args=(self._lookahead_stop_event,),
+                daemon=True,
             )
-        for i, thread in enumerate(self.process_threads[rank]):
-            thread.join(timeout=5.0)
-            if thread.is_alive():
-                self._log(
-                    rank,
-                    f"Warning: Thread {i} ({thread.name}) did not terminate within timeout",
-                )
+            self._lookahead_thread.start()
+        # the first shards, before any batch is submitted
+        self._lookahead_event.set()
 
     def stop(self, rank: int) -> None:
-        self._log(rank, "Stopping prefetcher threads")
+        self._log(rank, "Stopping prefetcher")
         self.stop_event[rank].set()
-        self.join(rank)
+        if not self.scheduler.remove(self._owner(rank), timeout=5.0):
+            self._log(
+                rank,
+                "Warning: Prefetch tasks did not terminate within timeout",
+            )
         if self._sync_node_map_thread is not None:
             self._sync_node_map_thread.join(timeout=5.0)
         self._log(rank, "Prefetcher stopped")
@@ -430,12 +640,21 @@ class IterationPrefetcher:
         for rank in self.ranks():
             self.stop(rank)
 
+        self._lookahead_stop_event.set()
+        self._lookahead_event.set()
+        if self._lookahead_thread is not None:
+            self._lookahead_thread.join(timeout=5.0)
+
         self.logger.debug(f"[{self.iteration_id}] Prefetcher pool shutdown")
 
 
 class IterationPrefetcherPool:
-    def __init__(self):
+    """The prefetchers of the iterations, which run their tasks on a shared
+    ``PrefetchScheduler`` of ``workers`` threads."""
+
+    def __init__(self, workers: int = 0):
         self.prefetchers: dict[str, IterationPrefetcher] = {}
+        self.scheduler = PrefetchScheduler(workers)
 
     def get_prefetcher(self, iteration_id: str):
         return self.prefetchers[iteration_id]
@@ -449,6 +668,8 @@ class IterationPrefetcherPool:
         num_workers: int,
         prefetch_factor: int,
         in_order: bool,
+        autotune: bool = False,
+        priority: float = 1.0,
     ):
         prefetcher = IterationPrefetcher(
             iteration_id,
@@ -458,6 +679,9 @@ class IterationPrefetcherPool:
             num_workers,
             prefetch_factor,
             in_order,
+            self.scheduler,
+            autotune,
+            priority,
         )
         self.prefetchers[iteration_id] = prefetcher
         return prefetcher
@@ -465,3 +689,4 @@ class IterationPrefetcherPool:
     def shutdown(self):
         for prefetcher in self.prefetchers.values():
             prefetcher.shutdown()
+        self.scheduler.shutdown()
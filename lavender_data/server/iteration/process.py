@@ -1,7 +1,6 @@
 import ujson as json
 from typing import Optional
 import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from fastapi import HTTPException
 from pydantic import BaseModel
@@ -12,7 +11,11 @@ except ImportError:
     torch = None
 
 from lavender_data.logging import get_logger
-from lavender_data.server.background_worker import pool_task
+from lavender_data.server.background_worker import (
+    pool_task,
+    share_arrays,
+    mapped_arrays,
+)
 from lavender_data.server.db.models import (
     IterationPreprocessor,
     IterationCollater,
@@ -29,6 +32,8 @@ from lavender_data.server.registries import (
     Preprocessor,
 )
 
+from .executor import get_preprocessor_executor
+
 
 class CollateSamplesParams(BaseModel):
     current: int
@@ -128,17 +133,25 @@ def gather_samples(
 
     if samples is None:
         samples = []
-        for i in global_sample_indices:
-            try:
-                samples.append(reader.get_sample(i, join_method))
-            except InnerJoinSampleInsufficient:
-                pass
+        # keep the shards of the whole batch in memory until it is gathered
+        with reader.pinned(
+            *[
+                s
+                for i in global_sample_indices
+                for s in [i.main_shard, *i.feature_shards]
+            ]
+        ):
+            for i in global_sample_indices:
+                try:
+                    samples.append(reader.get_sample(i, join_method))
+                except InnerJoinSampleInsufficient:
+                    pass
 
     if len(samples) == 0:
         raise NoSamplesFound()
 
     batch = (
-        CollaterRegistry.get(collater["name"]).collate(samples)
+        CollaterRegistry.get(collater["name"]).collate(samples, **collater["params"])
         if collater is not None
         else CollaterRegistry.get("default").collate(samples)
     )
@@ -193,14 +206,9 @@ def _process_next_samples(
 
     if params.preprocessors is not None:
         preprocessors = organize_preprocessors(params.preprocessors)
-        executor = ThreadPoolExecutor()
+        executor = get_preprocessor_executor()
         for preprocessor_group in preprocessors:
-            futures = []
-            for preprocessor, args in preprocessor_group:
-                futures.append(executor.submit(preprocessor.process, batch, **args))
-            for future in as_completed(futures):
-                batch.update(future.result())
-        executor.shutdown()
+            batch = executor.process(None, preprocessor_group, batch)
 
     if params.batch_size == 0:
         batch = decollate(batch)
@@ -208,6 +216,20 @@ def _process_next_samples(
     return batch
 
 
+@pool_task()
+def process_preprocessor_group(
+    preprocessor_group: list[tuple[str, dict]], batch: dict
+) -> dict:
+    """Runs a group of preprocessors in a worker process, on a batch whose
+    arrays are handed over in shared memory both ways. The preprocessors read
+    the arrays of the batch from the shared memory, without copying them."""
+    group = [
+        (PreprocessorRegistry.get(name), params) for name, params in preprocessor_group
+    ]
+    with mapped_arrays(batch) as mapped:
+        return share_arrays(get_preprocessor_executor().process(None, group, mapped))
+
+
 @pool_task()
 def process_next_samples(
     params: ProcessNextSamplesParams,
@@ -0,0 +1,80 @@
+from sqlalchemy.orm import object_session
+from sqlmodel import select, col
+
+from lavender_data.logging import get_logger
+from lavender_data.shard import ShardStatistics as ShardStatisticsType
+from lavender_data.server.db.models import (
+    Shard,
+    Shardset,
+    ShardStatistics,
+    IterationFilter,
+)
+from lavender_data.server.registries import Filter, FilterRegistry
+
+__all__ = ["get_pruned_shards"]
+
+# bound parameters of a single query, below the limit of sqlite
+_query_chunk_size = 500
+
+
+def _get_statistics(shards: list[Shard]) -> dict[str, ShardStatisticsType]:
+    if len(shards) == 0:
+        return {}
+
+    session = object_session(shards[0])
+    if session is None:
+        return {
+            shard.id: shard.statistics.data
+            for shard in shards
+            if shard.statistics is not None
+        }
+
+    statistics: dict[str, ShardStatisticsType] = {}
+    shard_ids = [shard.id for shard in shards]
+    for i in range(0, len(shard_ids), _query_chunk_size):
+        for shard_statistics in session.exec(
+            select(ShardStatistics).where(
+                col(ShardStatistics.shard_id).in_(shard_ids[i : i + _query_chunk_size])
+            )
+        ):
+            statistics[shard_statistics.shard_id] = shard_statistics.data
+    return statistics
+
+
+def get_pruned_shards(
+    filters: list[IterationFilter], shardsets: list[Shardset]
+) -> set[int]:
+    """The indices of the shards in which no sample can pass the filters,
+    judged from the statistics of the shards by the filters that implement
+    ``prune_shard``. A shard of a feature shardset prunes the shard of the
+    main shardset with the same index, the samples of which it is joined to."""
+    prunable: list[tuple[Filter, dict]] = []
+    for f in filters:
+        try:
+            _filter = FilterRegistry.get(f["name"])
+        except ValueError:
+            continue
+        if type(_filter).prune_shard is not Filter.prune_shard:
+            prunable.append((_filter, f["params"]))
+
+    if len(prunable) == 0:
+        return set()
+
+    pruned: set[int] = set()
+    for shardset in shardsets:
+        columns = {column.name: column.type for column in shardset.columns}
+        statistics = _get_statistics(shardset.shards)
+        for shard in shardset.shards:
+            if shard.index in pruned or shard.id not in statistics:
+                continue
+            if any(
+                _filter.prune_shard(statistics[shard.id], columns, **params)
+                for _filter, params in prunable
+            ):
+                pruned.add(shard.index)
+
+    if len(pruned) > 0:
+        get_logger(__name__).info(
+            f"Pruned {len(pruned)} shards that no sample can pass the filters"
+        )
+    return pruned
@@ -0,0 +1,198 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+from lavender_data.logging import get_logger
+
+__all__ = [
+    "PrefetchScheduler",
+    "PrefetchSchedulerStats",
+    "PrefetchOwnerStats",
+]
+
+
+class PrefetchOwnerStats(BaseModel):
+    weight: float
+    queued: int
+    running: int
+    busy_seconds: float
+
+
+class PrefetchSchedulerStats(BaseModel):
+    workers: int
+    queued: int
+    running: int
+    owners: dict[str, PrefetchOwnerStats]
+
+
+class _Owner:
+    def __init__(self, weight: float, concurrency: int, virtual_time: float):
+        self.weight = weight
+        self.concurrency = concurrency
+        self.virtual_time = virtual_time
+        self.tasks: deque = deque()
+        self.running = 0
+        self.busy_seconds = 0.0
+
+
+class PrefetchScheduler:
+    """Runs the prefetch tasks of every iteration and rank on a fixed set of
+    threads.
+
+    Each owner (an iteration and rank, as ``"{iteration_id}:{rank}"``) has a
+    weight and a virtual time, which advances by the seconds its tasks run
+    divided by its weight. A free thread
+    takes the next task of the owner with the least virtual time among those
+    with fewer tasks running than their concurrency, so that busy owners share
+    the threads in proportion to their weights. An owner that was idle starts
+    from the virtual time of the others, and does not catch up on the time it
+    was idle.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers if workers > 0 else min(32, (os.cpu_count() or 1) + 4)
+
+        self._owners: dict[str, _Owner] = {}
+        self._condition = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._shutdown = False
+
+        self._queued = 0
+        self._running = 0
+        self._virtual_time = 0.0
+
+        self.logger = get_logger(__name__)
+
+    def _start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"prefetcher-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_owner(self) -> Optional[_Owner]:
+        next_owner = None
+        for owner in self._owners.values():
+            if len(owner.tasks) == 0 or owner.running >= owner.concurrency:
+                continue
+            if next_owner is None or owner.virtual_time < next_owner.virtual_time:
+                next_owner = owner
+        return next_owner
+
+    def _next_task(self) -> Optional[tuple[_Owner, Callable, tuple]]:
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._shutdown or self._next_owner() is not None
+            )
+            if self._shutdown:
+                return None
+            owner = self._next_owner()
+            fn, args = owner.tasks.popleft()
+            owner.running += 1
+            self._queued -= 1
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, owner.virtual_time)
+            return owner, fn, args
+
+    def _work(self) -> None:
+        while True:
+            task = self._next_task()
+            if task is None:
+                break
+
+            owner, fn, args = task
+            start = time.perf_counter()
+            try:
+                fn(*args)
+            except Exception as e:
+                self.logger.exception(f"Error running prefetch task: {e}")
+            seconds = time.perf_counter() - start
+
+            with self._condition:
+                owner.running -= 1
+                owner.busy_seconds += seconds
+                owner.virtual_time += seconds / owner.weight
+                self._running -= 1
+                # the owner may be under its concurrency again, or removable
+                self._condition.notify_all()
+
+    def register(self, owner: str, weight: float = 1.0, concurrency: int = 1):
+        """Adds the owner, or updates its weight and concurrency."""
+        if weight <= 0:
+            raise ValueError("weight must be > 0")
+        with self._condition:
+            if owner in self._owners:
+                self._owners[owner].weight = weight
+                self._owners[owner].concurrency = max(1, concurrency)
+            else:
+                self._owners[owner] = _Owner(
+                    weight, max(1, concurrency), self._virtual_time
+                )
+            self._condition.notify_all()
+
+    def submit(self, owner: str, fn: Callable, *args, first: bool = False):
+        """Queues ``fn(*args)`` for the owner, in front of its other tasks if
+        ``first``. The tasks of an owner that is not registered are dropped."""
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Prefetch scheduler is shut down")
+            _owner = self._owners.get(owner)
+            if _owner is None:
+                return
+            if len(self._threads) == 0:
+                self._start()
+            if len(_owner.tasks) == 0 and _owner.running == 0:
+                _owner.virtual_time = max(_owner.virtual_time, self._virtual_time)
+            if first:
+                _owner.tasks.appendleft((fn, args))
+            else:
+                _owner.tasks.append((fn, args))
+            self._queued += 1
+            self._condition.notify_all()
+
+    def remove(self, owner: str, timeout: Optional[float] = None) -> bool:
+        """Drops the queued tasks of the owner and waits for its running ones.
+        Returns whether they finished within the timeout."""
+        with self._condition:
+            _owner = self._owners.get(owner)
+            if _owner is None:
+                return True
+            self._queued -= len(_owner.tasks)
+            _owner.tasks.clear()
+            del self._owners[owner]
+            return self._condition.wait_for(
+                lambda: _owner.running == 0, timeout=timeout
+            )
+
+    def stats(self) -> PrefetchSchedulerStats:
+        with self._condition:
+            return PrefetchSchedulerStats(
+                workers=self.workers,
+                queued=self._queued,
+                running=self._running,
+                owners={
+                    key: PrefetchOwnerStats(
+                        weight=owner.weight,
+                        queued=len(owner.tasks),
+                        running=owner.running,
+                        busy_seconds=owner.busy_seconds,
+                    )
+                    for key, owner in self._owners.items()
+                },
+            )
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._shutdown = True
+            for owner in self._owners.values():
+                owner.tasks.clear()
+            self._queued = 0
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
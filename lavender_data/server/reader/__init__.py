@@ -1,13 +1,21 @@
 import os
 import hashlib
+import threading
+import contextlib
 from typing import Annotated, Optional, Literal
 
 import numpy as np
 from fastapi import Depends
 from pydantic import BaseModel
 
+from lavender_data.logging import get_logger
 from lavender_data.server.settings import root_dir
 from lavender_data.shard import Reader
+from lavender_data.storage import scrub_files
+
+from .reader_cache import ReaderCache, ReaderCacheStats
+from .disk_cache import DiskCache, DiskCacheStats, DiskCacheIndexType
+from .lookahead import ShardLookahead, ShardLookaheadStats
 
 
 class ShardInfo(BaseModel):
@@ -58,11 +66,27 @@ class InnerJoinSampleInsufficient(Exception):
     pass
 
 
-class ServerSideReader:
-    reader_cache: dict[str, Reader] = {}
+class ReaderStats(BaseModel):
+    memory: ReaderCacheStats
+    disk: DiskCacheStats
+    lookahead: ShardLookaheadStats
+
 
-    def __init__(self, disk_cache_size: int, dirname: Optional[str] = None):
+class ServerSideReader:
+    def __init__(
+        self,
+        disk_cache_size: int,
+        memory_cache_size: int = 4 * 1024**3,
+        dirname: Optional[str] = None,
+        disk_cache_index: DiskCacheIndexType = "sqlite",
+        lookahead_workers: int = 4,
+        lookahead_start_rate: int = 0,
+        remote_read: bool = False,
+        scrub_interval: float = 0,
+    ):
         self.disk_cache_size = disk_cache_size
+        self.remote_read = remote_read
+        self.reader_cache = ReaderCache(memory_cache_size)
         if dirname is None:
             self.dirname = os.path.join(root_dir, ".cache")
         else:
@@ -73,61 +97,103 @@ class ServerSideReader:
         elif not os.path.isdir(self.dirname):
             raise ValueError(f"Failed to create cache directory {self.dirname}")
 
-    def _get_reader(self, shard: ShardInfo, uid_column_name: str, uid_column_type: str):
-        filepath = None
-        dirname = None
+        self.lookahead = ShardLookahead(
+            workers=lookahead_workers, start_rate=lookahead_start_rate
+        )
+        self.disk_cache = DiskCache(
+            self.dirname,
+            disk_cache_size,
+            index=disk_cache_index,
+            on_evicted=self.lookahead.forget,
+        )
+
+        self._scrub_stop_event = threading.Event()
+        self._scrub_thread: Optional[threading.Thread] = None
+        if scrub_interval > 0:
+            self._scrub_thread = threading.Thread(
+                target=self._keep_scrubbing, args=(scrub_interval,), daemon=True
+            )
+            self._scrub_thread.start()
+
+    def _keep_scrubbing(self, interval: float):
+        """Verifies the checksums of the downloaded shards in the background."""
+        while not self._scrub_stop_event.wait(interval):
+            try:
+                for filepath in scrub_files(self.dirname):
+                    self.disk_cache.remove(filepath)
+            except Exception as e:
+                get_logger(__name__).warning(f"Failed to scrub the disk cache: {e}")
+
+    def shutdown(self):
+        self.lookahead.shutdown()
+        self._scrub_stop_event.set()
+        if self._scrub_thread is not None:
+            self._scrub_thread.join()
+
+    def _get_uid_index_filepath(self, shard: ShardInfo) -> str:
+        return os.path.join(
+            self.dirname, "uid-index", f"{self._get_reader_cache_key(shard)}.npy"
+        )
 
+    def _get_shard_dirname(self, shard: ShardInfo) -> Optional[str]:
         if shard.location.startswith("file://"):
             # no need to copy/download
+            return None
+        return os.path.join(
+            self.dirname,
+            os.path.dirname(shard.location.replace("://", "/")),
+        )
+
+    def _get_cache_filepaths(self, shard: ShardInfo) -> list[str]:
+        """Files of the shard that are kept in the disk cache."""
+        filepaths = [self._get_uid_index_filepath(shard)]
+        dirname = self._get_shard_dirname(shard)
+        if dirname is not None:
+            filepaths.append(os.path.join(dirname, os.path.basename(shard.location)))
+        return filepaths
+
+    def _reads_remotely(self, shard: ShardInfo) -> bool:
+        """Whether the shard is read by byte ranges instead of being downloaded."""
+        return (
+            self.remote_read
+            and not shard.location.startswith("file://")
+            and Reader.is_remote_readable(shard.format)
+        )
+
+    def _ensure_dirname(self, dirname: str):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        elif not os.path.isdir(dirname):
+            raise ValueError(f"Failed to create directory {dirname}")
+
+    def _get_reader(self, shard: ShardInfo, uid_column_name: str, uid_column_type: str):
+        location = shard.location
+        filepath = None
+        dirname = self._get_shard_dirname(shard)
+
+        if dirname is None:
             filepath = shard.location.replace("file://", "")
         else:
-            # download
-            dirname = os.path.join(
-                self.dirname,
-                os.path.dirname(shard.location.replace("://", "/")),
-            )
-
-            if not os.path.exists(dirname):
-                os.makedirs(dirname, exist_ok=True)
-            elif not os.path.isdir(dirname):
-                raise ValueError(f"Failed to create directory {dirname}")
+            self._ensure_dirname(dirname)
+            downloaded = os.path.join(dirname, os.path.basename(shard.location))
+            if self.lookahead.wait(downloaded):
+                # downloaded ahead, read it as a local file
+                location = f"file://{downloaded}"
+                filepath = downloaded
+                dirname = None
 
         return Reader.get(
             format=shard.format,
-            location=shard.location,
+            location=location,
             columns=shard.columns,
             filepath=filepath,
             dirname=dirname,
             uid_column_name=uid_column_name,
             uid_column_type=uid_column_type,
+            uid_index_filepath=self._get_uid_index_filepath(shard),
+            remote=dirname is not None and self._reads_remotely(shard),
         )
 
-    def _get_cache_files(self):
-        return [
-            os.path.join(r, file)
-            for r, d, files in os.walk(self.dirname)
-            for file in files
-        ]
-
-    def _get_cache_size(self):
-        all_filesize = 0
-        for file in self._get_cache_files():
-            try:
-                # deleted during the loop
-                all_filesize += os.path.getsize(file)
-            except FileNotFoundError:
-                continue
-
-        return all_filesize
-
-    def _get_oldest_cache_file(self):
-        return min(self._get_cache_files(), key=os.path.getctime)
-
-    def _ensure_cache_size(self):
-        while self._get_cache_size() >= self.disk_cache_size:
-            oldest_file = self._get_oldest_cache_file()
-            os.remove(oldest_file)
-
     def _get_reader_cache_key(self, shard: ShardInfo):
         return hashlib.md5(
             str(
@@ -145,20 +211,91 @@ class ServerSideReader:
         self, shard: ShardInfo, uid_column_name: str, uid_column_type: str
     ) -> Reader:
         cache_key = self._get_reader_cache_key(shard)
-        if cache_key not in self.reader_cache:
-            self.reader_cache[cache_key] = self._get_reader(
-                shard, uid_column_name, uid_column_type
+        filepaths = self._get_cache_filepaths(shard)
+        reader = self.reader_cache.get(cache_key)
+        if reader is not None:
+            touched = [self.disk_cache.touch(filepath) for filepath in filepaths]
+            # the downloaded shard file comes last, local shards are not cached
+            if shard.location.startswith("file://") or reader.remote or touched[-1]:
+                return reader
+            # the shard file was evicted from the disk, download it again
+            self.reader_cache.pop(cache_key)
+            reader.clear(delete_files=False)
+
+        with self.disk_cache_pinned(shard):
+            reader = self.reader_cache.put(
+                cache_key, self._get_reader(shard, uid_column_name, uid_column_type)
             )
-            self._ensure_cache_size()
+            for filepath in filepaths:
+                self.disk_cache.record(filepath)
+            self.disk_cache.ensure_size()
+
+        return reader
 
-        return self.reader_cache[cache_key]
+    def prefetch(self, *shards: ShardInfo):
+        """Starts downloading the shards into the disk cache in the background."""
+        for shard in shards:
+            dirname = self._get_shard_dirname(shard)
+            if dirname is None or self._reads_remotely(shard):
+                continue
+            if self._get_reader_cache_key(shard) in self.reader_cache:
+                continue
+            self._ensure_dirname(dirname)
+            self.lookahead.submit(
+                shard.location,
+                os.path.join(dirname, os.path.basename(shard.location)),
+                shard.filesize,
+                on_downloaded=self._on_prefetched,
+            )
+
+    def _on_prefetched(self, filepath: str):
+        self.disk_cache.record(filepath)
+        self.disk_cache.ensure_size()
+
+    @contextlib.contextmanager
+    def disk_cache_pinned(self, *shards: ShardInfo):
+        """Keeps the files of the shards from being evicted from the disk."""
+        filepaths = [
+            filepath
+            for shard in shards
+            for filepath in self._get_cache_filepaths(shard)
+        ]
+        for filepath in filepaths:
+            self.disk_cache.pin(filepath)
+        try:
+            yield
+        finally:
+            for filepath in filepaths:
+                self.disk_cache.unpin(filepath)
+
+    @contextlib.contextmanager
+    def pinned(self, *shards: ShardInfo):
+        """Keeps the readers of the shards from being evicted from memory and
+        their files from the disk."""
+        cache_keys = [self._get_reader_cache_key(shard) for shard in shards]
+        for cache_key in cache_keys:
+            self.reader_cache.pin(cache_key)
+        try:
+            with self.disk_cache_pinned(*shards):
+                yield
+        finally:
+            for cache_key in cache_keys:
+                self.reader_cache.unpin(cache_key)
 
     def clear_cache(self, *shards: list[ShardInfo]):
         for shard in shards:
-            cache_key = self._get_reader_cache_key(shard)
-            if cache_key in self.reader_cache:
-                self.reader_cache[cache_key].clear()
-                del self.reader_cache[cache_key]
+            reader = self.reader_cache.pop(self._get_reader_cache_key(shard))
+            if reader is not None:
+                reader.clear()
+            for filepath in self._get_cache_filepaths(shard):
+                self.disk_cache.remove(filepath)
+
+    def stats(self) -> ReaderStats:
+        return ReaderStats(
+            memory=self.reader_cache.stats(),
+            disk=self.disk_cache.stats(),
+            lookahead=self.lookahead.stats(),
+        )
 
     def _get_sample(
         self,
@@ -215,7 +352,8 @@ class ServerSideReader:
         join: JoinMethod = "inner",
     ):
         try:
-            return self._get_sample(index, join)
+            with self.pinned(index.main_shard, *index.feature_shards):
+                return self._get_sample(index, join)
         except InnerJoinSampleInsufficient:
             raise
         except Exception as e:
@@ -226,9 +364,30 @@ class ServerSideReader:
 reader = None
 
 
-def setup_reader(disk_cache_size: int):
+def setup_reader(
+    disk_cache_size: int,
+    memory_cache_size: int,
+    disk_cache_index: DiskCacheIndexType = "sqlite",
+    lookahead_workers: int = 4,
+    lookahead_start_rate: int = 0,
+    remote_read: bool = False,
+    scrub_interval: float = 0,
+):
     global reader
-    reader = ServerSideReader(disk_cache_size=disk_cache_size)
+    reader = ServerSideReader(
+        disk_cache_size=disk_cache_size,
+        memory_cache_size=memory_cache_size,
+        disk_cache_index=disk_cache_index,
+        lookahead_workers=lookahead_workers,
+        lookahead_start_rate=lookahead_start_rate,
+        remote_read=remote_read,
+        scrub_interval=scrub_interval,
+    )
+
+
+def shutdown_reader():
+    if reader is not None:
+        reader.shutdown()
 
 
 def get_reader_instance():
@@ -0,0 +1,447 @@
+import os
+import time
+import heapq
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Literal, Optional
+
+from pydantic import BaseModel
+
+from lavender_data.logging import get_logger
+from lavender_data.storage import file_lock
+from lavender_data.storage.validation import remove_validation_record
+
+DiskCacheIndexType = Literal["memory", "sqlite"]
+
+# files of the disk cache itself, never indexed nor evicted
+_reserved_prefix = ".disk-cache"
+
+
+class DiskCacheStats(BaseModel):
+    index: DiskCacheIndexType
+    capacity: int
+    size: int
+    files: int
+    pinned: int
+    evictions: int
+
+
+class DiskCacheIndex(ABC):
+    """Size and last access time of the files in the disk cache."""
+
+    @abstractmethod
+    def record(self, path: str, size: int, atime: float) -> None: ...
+
+    @abstractmethod
+    def touch(self, path: str, atime: float) -> bool:
+        """Updates the access time. Returns False if the file is not indexed."""
+        ...
+
+    @abstractmethod
+    def remove(self, path: str) -> None: ...
+
+    @abstractmethod
+    def pop_oldest(self, exclude: set[str]) -> Optional[str]:
+        """Removes the least recently accessed file that is not in ``exclude``
+        from the index and returns its path."""
+        ...
+
+    @abstractmethod
+    def pin(self, path: str) -> None: ...
+
+    @abstractmethod
+    def unpin(self, path: str) -> None: ...
+
+    @abstractmethod
+    def pinned(self) -> set[str]: ...
+
+    @abstractmethod
+    def size(self) -> int: ...
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def is_empty(self) -> bool: ...
+
+
+class InMemoryDiskCacheIndex(DiskCacheIndex):
+    """Keeps the index in a dict and a heap ordered by access time.
+
+    Stale heap entries (touched or removed files) are skipped lazily when
+    popping, so every operation is O(log n). Only this process sees the
+    index; pins of other processes are not known.
+    """
+
+    def __init__(self):
+        self._files: dict[str, tuple[int, float]] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._size = 0
+        self._pins: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: str, size: int, atime: float) -> None:
+        with self._lock:
+            if path in self._files:
+                self._size -= self._files[path][0]
+            self._files[path] = (size, atime)
+            self._size += size
+            heapq.heappush(self._heap, (atime, path))
+
+    def touch(self, path: str, atime: float) -> bool:
+        with self._lock:
+            if path not in self._files:
+                return False
+            size, _ = self._files[path]
+            self._files[path] = (size, atime)
+            heapq.heappush(self._heap, (atime, path))
+            if len(self._heap) > 2 * len(self._files) + 1024:
+                # drop the stale entries
+                self._heap = [(t, p) for p, (_, t) in self._files.items()]
+                heapq.heapify(self._heap)
+            return True
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            entry = self._files.pop(path, None)
+            if entry is not None:
+                self._size -= entry[0]
+
+    def pop_oldest(self, exclude: set[str]) -> Optional[str]:
+        with self._lock:
+            skipped = []
+            found = None
+            while self._heap:
+                atime, path = heapq.heappop(self._heap)
+                entry = self._files.get(path)
+                if entry is None or entry[1] != atime:
+                    # removed or touched since pushed
+                    continue
+                if path in exclude:
+                    skipped.append((atime, path))
+                    continue
+                found = path
+                break
+
+            for item in skipped:
+                heapq.heappush(self._heap, item)
+
+            if found is not None:
+                self._size -= self._files.pop(found)[0]
+            return found
+
+    def pin(self, path: str) -> None:
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def unpin(self, path: str) -> None:
+        with self._lock:
+            pins = self._pins.get(path, 0) - 1
+            if pins > 0:
+                self._pins[path] = pins
+            else:
+                self._pins.pop(path, None)
+
+    def pinned(self) -> set[str]:
+        with self._lock:
+            return set(self._pins.keys())
+
+    def size(self) -> int:
+        return self._size
+
+    def count(self) -> int:
+        return len(self._files)
+
+    def is_empty(self) -> bool:
+        return len(self._files) == 0
+
+
+class SqliteDiskCacheIndex(DiskCacheIndex):
+    """Keeps the index in a SQLite database next to the cached files.
+
+    The index survives restarts and is shared by all processes using the
+    same cache directory, including their pins. The total size is kept up to
+    date by triggers so that it is never summed over all files.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._conn = sqlite3.connect(
+            filepath, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._local_pins: dict[str, int] = {}
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                BEGIN;
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    atime REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS files_atime ON files (atime);
+                CREATE TABLE IF NOT EXISTS total (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    size INTEGER NOT NULL,
+                    count INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO total (id, size, count) VALUES (0, 0, 0);
+                CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files
+                BEGIN
+                    UPDATE total SET size = size + NEW.size, count = count + 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files
+                BEGIN
+                    UPDATE total SET size = size - OLD.size, count = count - 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE OF size ON files
+                BEGIN
+                    UPDATE total SET size = size - OLD.size + NEW.size;
+                END;
+                CREATE TABLE IF NOT EXISTS pins (
+                    path TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    PRIMARY KEY (path, pid)
+                );
+                COMMIT;
+                """
+            )
+
+    def _execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def record(self, path: str, size: int, atime: float) -> None:
+        self._execute(
+            "INSERT INTO files (path, size, atime) VALUES (?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET size = excluded.size, atime = excluded.atime",
+            (path, size, atime),
+        )
+
+    def touch(self, path: str, atime: float) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE files SET atime = ? WHERE path = ?", (atime, path)
+            )
+            return cursor.rowcount > 0
+
+    def remove(self, path: str) -> None:
+        self._execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def pop_oldest(self, exclude: set[str]) -> Optional[str]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                found = None
+                for (path,) in self._conn.execute(
+                    "SELECT path FROM files ORDER BY atime LIMIT ?",
+                    (len(exclude) + 1,),
+                ):
+                    if path not in exclude:
+                        found = path
+                        break
+                if found is not None:
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (found,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return found
+
+    def pin(self, path: str) -> None:
+        # only the first pin of this process is written to the database
+        with self._lock:
+            pins = self._local_pins.get(path, 0)
+            self._local_pins[path] = pins + 1
+            if pins == 0:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pins (path, pid) VALUES (?, ?)",
+                    (path, os.getpid()),
+                )
+
+    def unpin(self, path: str) -> None:
+        with self._lock:
+            pins = self._local_pins.get(path, 0) - 1
+            if pins > 0:
+                self._local_pins[path] = pins
+                return
+            self._local_pins.pop(path, None)
+            self._conn.execute(
+                "DELETE FROM pins WHERE path = ? AND pid = ?", (path, os.getpid())
+            )
+
+    def pinned(self) -> set[str]:
+        rows = self._execute("SELECT path, pid FROM pins")
+        # each process is checked once, not once for each of its pins
+        alive = {
+            pid: pid == os.getpid() or _is_process_alive(pid)
+            for pid in {pid for _, pid in rows}
+        }
+
+        # pins left by processes that exited without unpinning
+        for pid, is_alive in alive.items():
+            if not is_alive:
+                self._execute("DELETE FROM pins WHERE pid = ?", (pid,))
+        return {path for path, pid in rows if alive[pid]}
+
+    def size(self) -> int:
+        return self._execute("SELECT size FROM total WHERE id = 0")[0][0]
+
+    def count(self) -> int:
+        return self._execute("SELECT count FROM total WHERE id = 0")[0][0]
+
+    def is_empty(self) -> bool:
+        return self.count() == 0
+
+
+def _is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DiskCache:
+    """Keeps the files under ``dirname`` within ``capacity`` bytes.
+
+    Files are evicted in least recently accessed order, using the index
+    instead of scanning the directory. Pinned files are never evicted.
+    Eviction holds a file lock so that processes sharing the directory do
+    not evict at the same time. Use the ``sqlite`` index when they do, so
+    that they also share the access times and pins. ``on_evicted`` is called
+    with the path of each evicted file.
+    """
+
+    touch_interval: float = 1.0
+
+    def __init__(
+        self,
+        dirname: str,
+        capacity: int,
+        index: DiskCacheIndexType = "memory",
+        on_evicted: Optional[Callable[[str], None]] = None,
+    ):
+        self.dirname = dirname
+        self.capacity = capacity
+        self.index_type = index
+        self.on_evicted = on_evicted
+        self.evictions = 0
+
+        if index == "sqlite":
+            self.index: DiskCacheIndex = SqliteDiskCacheIndex(
+                os.path.join(dirname, f"{_reserved_prefix}.db")
+            )
+        elif index == "memory":
+            self.index = InMemoryDiskCacheIndex()
+        else:
+            raise ValueError(f"Invalid disk cache index: {index}")
+
+        self._lock_filepath = os.path.join(dirname, f"{_reserved_prefix}.lock")
+        # bounded by the number of indexed files, the files evicted by other
+        # processes are never popped explicitly
+        self._last_touched: OrderedDict[str, float] = OrderedDict()
+
+        with file_lock(self._lock_filepath):
+            if self.index.is_empty():
+                self._scan()
+
+    def _scan(self):
+        # only once on startup, to pick up the files cached by previous runs
+        for root, _, files in os.walk(self.dirname):
+            for file in files:
+                # the index, locks and partial downloads
+                if file.startswith("."):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                self.index.record(path, stat.st_size, stat.st_atime)
+
+    def record(self, path: str) -> bool:
+        """Adds a file that was written to the cache. Returns False if it does not exist."""
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        self.index.record(path, size, now)
+        self._set_last_touched(path, now)
+        return True
+
+    def touch(self, path: str) -> bool:
+        """Marks a file as accessed.
+
+        Returns False if the file is not in the cache anymore (e.g. evicted
+        by another process). Files that exist but are not indexed yet are
+        recorded.
+        """
+        now = time.time()
+        if now - self._last_touched.get(path, 0) < self.touch_interval:
+            return True
+
+        if self.index.touch(path, now):
+            self._set_last_touched(path, now)
+            return True
+        return self.record(path)
+
+    def _set_last_touched(self, path: str, atime: float) -> None:
+        self._last_touched[path] = atime
+        self._last_touched.move_to_end(path)
+        count = max(self.index.count(), 1)
+        while len(self._last_touched) > count:
+            self._last_touched.popitem(last=False)
+
+    def remove(self, path: str) -> None:
+        self.index.remove(path)
+        self._last_touched.pop(path, None)
+
+    def pin(self, path: str) -> None:
+        self.index.pin(path)
+
+    def unpin(self, path: str) -> None:
+        self.index.unpin(path)
+
+    def ensure_size(self) -> None:
+        if self.index.size() <= self.capacity:
+            return
+
+        with file_lock(self._lock_filepath):
+            pinned = self.index.pinned()
+            while self.index.size() > self.capacity:
+                path = self.index.pop_oldest(exclude=pinned)
+                if path is None:
+                    get_logger(__name__).warning(
+                        f"Disk cache is over capacity ({self.index.size()} > {self.capacity} bytes) "
+                        "but all files are in use"
+                    )
+                    break
+
+                self._last_touched.pop(path, None)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                remove_validation_record(path)
+                self.evictions += 1
+                if self.on_evicted is not None:
+                    self.on_evicted(path)
+
+    def stats(self) -> DiskCacheStats:
+        return DiskCacheStats(
+            index=self.index_type,
+            capacity=self.capacity,
+            size=self.index.size(),
+            files=self.index.count(),
+            pinned=len(self.index.pinned()),
+            evictions=self.evictions,
+        )
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+from lavender_data.logging import get_logger
+from lavender_data.storage import download_file
+
+
+class ShardLookaheadStats(BaseModel):
+    workers: int
+    start_rate: int
+    inflight: int
+    downloaded: int
+    downloaded_bytes: int
+    failed: int
+    hits: int
+
+
+class _DownloadPacer:
+    """Delays the start of each download so that the downloads started add
+    up to at most ``start_rate`` bytes per second on average. This is not a
+    bandwidth limit: each transfer runs at full speed once started, and so
+    may the ones running at the same time."""
+
+    def __init__(self, start_rate: int):
+        self.start_rate = start_rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> None:
+        if self.start_rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + nbytes / self.start_rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class ShardLookahead:
+    """Downloads shards into the disk cache before they are read.
+
+    Downloads run in the background on at most ``workers`` threads, and
+    the downloads started add up to at most ``start_rate`` bytes per second
+    on average (0 for no limit). A reader that needs a shard being downloaded waits for it
+    instead of downloading it again. At most ``max_downloaded`` downloaded
+    shards that were not read yet are remembered.
+    """
+
+    max_downloaded: int = 1024
+
+    def __init__(self, workers: int = 4, start_rate: int = 0):
+        self.workers = workers
+        self.start_rate = start_rate
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pacer = _DownloadPacer(start_rate)
+        self._inflight: dict[str, Future] = {}
+        # insertion ordered, so that the oldest are forgotten first
+        self._downloaded: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.downloaded = 0
+        self.downloaded_bytes = 0
+        self.failed = 0
+        self.hits = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="shard-lookahead"
+            )
+        return self._executor
+
+    def _download(
+        self,
+        location: str,
+        filepath: str,
+        filesize: int,
+        on_downloaded: Optional[Callable[[str], None]],
+    ) -> bool:
+        try:
+            self._pacer.acquire(filesize)
+            download_file(location, filepath, warn_on_retry=False)
+        except Exception as e:
+            get_logger(__name__).warning(f"Failed to download {location} ahead: {e}")
+            with self._lock:
+                self.failed += 1
+                self._inflight.pop(filepath, None)
+            return False
+
+        with self._lock:
+            self.downloaded += 1
+            self.downloaded_bytes += filesize
+            self._downloaded[filepath] = None
+            while len(self._downloaded) > self.max_downloaded:
+                self._downloaded.popitem(last=False)
+            self._inflight.pop(filepath, None)
+
+        if on_downloaded is not None:
+            on_downloaded(filepath)
+        return True
+
+    def submit(
+        self,
+        location: str,
+        filepath: str,
+        filesize: int,
+        on_downloaded: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        if self.workers <= 0:
+            return
+
+        with self._lock:
+            if filepath in self._inflight:
+                return
+            if os.path.exists(filepath):
+                # already cached
+                return
+            # downloaded before, but evicted without being read
+            self._downloaded.pop(filepath, None)
+            self._inflight[filepath] = self._get_executor().submit(
+                self._download, location, filepath, filesize, on_downloaded
+            )
+
+    def wait(self, filepath: str) -> bool:
+        """Waits for the download of ``filepath`` if any.
+
+        Returns True if the file was downloaded ahead and is ready to read.
+        """
+        with self._lock:
+            future = self._inflight.get(filepath)
+        if future is not None:
+            try:
+                future.result()
+            except CancelledError:
+                return False
+
+        with self._lock:
+            if filepath not in self._downloaded:
+                return False
+            del self._downloaded[filepath]
+            if not os.path.exists(filepath):
+                # evicted before being read
+                return False
+            self.hits += 1
+            return True
+
+    def forget(self, filepath: str) -> None:
+        """Drops the downloaded shard, which was evicted from the disk."""
+        with self._lock:
+            self._downloaded.pop(filepath, None)
+
+    def stats(self) -> ShardLookaheadStats:
+        with self._lock:
+            return ShardLookaheadStats(
+                workers=self.workers,
+                start_rate=self.start_rate,
+                inflight=len(self._inflight),
+                downloaded=self.downloaded,
+                downloaded_bytes=self.downloaded_bytes,
+                failed=self.failed,
+                hits=self.hits,
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
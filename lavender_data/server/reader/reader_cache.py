@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from pydantic import BaseModel
+
+from lavender_data.logging import get_logger
+from lavender_data.shard import Reader
+
+
+class ReaderCacheStats(BaseModel):
+    capacity: int
+    size: int
+    readers: int
+    pinned: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class ReaderCache:
+    """Keeps loaded readers in memory up to ``capacity`` bytes.
+
+    The size of each reader is its estimated decoded size
+    (:meth:`Reader.memory_usage`). When the total goes over the capacity,
+    the least recently used readers that are not pinned are cleared and
+    dropped. The shard files are kept on disk so that they can be read again
+    without downloading.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+
+        self._readers: OrderedDict[str, Reader] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._size = 0
+        self._pins: dict[str, int] = {}
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._readers
+
+    def get(self, key: str) -> Optional[Reader]:
+        with self._lock:
+            reader = self._readers.get(key)
+            if reader is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._readers.move_to_end(key)
+            # the reader may have grown since it was put (e.g. lazily loaded)
+            self._refresh(key)
+            self._evict(keep=key)
+            return reader
+
+    def put(self, key: str, reader: Reader) -> Reader:
+        with self._lock:
+            # another thread created the same reader in the meantime
+            if key in self._readers:
+                return self._readers[key]
+
+            self._readers[key] = reader
+            self._refresh(key)
+            self._evict(keep=key)
+            return reader
+
+    def pop(self, key: str) -> Optional[Reader]:
+        with self._lock:
+            self._size -= self._sizes.pop(key, 0)
+            return self._readers.pop(key, None)
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            pins = self._pins.get(key, 0) - 1
+            if pins > 0:
+                self._pins[key] = pins
+            else:
+                self._pins.pop(key, None)
+
+            if key in self._readers:
+                self._refresh(key)
+            self._evict()
+
+    def size(self) -> int:
+        return self._size
+
+    def stats(self) -> ReaderCacheStats:
+        with self._lock:
+            return ReaderCacheStats(
+                capacity=self.capacity,
+                size=self.size(),
+                readers=len(self._readers),
+                pinned=len([k for k in self._pins if k in self._readers]),
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
+
+    def _refresh(self, key: str) -> None:
+        size = self._readers[key].memory_usage()
+        self._size += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        if self._size <= self.capacity:
+            return
+
+        for key in list(self._readers.keys()):
+            if self._size <= self.capacity:
+                break
+            if key == keep or self._pins.get(key, 0) > 0:
+                continue
+
+            reader = self._readers.pop(key)
+            self._size -= self._sizes.pop(key)
+            try:
+                reader.clear(delete_files=False)
+            except Exception as e:
+                get_logger(__name__).warning(f"Failed to clear reader {key}: {e}")
+            self.evictions += 1
@@ -2,6 +2,8 @@ import inspect
 import hashlib
 from abc import ABC
 from typing import Optional
+
+import numpy as np
 from typing_extensions import Generic, TypeVar
 
 from pydantic import BaseModel
@@ -24,6 +26,45 @@ def _get_md5(_class: type[T]) -> str:
     return hashlib.md5(source.encode()).hexdigest()
 
 
+def _to_column(values: list) -> np.ndarray:
+    try:
+        column = np.asarray(values)
+    except ValueError:
+        # nested sequences of different lengths
+        column = None
+    if (
+        column is None
+        or column.ndim != 1
+        # numbers would be turned into strings
+        or (column.dtype.kind == "U" and not all(isinstance(v, str) for v in values))
+    ):
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+    return column
+
+
+def to_columns(samples: list[dict]) -> dict[str, np.ndarray]:
+    """Turns samples into a batch of columns, one 1-d NumPy array for each
+    key. Columns of numbers, booleans or strings get their NumPy dtype, the
+    others (None included, or nested values) are of the object dtype."""
+    if len(samples) == 0:
+        return {}
+    return {
+        k: _to_column([sample.get(k) for sample in samples]) for k in samples[0].keys()
+    }
+
+
+def to_rows(batch: dict[str, np.ndarray]) -> list[dict]:
+    """Turns a batch of columns back into samples of Python values."""
+    if len(batch) == 0:
+        return []
+    columns = {
+        k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in batch.items()
+    }
+    size = len(next(iter(columns.values())))
+    return [{k: v[i] for k, v in columns.items()} for i in range(size)]
+
+
 class Registry(ABC, Generic[T]):
     def __init_subclass__(cls):
         cls._classes: dict[str, type[T]] = {}
@@ -13,5 +13,5 @@ class DefaultCollater(Collater):
             }
         self.default_collate = default_collate
 
-    def collate(self, samples: list[dict]) -> dict:
+    def collate(self, samples: list[dict], **kwargs) -> dict:
         return self.default_collate(samples)
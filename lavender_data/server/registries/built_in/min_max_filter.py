@@ -1,5 +1,9 @@
+import math
 from typing import Optional
 
+import numpy as np
+
+from lavender_data.shard import ShardStatistics
 from lavender_data.server.registries.filter import Filter
 
 
@@ -24,3 +28,72 @@ class MinMaxFilter(Filter):
         if max_value is not None and value >= float(max_value):
             return False
         return True
+
+    def filter_batch(
+        self,
+        batch: dict[str, np.ndarray],
+        *,
+        column: str,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+    ) -> np.ndarray:
+        if column not in batch:
+            size = len(next(iter(batch.values()), []))
+            return np.zeros(size, dtype=bool)
+
+        try:
+            values = np.asarray(batch[column], dtype=np.float64)
+        except (ValueError, TypeError):
+            values = None
+        if values is None or values.ndim != 1:
+            # some of the values are not numbers
+            return super().filter_batch(
+                batch, column=column, min_value=min_value, max_value=max_value
+            )
+
+        # None becomes nan, which passes the bounds, but is rejected by filter
+        mask = np.array([v is not None for v in batch[column]], dtype=bool)
+        if min_value is not None:
+            mask &= ~(values <= float(min_value))
+        if max_value is not None:
+            mask &= ~(values >= float(max_value))
+        return mask
+
+    def prune_shard(
+        self,
+        statistics: ShardStatistics,
+        columns: dict[str, str],
+        *,
+        column: str,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+    ) -> bool:
+        # the statistics of the other columns are of the lengths of the values
+        if not columns.get(column, "").startswith(("int", "float", "double")):
+            return False
+
+        column_statistics = statistics.get(column)
+        # nan passes the filter while null does not, they are counted together
+        if column_statistics is None or column_statistics["nan_count"] > 0:
+            return False
+
+        if column_statistics["type"] == "numeric":
+            if column_statistics["count"] == 0:
+                return False
+            lowest = column_statistics["min"]
+            highest = column_statistics["max"]
+        else:
+            try:
+                values = [float(v) for v in column_statistics["frequencies"].keys()]
+            except ValueError:
+                return False
+            if len(values) == 0 or any(math.isnan(v) for v in values):
+                return False
+            lowest = min(values)
+            highest = max(values)
+
+        if min_value is not None and highest <= float(min_value):
+            return True
+        if max_value is not None and lowest >= float(max_value):
+            return True
+        return False
@@ -0,0 +1,75 @@
+import numpy as np
+
+from lavender_data.server.registries.collater import Collater
+
+
+class PackingCollater(Collater):
+    """Packs the token sequences of ``column`` into rows of ``max_length``
+    tokens, each sequence into the first row it fits in. A sequence longer
+    than a row is split into sequences of ``max_length`` tokens.
+
+    ``position_ids`` restart at 0 for each sequence and ``segment_ids``
+    number the sequences of a row from 1, with 0 for the padding. The other
+    columns are returned as lists of the values of the samples."""
+
+    name = "packing"
+
+    def collate(
+        self,
+        samples: list[dict],
+        *,
+        max_length: int,
+        column: str = "input_ids",
+        pad_token_id: int = 0,
+    ) -> dict:
+        if max_length < 1:
+            raise ValueError("max_length must be a positive integer")
+
+        sequences = [np.asarray(sample[column]).reshape(-1) for sample in samples]
+        dtypes = [s.dtype for s in sequences if len(s) > 0]
+        dtype = np.result_type(*dtypes) if len(dtypes) > 0 else np.dtype(np.int64)
+        if dtype.kind not in "iu":
+            raise ValueError(f'Column "{column}" must hold sequences of token ids')
+
+        segments = [
+            sequence[start : start + max_length]
+            for sequence in sequences
+            for start in range(0, len(sequence), max_length)
+        ]
+
+        # the room left in each row, as many rows as segments at most
+        room = np.empty(len(segments), dtype=np.int64)
+        rows = 0
+        placements: list[tuple[int, int]] = []
+        for segment in segments:
+            fits = np.flatnonzero(room[:rows] >= len(segment))
+            if len(fits) > 0:
+                row = int(fits[0])
+            else:
+                row = rows
+                room[row] = max_length
+                rows += 1
+            placements.append((row, max_length - int(room[row])))
+            room[row] -= len(segment)
+
+        tokens = np.full((rows, max_length), pad_token_id, dtype=dtype)
+        position_ids = np.zeros((rows, max_length), dtype=np.int64)
+        segment_ids = np.zeros((rows, max_length), dtype=np.int32)
+        segment_counts = np.zeros(rows, dtype=np.int32)
+        positions = np.arange(max_length, dtype=np.int64)
+        for segment, (row, offset) in zip(segments, placements):
+            end = offset + len(segment)
+            segment_counts[row] += 1
+            tokens[row, offset:end] = segment
+            position_ids[row, offset:end] = positions[: len(segment)]
+            segment_ids[row, offset:end] = segment_counts[row]
+
+        batch = {
+            k: [sample[k] for sample in samples]
+            for k in samples[0].keys()
+            if k != column
+        }
+        batch[column] = tokens
+        batch["position_ids"] = position_ids
+        batch["segment_ids"] = segment_ids
+        return batch
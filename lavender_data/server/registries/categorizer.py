@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 
-from .abc import Registry
+import numpy as np
+
+from .abc import Registry, to_rows
 
 
 class CategorizerRegistry(Registry["Categorizer"]):
@@ -18,3 +20,10 @@ class Categorizer(ABC):
     @abstractmethod
     def categorize(self, sample: dict, **kwargs) -> str:
         raise NotImplementedError
+
+    def categorize_batch(self, batch: dict[str, np.ndarray], **kwargs) -> list[str]:
+        """Categorizes a batch of samples given as columns at once, and
+        returns the bucket of each sample. The columns are as in
+        ``Filter.filter_batch``. Override it to categorize with array
+        operations, by default ``categorize`` is called for each sample."""
+        return [self.categorize(sample, **kwargs) for sample in to_rows(batch)]
@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
 
-from .abc import Registry
+import numpy as np
+
+from lavender_data.shard import ShardStatistics
+
+from .abc import Registry, to_rows
 
 
 class FilterRegistry(Registry["Filter"]):
@@ -18,3 +22,22 @@ class Filter(ABC):
     @abstractmethod
     def filter(self, sample: dict, **kwargs) -> bool:
         raise NotImplementedError
+
+    def filter_batch(self, batch: dict[str, np.ndarray], **kwargs) -> np.ndarray:
+        """Filters a batch of samples given as columns at once, and returns
+        a boolean mask of the samples to keep. Each column is a 1-d NumPy
+        array, of the object dtype unless its values are all numbers,
+        booleans or strings. Override it to filter with array operations,
+        by default ``filter`` is called for each sample."""
+        return np.array(
+            [self.filter(sample, **kwargs) for sample in to_rows(batch)], dtype=bool
+        )
+
+    def prune_shard(
+        self, statistics: ShardStatistics, columns: dict[str, str], **kwargs
+    ) -> bool:
+        """Whether none of the samples of a shard can pass the filter, judged
+        from the ``statistics`` of its columns and the types of ``columns``.
+        The shards it returns True for are skipped without being read, so it
+        must only do so when it is certain. Never prunes by default."""
+        return False
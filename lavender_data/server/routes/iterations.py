@@ -23,12 +23,13 @@ from lavender_data.server.db.models import (
     IterationCategorizer,
     IterationCollater,
     IterationPreprocessor,
+    IterationMixtureComponent,
 )
 from lavender_data.server.distributed import CurrentCluster
 from lavender_data.server.reader import ReaderInstance
 from lavender_data.server.dataset import refine_sample_previewable
 from lavender_data.server.iteration import (
-    IterationState,
+    open_iteration_state,
     CurrentIterationState,
     Progress,
     ProcessNextSamplesException,
@@ -38,6 +39,10 @@ from lavender_data.server.iteration import (
     get_iteration_id_from_hash,
     CurrentIterationPrefetcherPool,
     CurrentIterationPrefetcher,
+    CurrentPreprocessorExecutor,
+    PreprocessorExecutorStats,
+    PrefetcherRankStats,
+    PrefetchSchedulerStats,
     NotFetchedYet,
 )
 from lavender_data.server.registries import (
@@ -73,6 +78,20 @@ def get_iterations(
     return session.exec(query).all()
 
 
+@router.get("/preprocessor-stats")
+def get_preprocessor_stats(
+    executor: CurrentPreprocessorExecutor,
+) -> PreprocessorExecutorStats:
+    return executor.stats()
+
+
+@router.get("/prefetch-scheduler-stats")
+def get_prefetch_scheduler_stats(
+    prefetcher_pool: CurrentIterationPrefetcherPool,
+) -> PrefetchSchedulerStats:
+    return prefetcher_pool.scheduler.stats()
+
+
 class CreateIterationParams(BaseModel):
     dataset_id: str
     shardsets: Optional[list[str]] = None
@@ -81,12 +100,18 @@ class CreateIterationParams(BaseModel):
     categorizer: Optional[IterationCategorizer] = None
     collater: Optional[IterationCollater] = None
     preprocessors: Optional[list[IterationPreprocessor]] = None
+    mixture: Optional[list[IterationMixtureComponent]] = None
 
     shuffle: Optional[bool] = None
     shuffle_seed: Optional[int] = None
     shuffle_block_size: Optional[int] = None
+    shuffle_mode: Optional[str] = None
+    shuffle_buffer_size: Optional[int] = None
 
     batch_size: Optional[int] = None
+    batch_token_budget: Optional[int] = None
+    batch_length_column: Optional[str] = None
+    batch_window_size: Optional[int] = None
 
     replication_pg: Optional[list[list[int]]] = None
     rank: Optional[int] = None
@@ -97,9 +122,34 @@ class CreateIterationParams(BaseModel):
     max_retry_count: Optional[int] = None
     num_workers: Optional[int] = None
     prefetch_factor: Optional[int] = None
+    prefetch_autotune: Optional[bool] = None
+    prefetch_priority: Optional[float] = None
     in_order: Optional[bool] = None
 
 
+def _get_shardsets(
+    session: DbSession, dataset_id: str, shardset_ids: Optional[list[str]]
+) -> list[Shardset]:
+    shardsets_query = select(Shardset).where(Shardset.dataset_id == dataset_id)
+    if shardset_ids is not None and len(shardset_ids) > 0:
+        shardsets_query = shardsets_query.where(col(Shardset.id).in_(shardset_ids))
+    shardsets = session.exec(shardsets_query).all()
+
+    if len(shardsets) == 0:
+        if shardset_ids is not None and len(shardset_ids) > 0:
+            raise HTTPException(
+                status_code=400,
+                detail="No shardsets found for the provided shardset ids: "
+                + ", ".join(shardset_ids),
+            )
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail="No shardsets found for the dataset. Please create a shardset first.",
+            )
+    return list(shardsets)
+
+
 @router.post("/")
 def create_iteration(
     params: CreateIterationParams,
@@ -129,13 +179,68 @@ def create_iteration(
                 status_code=400,
                 detail="shuffle_block_size must be a positive integer",
             )
+        if params.shuffle_mode not in (None, "block", "permutation", "buffer"):
+            raise HTTPException(
+                status_code=400,
+                detail='shuffle_mode must be one of the following: ["block", "permutation", "buffer"]',
+            )
+        if params.shuffle_mode == "buffer":
+            if params.shuffle_buffer_size is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail='shuffle_buffer_size is required if shuffle_mode is "buffer"',
+                )
+            if params.shuffle_buffer_size < 1:
+                raise HTTPException(
+                    status_code=400,
+                    detail="shuffle_buffer_size must be a positive integer",
+                )
+        else:
+            params.shuffle_buffer_size = None
     else:
         params.shuffle_seed = None
         params.shuffle_block_size = None
+        params.shuffle_mode = None
+        params.shuffle_buffer_size = None
 
     if batch_size < 0:
         raise HTTPException(status_code=400, detail="batch_size must be >= 0")
 
+    if params.prefetch_priority is not None and params.prefetch_priority <= 0:
+        raise HTTPException(status_code=400, detail="prefetch_priority must be > 0")
+
+    if params.batch_token_budget is not None:
+        if params.batch_token_budget < 1:
+            raise HTTPException(
+                status_code=400,
+                detail="batch_token_budget must be a positive integer",
+            )
+        if params.batch_length_column is None:
+            raise HTTPException(
+                status_code=400,
+                detail="batch_length_column is required if batch_token_budget is set",
+            )
+        if batch_size < 1:
+            raise HTTPException(
+                status_code=400,
+                detail="batch_size is required if batch_token_budget is set",
+            )
+        if params.categorizer is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="batch_token_budget cannot be used with a categorizer",
+            )
+        if params.batch_window_size is None:
+            params.batch_window_size = batch_size * 8
+        if params.batch_window_size < 1:
+            raise HTTPException(
+                status_code=400,
+                detail="batch_window_size must be a positive integer",
+            )
+    else:
+        params.batch_length_column = None
+        params.batch_window_size = None
+
     if params.filters is not None:
         for f in params.filters:
             if f["name"] not in FilterRegistry.all():
@@ -174,31 +279,56 @@ def create_iteration(
                     + "]",
                 )
 
+    if params.mixture is not None:
+        if len(params.mixture) == 0:
+            raise HTTPException(
+                status_code=400,
+                detail="mixture must have at least one component",
+            )
+        for component in params.mixture:
+            if component["weight"] <= 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail="weight of a mixture component must be positive",
+                )
+        # the first dataset is the dataset of the iteration
+        params.dataset_id = params.mixture[0]["dataset_id"]
+        params.shardsets = None
+
     try:
         dataset = session.get_one(Dataset, params.dataset_id)
     except NoResultFound:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
-    shardsets_query = select(Shardset).where(Shardset.dataset_id == params.dataset_id)
-    if params.shardsets is not None and len(params.shardsets) > 0:
-        shardsets_query = shardsets_query.where(col(Shardset.id).in_(params.shardsets))
-    shardsets = session.exec(shardsets_query).all()
-
-    if len(shardsets) == 0:
-        if params.shardsets is not None and len(params.shardsets) > 0:
-            raise HTTPException(
-                status_code=400,
-                detail="No shardsets found for the provided shardset ids: "
-                + ", ".join(params.shardsets),
+    mixture = None
+    if params.mixture is None:
+        shardsets = _get_shardsets(session, params.dataset_id, params.shardsets)
+        total_samples = get_main_shardset(shardsets).total_samples
+    else:
+        mixture = []
+        shardsets = []
+        total_samples = 0
+        for component in params.mixture:
+            try:
+                session.get_one(Dataset, component["dataset_id"])
+            except NoResultFound:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Dataset {component['dataset_id']} not found",
+                )
+            component_shardsets = _get_shardsets(
+                session, component["dataset_id"], component.get("shardsets")
             )
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="No shardsets found for the dataset. Please create a shardset first.",
+            shardsets.extend([s for s in component_shardsets if s not in shardsets])
+            total_samples += get_main_shardset(component_shardsets).total_samples
+            mixture.append(
+                IterationMixtureComponent(
+                    dataset_id=component["dataset_id"],
+                    shardsets=[s.id for s in component_shardsets],
+                    weight=component["weight"],
+                )
             )
 
-    total_samples = get_main_shardset(shardsets).total_samples
-
     iteration = Iteration(
         dataset_id=dataset.id,
         total=total_samples,
@@ -206,10 +336,16 @@ def create_iteration(
         categorizer=params.categorizer,
         collater=params.collater,
         preprocessors=params.preprocessors,
+        mixture=mixture,
         shuffle=shuffle,
         shuffle_seed=params.shuffle_seed,
         shuffle_block_size=params.shuffle_block_size,
+        shuffle_mode=params.shuffle_mode,
+        shuffle_buffer_size=params.shuffle_buffer_size,
         batch_size=batch_size,
+        batch_token_budget=params.batch_token_budget,
+        batch_length_column=params.batch_length_column,
+        batch_window_size=params.batch_window_size,
         shardsets=shardsets,
         replication_pg=params.replication_pg,
     )
@@ -227,7 +363,7 @@ def create_iteration(
                     Iteration, iteration_with_same_config_id
                 )
 
-                state = IterationState(iteration_with_same_config.id, cache)
+                state = open_iteration_state(iteration_with_same_config.id, cache)
                 if state.exists():
                     if params.rank in state.get_ranks():
                         # this rank already requested to create an iteration with this config
@@ -258,7 +394,9 @@ def create_iteration(
             ttl=(params.wait_participant_threshold or 10),
             cache=cache,
         )
-    state = IterationState(iteration.id, cache)
+    state = open_iteration_state(
+        iteration.id, cache, mixture=iteration.mixture is not None
+    )
     state.init(iteration)
 
     try:
@@ -272,6 +410,8 @@ def create_iteration(
             params.num_workers if params.num_workers is not None else 1,
             params.prefetch_factor if params.prefetch_factor is not None else 1,
             params.in_order if params.in_order is not None else True,
+            params.prefetch_autotune or False,
+            params.prefetch_priority or 1.0,
         )
     prefetcher.start(params.rank or 0)
 
@@ -305,6 +445,8 @@ def cluster_start_prefetcher(
             params.num_workers if params.num_workers is not None else 1,
             params.prefetch_factor if params.prefetch_factor is not None else 1,
             params.in_order if params.in_order is not None else True,
+            params.prefetch_autotune or False,
+            params.prefetch_priority or 1.0,
         )
     prefetcher.start(params.rank or 0)
 
@@ -333,6 +475,14 @@ def prefetcher_current(
     return {rank: prefetcher.current[rank] for rank in prefetcher.ranks()}
 
 
+@router.get("/{iteration_id}/prefetcher-stats")
+def get_prefetcher_stats(
+    iteration_id: str,
+    prefetcher: CurrentIterationPrefetcher,
+) -> dict[int, PrefetcherRankStats]:
+    return prefetcher.stats()
+
+
 class ShardsetWithShards(ShardsetPublic):
     shards: list[ShardPublic]
     columns: list[DatasetColumnPublic]
@@ -461,10 +611,14 @@ def cluster_operation(
         return state.failed(params["index"])
     elif operation == "next_item":
         return state.next_item(params["rank"])
+    elif operation == "next_items":
+        return state.next_items(params["rank"], params["count"])
     elif operation == "get_ranks":
         return state.get_ranks()
     elif operation == "get_progress":
         return state.get_progress()
+    elif operation == "get_upcoming_shards":
+        return state.get_upcoming_shards(params["count"])
     elif operation == "get_next_samples":
         rank = params["rank"]
         node_url = params["node_url"]
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from lavender_data.server.reader import ReaderInstance, ReaderStats
+
+router = APIRouter(prefix="/reader", tags=["reader"])
+
+
+@router.get("/stats")
+def get_reader_stats(reader: ReaderInstance) -> ReaderStats:
+    return reader.stats()
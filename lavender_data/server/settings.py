@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import Annotated
+from typing import Annotated, Literal
 
 from fastapi import Depends
 from pydantic_settings import BaseSettings
@@ -26,7 +26,20 @@ class Settings(BaseSettings, extra="ignore"):
     lavender_data_db_url: str = ""
     lavender_data_redis_url: str = ""
     lavender_data_reader_disk_cache_size: int = 4 * 1024**3  # 4GB
+    lavender_data_reader_disk_cache_index: Literal["memory", "sqlite"] = "sqlite"
+    lavender_data_reader_memory_cache_size: int = 4 * 1024**3  # 4GB
+    lavender_data_reader_lookahead_shards: int = 2
+    lavender_data_reader_lookahead_workers: int = 4
+    lavender_data_reader_lookahead_start_rate: int = 0  # bytes/s started, 0 for none
+    lavender_data_reader_remote_read: bool = False
+    lavender_data_reader_disk_cache_scrub_interval: int = 0  # seconds, 0 disables
     lavender_data_batch_cache_ttl: int = 5 * 60
+    lavender_data_preprocess_workers: int = 0
+    lavender_data_preprocess_mode: Literal["thread", "process"] = "thread"
+    lavender_data_prefetch_max_depth: int = 64
+    lavender_data_prefetch_workers: int = 0
+    lavender_data_categorizer_bucket_budget: int = 65536
+    lavender_data_categorizer_bucket_ttl: int = 60
 
     lavender_data_cluster_enabled: bool = False
     lavender_data_cluster_secret: str = ""
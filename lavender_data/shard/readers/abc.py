@@ -1,4 +1,6 @@
 import os
+import sys
+import threading
 from abc import ABC, abstractmethod
 from typing import Any, Iterator, Optional, Union
 from typing_extensions import Self
@@ -6,6 +8,7 @@ from typing_extensions import Self
 from lavender_data.storage import download_file, list_files
 from lavender_data.logging import get_logger
 
+from .uid_index import UidIndex
 from .exceptions import (
     ReaderColumnsInvalid,
     ReaderFormatInvalid,
@@ -13,11 +16,27 @@ from .exceptions import (
     ReaderPrepareFailed,
 )
 
-__all__ = ["Reader"]
+__all__ = ["Reader", "estimate_rows_size"]
+
+
+def estimate_rows_size(rows: list[dict[str, Any]], sample_count: int = 64) -> int:
+    """Estimates the in-memory size of decoded rows by measuring a few of them."""
+    if len(rows) == 0:
+        return 0
+    sampled = rows[:: max(len(rows) // sample_count, 1)]
+    sampled_size = sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+        for row in sampled
+    )
+    return sampled_size * len(rows) // len(sampled)
 
 
 class Reader(ABC):
     format: str = ""
+    # whether get_item_by_index can read a single row without loading the whole shard
+    supports_random_access: bool = False
+    # whether the reader can read a remote shard by byte ranges without downloading it
+    supports_remote_read: bool = False
 
     @classmethod
     def is_readable(cls, location: str) -> bool:
@@ -27,6 +46,13 @@ class Reader(ABC):
                 return True
         return False
 
+    @classmethod
+    def is_remote_readable(cls, format: str) -> bool:
+        for subcls in cls._reader_classes():
+            if format == subcls.format:
+                return subcls.supports_remote_read
+        return False
+
     @classmethod
     def list_readables(cls, location: str) -> list[str]:
         return [
@@ -46,6 +72,8 @@ class Reader(ABC):
         filepath: Optional[str] = None,
         uid_column_name: Optional[str] = None,
         uid_column_type: Optional[str] = None,
+        uid_index_filepath: Optional[str] = None,
+        remote: bool = False,
     ) -> Union[Self, "UntypedReader", "TypedReader"]:
         logger = get_logger(__name__)
 
@@ -59,6 +87,8 @@ class Reader(ABC):
                         filepath=filepath,
                         uid_column_name=uid_column_name,
                         uid_column_type=uid_column_type,
+                        uid_index_filepath=uid_index_filepath,
+                        remote=remote and subcls.supports_remote_read,
                     )
                     if isinstance(instance, UntypedReader) and columns is None:
                         logger.warning(
@@ -66,8 +96,9 @@ class Reader(ABC):
                             "All columns will be read as string."
                         )
 
-                    # TODO async?
-                    instance.prepare()
+                    if not instance.remote:
+                        # TODO async?
+                        instance.prepare()
 
                     if columns is None:
                         instance.columns = instance.read_columns()
@@ -98,6 +129,8 @@ class Reader(ABC):
         filepath: Optional[str] = None,
         uid_column_name: Optional[str] = None,
         uid_column_type: Optional[str] = None,
+        uid_index_filepath: Optional[str] = None,
+        remote: bool = False,
         **kwargs,
     ) -> None:
         if dirname:
@@ -111,6 +144,9 @@ class Reader(ABC):
         self.columns = columns
         self.uid_column_name = uid_column_name
         self.uid_column_type = uid_column_type
+        self.uid_index_filepath = uid_index_filepath
+        # read from the location by byte ranges instead of the downloaded file
+        self.remote = remote
 
         if (
             self.columns is not None
@@ -122,6 +158,10 @@ class Reader(ABC):
         self.loaded: bool = False
         self.uids: list[Union[str, int]] = []
         self.cache: dict[Union[str, int], dict[str, Any]] = {}
+        self.uid_index: Optional[UidIndex] = None
+        self._memory_usage: int = 0
+        # readers are shared by the threads reading the samples of a shard
+        self._load_lock = threading.Lock()
 
     def with_columns(self, columns: list[str]):
         new_columns = {}
@@ -137,15 +177,23 @@ class Reader(ABC):
         except Exception as e:
             raise ReaderPrepareFailed(f"Failed to prepare shard: {e}") from e
 
-    def clear(self):
+    def clear(self, delete_files: bool = True):
         self.loaded = False
         self.uids = []
         self.cache = {}
+        self.uid_index = None
+        self._memory_usage = 0
 
-        try:
-            os.remove(self.filepath)
-        except FileNotFoundError:
-            pass
+        if not delete_files:
+            return
+
+        for filepath in [self.filepath, self.uid_index_filepath]:
+            if filepath is None:
+                continue
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
 
     def __len__(self) -> int:
         if not self.loaded:
@@ -163,18 +211,55 @@ class Reader(ABC):
     def read_samples(self) -> list[dict[str, Any]]:
         raise NotImplementedError
 
+    def read_uids(self) -> list[Union[str, int]]:
+        return [sample[self.uid_column_name] for sample in self.read_samples()]
+
+    def _load_uid_index(self) -> UidIndex:
+        if self.uid_index is not None:
+            return self.uid_index
+
+        if os.path.exists(self.uid_index_filepath):
+            try:
+                self.uid_index = UidIndex.load(self.uid_index_filepath)
+                return self.uid_index
+            except Exception as e:
+                get_logger(__name__).warning(
+                    f"Failed to load uid index {self.uid_index_filepath}, rebuilding: {e}"
+                )
+
+        self.uid_index = UidIndex.build(self.read_uids())
+        try:
+            self.uid_index.save(self.uid_index_filepath)
+        except OSError as e:
+            get_logger(__name__).warning(
+                f"Failed to save uid index {self.uid_index_filepath}: {e}"
+            )
+        return self.uid_index
+
     def _load(self) -> None:
         if self.loaded:
             return
-        samples = self.read_samples()
-        for i, sample in enumerate(samples):
-            if self.uid_column_name is not None:
-                uid = sample[self.uid_column_name]
-            else:
-                uid = i
-            self.uids.append(uid)
-            self.cache[str(uid)] = sample
-        self.loaded = True
+        with self._load_lock:
+            if self.loaded:
+                return
+            samples = self.read_samples()
+            uids = []
+            cache = {}
+            for i, sample in enumerate(samples):
+                if self.uid_column_name is not None:
+                    uid = sample[self.uid_column_name]
+                else:
+                    uid = i
+                uids.append(uid)
+                cache[str(uid)] = sample
+            self.uids = uids
+            self.cache = cache
+            self._memory_usage = estimate_rows_size(samples) + sys.getsizeof(uids)
+            self.loaded = True
+
+    def memory_usage(self) -> int:
+        """Estimated size in bytes of the samples decoded and kept by this reader."""
+        return self._memory_usage
 
     def get_item_by_index(self, idx: int) -> dict[str, Any]:
         if not self.loaded:
@@ -182,6 +267,14 @@ class Reader(ABC):
         return self.get_item_by_uid(self.uids[idx])
 
     def get_item_by_uid(self, uid: str) -> dict[str, Any]:
+        if (
+            not self.loaded
+            and self.supports_random_access
+            and self.uid_column_name is not None
+            and self.uid_index_filepath is not None
+        ):
+            return self.get_item_by_index(self._load_uid_index().lookup(uid))
+
         if not self.loaded:
             self._load()
         return self.cache[str(uid)]
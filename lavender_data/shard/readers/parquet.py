@@ -1,26 +1,156 @@
 """:class:`ParquetReader` reads samples from `.parquet` files that were written by :class:`ParquetWriter`."""
 
-from typing import Any
+import threading
+from collections import OrderedDict
+from typing import IO, Any, Optional, Union
 
+import numpy as np
 import pyarrow.parquet as pq
 
-from .abc import TypedReader
+from lavender_data.storage import open_file
+
+from .abc import TypedReader, estimate_rows_size
 
 __all__ = ["ParquetReader"]
 
 
 class ParquetReader(TypedReader):
+    """Reads samples by index one row group at a time.
+
+    The footer is read once to map row offsets to row groups, so looking up
+    a sample by index only decodes the row group that contains it. Decoded
+    row groups are kept in a small LRU cache of ``row_group_cache_size``
+    entries. Lookups by uid go through the uid index when
+    ``uid_index_filepath`` is given, and decode the whole shard otherwise.
+
+    In remote mode the shard is not downloaded. The footer and the row
+    groups that are read are fetched from the location by byte ranges.
+    """
+
     format = "parquet"
+    supports_random_access = True
+    supports_remote_read = True
+    row_group_cache_size: int = 4
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._parquet_file: Optional[pq.ParquetFile] = None
+        self._remote_file: Optional[IO[bytes]] = None
+        self._row_group_offsets: Optional[np.ndarray] = None
+        self._row_groups: OrderedDict[int, list[dict[str, Any]]] = OrderedDict()
+        self._row_group_sizes: dict[int, int] = {}
+        self._row_groups_lock = threading.Lock()
+        self._open_lock = threading.Lock()
 
     def read_columns(self) -> dict[str, str]:
-        schema = pq.read_schema(
-            self.filepath,
-        )
+        if self.remote:
+            schema = self._open().schema_arrow
+        else:
+            schema = pq.read_schema(
+                self.filepath,
+            )
         return {
             name: str(pa_dtype) for name, pa_dtype in zip(schema.names, schema.types)
         }
 
     def read_samples(self) -> list[dict[str, Any]]:
+        if self.remote:
+            return self._open().read(columns=list(self.columns.keys())).to_pylist()
         return pq.read_table(
             self.filepath, columns=list(self.columns.keys())
         ).to_pylist()
+
+    def read_uids(self) -> list[Union[str, int]]:
+        if self.remote:
+            table = self._open().read(columns=[self.uid_column_name])
+        else:
+            table = pq.read_table(self.filepath, columns=[self.uid_column_name])
+        return table.column(self.uid_column_name).to_pylist()
+
+    def _open(self) -> pq.ParquetFile:
+        parquet_file = self._parquet_file
+        if parquet_file is not None:
+            return parquet_file
+
+        # checked again under the lock, so that concurrent readers open the
+        # file once and never see the offsets of a half opened file
+        with self._open_lock:
+            if self._parquet_file is not None:
+                return self._parquet_file
+            if self.remote:
+                self._remote_file = open_file(self.location)
+                parquet_file = pq.ParquetFile(self._remote_file)
+            else:
+                parquet_file = pq.ParquetFile(self.filepath)
+            metadata = parquet_file.metadata
+            self._row_group_offsets = np.cumsum(
+                [0]
+                + [
+                    metadata.row_group(i).num_rows
+                    for i in range(metadata.num_row_groups)
+                ]
+            )
+            self._parquet_file = parquet_file
+            return parquet_file
+
+    def _read_row_group(self, row_group_index: int) -> list[dict[str, Any]]:
+        with self._row_groups_lock:
+            if row_group_index in self._row_groups:
+                self._row_groups.move_to_end(row_group_index)
+                return self._row_groups[row_group_index]
+
+            rows = (
+                self._open()
+                .read_row_group(row_group_index, columns=list(self.columns.keys()))
+                .to_pylist()
+            )
+            self._row_groups[row_group_index] = rows
+            self._row_group_sizes[row_group_index] = estimate_rows_size(rows)
+            while len(self._row_groups) > self.row_group_cache_size:
+                evicted, _ = self._row_groups.popitem(last=False)
+                self._row_group_sizes.pop(evicted)
+            return rows
+
+    def with_columns(self, columns: list[str]):
+        super().with_columns(columns)
+        with self._row_groups_lock:
+            self._row_groups.clear()
+            self._row_group_sizes.clear()
+
+    def clear(self, delete_files: bool = True):
+        with self._row_groups_lock, self._open_lock:
+            self._row_groups.clear()
+            self._row_group_sizes.clear()
+            if self._parquet_file is not None:
+                self._parquet_file.close()
+            if self._remote_file is not None:
+                self._remote_file.close()
+            self._parquet_file = None
+            self._remote_file = None
+            self._row_group_offsets = None
+        super().clear(delete_files=delete_files)
+
+    def memory_usage(self) -> int:
+        return super().memory_usage() + sum(self._row_group_sizes.values())
+
+    def __len__(self) -> int:
+        if self.loaded:
+            return len(self.uids)
+        self._open()
+        return int(self._row_group_offsets[-1])
+
+    def get_item_by_index(self, idx: int) -> dict[str, Any]:
+        if self.loaded:
+            return super().get_item_by_index(idx)
+
+        total = len(self)
+        if idx < 0:
+            idx += total
+        if idx < 0 or idx >= total:
+            raise IndexError(f"Index {idx} out of range ({total} samples)")
+
+        offsets = self._row_group_offsets
+        row_group_index = int(np.searchsorted(offsets, idx, side="right")) - 1
+        rows = self._read_row_group(row_group_index)
+        # copy so that callers (e.g. feature joins) do not mutate the cached row
+        return dict(rows[idx - int(offsets[row_group_index])])
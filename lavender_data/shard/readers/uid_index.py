@@ -0,0 +1,67 @@
+import os
+import tempfile
+from typing import Any, Union
+
+import numpy as np
+
+__all__ = ["UidIndex"]
+
+
+class UidIndex:
+    """A sorted uid -> row offset table of a shard.
+
+    It is stored as a single `.npy` file so that it can be memory-mapped
+    instead of being read into memory. Integer uids are kept as int64,
+    everything else is compared by its string representation (the same way
+    :class:`Reader` keys its cache).
+    """
+
+    def __init__(self, table: np.ndarray):
+        self.table = table
+
+    @classmethod
+    def build(cls, uids: list[Union[str, int]]) -> "UidIndex":
+        values = np.asarray(uids)
+        if values.dtype.kind not in "iu":
+            values = np.asarray([str(uid) for uid in uids], dtype=np.str_)
+        if len(values) == 0:
+            values = values.astype(np.int64)
+
+        table = np.empty(
+            len(values), dtype=[("uid", values.dtype), ("offset", np.int64)]
+        )
+        order = np.argsort(values, kind="stable")
+        table["uid"] = values[order]
+        table["offset"] = order
+        return cls(table)
+
+    @classmethod
+    def load(cls, filepath: str) -> "UidIndex":
+        return cls(np.load(filepath, mmap_mode="r"))
+
+    def save(self, filepath: str) -> None:
+        dirname = os.path.dirname(filepath) or "."
+        os.makedirs(dirname, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=dirname, suffix=".npy", delete=False) as f:
+            np.save(f, self.table)
+        os.replace(f.name, filepath)
+
+    def _normalize(self, uid: Any):
+        if self.table.dtype["uid"].kind in "iu":
+            try:
+                return int(str(uid))
+            except ValueError:
+                raise KeyError(uid)
+        return str(uid)
+
+    def lookup(self, uid: Any) -> int:
+        key = self._normalize(uid)
+        uids = self.table["uid"]
+        # the last one wins on duplicated uids, same as the in-memory cache
+        i = int(np.searchsorted(uids, key, side="right")) - 1
+        if i < 0 or uids[i] != key:
+            raise KeyError(uid)
+        return int(self.table["offset"][i])
+
+    def __len__(self) -> int:
+        return len(self.table)
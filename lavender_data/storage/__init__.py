@@ -1,13 +1,21 @@
 import os
 import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from typing import IO, Optional
 from lavender_data.logging import get_logger
 from lavender_data.storage.abc import Storage
 from lavender_data.storage.s3 import S3Storage
 from lavender_data.storage.hf import HuggingfaceStorage
 from lavender_data.storage.file import LocalFileStorage
 from lavender_data.storage.http import HttpStorage, HttpsStorage
+from lavender_data.storage.lock import file_lock
+from lavender_data.storage.remote_file import RemoteFile
+from lavender_data.storage.validation import (
+    iter_validation_records,
+    move_validation_record,
+    remove_validation_record,
+)
 
 __all__ = [
     "Storage",
@@ -16,12 +24,49 @@ __all__ = [
     "LocalFileStorage",
     "HttpStorage",
     "HttpsStorage",
+    "RemoteFile",
     "download_file",
+    "open_file",
     "upload_file",
     "list_files",
+    "scrub_files",
+    "file_lock",
 ]
 
 
+def _stat(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _get_lock_path(local_path: str) -> str:
+    return os.path.join(
+        os.path.dirname(local_path) or ".", f".{os.path.basename(local_path)}.lock"
+    )
+
+
+def _download_atomic(storage: Storage, remote_path: str, local_path: str):
+    if storage.is_up_to_date(remote_path, local_path):
+        return
+
+    # readers never see a partially written file
+    tmp_path = os.path.join(
+        os.path.dirname(local_path),
+        f".{os.path.basename(local_path)}.{uuid.uuid4().hex}.tmp",
+    )
+    try:
+        storage.download(remote_path, tmp_path)
+        os.replace(tmp_path, local_path)
+        move_validation_record(tmp_path, local_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        remove_validation_record(tmp_path)
+
+
 def _download_file_with_timeout(
     remote_path: str,
     local_path: str,
@@ -31,7 +76,7 @@ def _download_file_with_timeout(
     executor = ThreadPoolExecutor()
     try:
         storage = Storage.get(remote_path)
-        future = executor.submit(storage.download, remote_path, local_path)
+        future = executor.submit(_download_atomic, storage, remote_path, local_path)
         return future.result(timeout=timeout)
     except RuntimeError as e:
         if "cannot schedule new futures after" in str(e):
@@ -77,14 +122,36 @@ def download_file(
     backoff: float = 3,
     warn_on_retry: bool = True,
 ):
-    _download_file_with_retry(
-        remote_path,
-        local_path,
-        timeout=timeout,
-        retry=retry,
-        backoff=backoff,
-        warn_on_retry=warn_on_retry,
-    )
+    """Downloads ``remote_path`` to ``local_path``.
+
+    Concurrent downloads to the same ``local_path``, from threads or
+    processes, are coalesced: one of them downloads while the others wait
+    and then share its result.
+    """
+    if remote_path.startswith("file://") and os.path.abspath(
+        remote_path.removeprefix("file://")
+    ) == os.path.abspath(local_path):
+        # reading in place
+        return local_path
+
+    dirname = os.path.dirname(local_path) or "."
+    os.makedirs(dirname, exist_ok=True)
+    lock_path = _get_lock_path(local_path)
+
+    before = _stat(local_path)
+    with file_lock(lock_path) as waited:
+        if waited and _stat(local_path) not in (None, before):
+            # downloaded by the one we waited for
+            return local_path
+
+        _download_file_with_retry(
+            remote_path,
+            local_path,
+            timeout=timeout,
+            retry=retry,
+            backoff=backoff,
+            warn_on_retry=warn_on_retry,
+        )
     return local_path
 
 
@@ -162,6 +229,45 @@ def upload_file(
             )
 
 
+def open_file(remote_path: str, block_size: Optional[int] = None) -> IO[bytes]:
+    """Opens ``remote_path`` as a seekable binary file that fetches only the
+    byte ranges that are read, in blocks of ``block_size`` bytes."""
+    storage = Storage.get(remote_path)
+    return storage.open(remote_path, block_size=block_size)
+
+
+def scrub_files(dirname: str) -> list[str]:
+    """Verifies the checksums of the files downloaded under ``dirname`` and
+    removes the corrupted ones. Returns the paths of the removed files."""
+    removed = []
+    for local_path, record in iter_validation_records(dirname):
+        # not replaced by a download while being verified
+        with file_lock(_get_lock_path(local_path)):
+            if not record.matches(local_path):
+                # modified or downloaded again since the record was read
+                continue
+            try:
+                intact = Storage.get(record.remote_path).verify(
+                    record.remote_path, local_path
+                )
+            except Exception as e:
+                get_logger(__name__).warning(f"Failed to verify {local_path}: {e}")
+                continue
+            if intact:
+                continue
+
+            get_logger(__name__).warning(
+                f"Removing corrupted file {local_path} (downloaded from {record.remote_path})"
+            )
+            try:
+                os.remove(local_path)
+            except FileNotFoundError:
+                pass
+            remove_validation_record(local_path)
+            removed.append(local_path)
+    return removed
+
+
 def list_files(remote_path: str, limit: Optional[int] = None) -> list[str]:
     # TODO timeout
     storage = Storage.get(remote_path)
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 import urllib.parse
-from typing import Optional
+from typing import IO, Optional
 from typing_extensions import Self
 
 _storage_instances: dict[str, "Storage"] = {}
@@ -23,6 +23,23 @@ class Storage(ABC):
     @abstractmethod
     def download(self, remote_path: str, local_path: str) -> None: ...
 
+    def is_up_to_date(self, remote_path: str, local_path: str) -> bool:
+        """Whether ``local_path`` already has the content of ``remote_path``
+        so that downloading it again can be skipped."""
+        return False
+
+    def verify(self, remote_path: str, local_path: str) -> bool:
+        """Whether the content of ``local_path`` is intact, checked by its
+        checksum. Files that cannot be checked are assumed to be intact."""
+        return True
+
+    def open(self, remote_path: str, block_size: Optional[int] = None) -> IO[bytes]:
+        """Opens ``remote_path`` as a seekable binary file that reads only the
+        byte ranges that are accessed, without downloading the whole file."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support reading by byte ranges"
+        )
+
     @abstractmethod
     def upload(self, local_path: str, remote_path: str) -> None: ...
 
@@ -1,6 +1,6 @@
 import os
 import shutil
-from typing import Optional
+from typing import IO, Optional
 
 from lavender_data.storage.abc import Storage
 
@@ -10,6 +10,11 @@ __all__ = ["LocalFileStorage"]
 class LocalFileStorage(Storage):
     scheme = "file"
 
+    def is_up_to_date(self, remote_path: str, local_path: str) -> bool:
+        return os.path.abspath(remote_path.removeprefix("file://")) == os.path.abspath(
+            local_path
+        )
+
     def download(self, remote_path: str, local_path: str) -> None:
         _remote_path = remote_path.removeprefix("file://")
         os.makedirs(os.path.dirname(_remote_path), exist_ok=True)
@@ -22,6 +27,9 @@ class LocalFileStorage(Storage):
         except FileExistsError:
             pass
 
+    def open(self, remote_path: str, block_size: Optional[int] = None) -> IO[bytes]:
+        return open(remote_path.removeprefix("file://"), "rb")
+
     def upload(self, local_path: str, remote_path: str) -> None:
         _remote_path = remote_path.removeprefix("file://")
         os.makedirs(os.path.dirname(_remote_path), exist_ok=True)
@@ -2,6 +2,8 @@ import urllib.parse
 from pathlib import Path
 from typing import Optional
 from lavender_data.storage.abc import Storage
+from lavender_data.storage.http import http_open
+from lavender_data.storage.remote_file import RemoteFile
 
 
 class HuggingfaceStorage(Storage):
@@ -14,6 +16,8 @@ class HuggingfaceStorage(Storage):
                 hf_hub_download,
                 upload_file,
                 list_repo_tree,
+                hf_hub_url,
+                get_hf_file_metadata,
             )
         except ImportError:
             raise ImportError(
@@ -27,6 +31,9 @@ class HuggingfaceStorage(Storage):
         self._download = hf_hub_download
         self._upload = upload_file
         self._list = list_repo_tree
+        self._url = hf_hub_url
+        self._metadata = get_hf_file_metadata
+        self._headers = utils.build_hf_headers
 
     def _parse_remote_path(self, remote_path: str) -> tuple[str, str]:
         parsed = urllib.parse.urlparse(remote_path)
@@ -64,6 +71,25 @@ class HuggingfaceStorage(Storage):
 
         downloaded_path.rename(local_path)
 
+    def open(self, remote_path: str, block_size: Optional[int] = None) -> RemoteFile:
+        repo_id, path = self._parse_remote_path(remote_path)
+        try:
+            metadata = self._metadata(
+                self._url(repo_id=repo_id, filename=path, repo_type="dataset")
+            )
+        except Exception as e:
+            if "404" in str(e):
+                raise FileNotFoundError(f"File not found: {remote_path}")
+            raise
+        # pinned to the commit so that all ranges read the same file
+        url = self._url(
+            repo_id=repo_id,
+            filename=path,
+            repo_type="dataset",
+            revision=metadata.commit_hash,
+        )
+        return http_open(url, headers=self._headers(), block_size=block_size)
+
     def upload(self, local_path: str, remote_path: str) -> None:
         repo_id, path = self._parse_remote_path(remote_path)
 
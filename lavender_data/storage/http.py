@@ -4,9 +4,44 @@ import tqdm
 from typing import Optional
 
 from lavender_data.storage.abc import Storage
+from lavender_data.storage.ranged import (
+    get_download_part_size,
+    get_download_concurrency,
+    ranged_download,
+)
+from lavender_data.storage.remote_file import RemoteFile, get_remote_read_block_size
 
 
-MULTIPART_CHUNKSIZE = 1 << 23
+def _ranged_http_download(
+    remote_path: str,
+    local_path: str,
+    size: int,
+    *,
+    follow_redirects: bool,
+    part_size: int,
+    concurrency: int,
+    progress: tqdm.tqdm,
+) -> None:
+    def read_range(start: int, end: int):
+        with httpx.stream(
+            "GET",
+            remote_path,
+            headers={"Range": f"bytes={start}-{end}"},
+            follow_redirects=follow_redirects,
+        ) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise IOError(f"Range request not supported: {remote_path}")
+            yield from r.iter_bytes()
+
+    ranged_download(
+        read_range,
+        size,
+        local_path,
+        part_size=part_size,
+        concurrency=concurrency,
+        on_part=progress.update,
+    )
 
 
 def http_download(
@@ -15,7 +50,42 @@ def http_download(
     *,
     follow_redirects: bool = True,
     show_progress: bool = False,
+    part_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
 ) -> None:
+    part_size = part_size or get_download_part_size()
+    concurrency = concurrency or get_download_concurrency()
+
+    if concurrency > 1:
+        head = httpx.head(remote_path, follow_redirects=follow_redirects)
+        content_length = head.headers.get("Content-Length")
+        if (
+            head.status_code == 200
+            and head.headers.get("Accept-Ranges") == "bytes"
+            and content_length is not None
+            and int(content_length) > part_size
+        ):
+            progress = tqdm.tqdm(
+                disable=not show_progress,
+                desc=f"Downloading {remote_path}",
+                total=int(content_length),
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                leave=False,
+            )
+            _ranged_http_download(
+                remote_path,
+                local_path,
+                int(content_length),
+                follow_redirects=follow_redirects,
+                part_size=part_size,
+                concurrency=concurrency,
+                progress=progress,
+            )
+            progress.close()
+            return
+
     with httpx.stream("GET", remote_path, follow_redirects=follow_redirects) as r:
         content_length = r.headers.get("Content-Length")
         if content_length is not None:
@@ -39,6 +109,41 @@ def http_download(
         progress.close()
 
 
+def http_open(
+    remote_path: str,
+    *,
+    follow_redirects: bool = True,
+    headers: Optional[dict[str, str]] = None,
+    block_size: Optional[int] = None,
+) -> RemoteFile:
+    headers = headers or {}
+    head = httpx.head(remote_path, headers=headers, follow_redirects=follow_redirects)
+    if head.status_code == 404:
+        raise FileNotFoundError(f"File not found: {remote_path}")
+    head.raise_for_status()
+    content_length = head.headers.get("Content-Length")
+    if head.headers.get("Accept-Ranges") != "bytes" or content_length is None:
+        raise IOError(f"Range request not supported: {remote_path}")
+
+    def read_range(start: int, end: int) -> bytes:
+        r = httpx.get(
+            remote_path,
+            headers={**headers, "Range": f"bytes={start}-{end}"},
+            follow_redirects=follow_redirects,
+        )
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise IOError(f"Range request not supported: {remote_path}")
+        return r.content
+
+    return RemoteFile(
+        read_range,
+        int(content_length),
+        name=remote_path,
+        block_size=block_size or get_remote_read_block_size(),
+    )
+
+
 class HttpStorage(Storage):
     scheme = "http"
 
@@ -57,6 +162,9 @@ class HttpStorage(Storage):
             show_progress=show_progress,
         )
 
+    def open(self, remote_path: str, block_size: Optional[int] = None) -> RemoteFile:
+        return http_open(remote_path, block_size=block_size)
+
     def upload(self, local_path: str, remote_path: str) -> None:
         raise NotImplementedError
 
@@ -69,6 +177,9 @@ class HttpStorage(Storage):
             line.split(" ")[0] for line in response.text.split("\n") if line.strip()
         ]
 
+    def get_url(self, remote_path: str) -> str:
+        return remote_path
+
 
 class HttpsStorage(Storage):
     scheme = "https"
@@ -88,6 +199,9 @@ class HttpsStorage(Storage):
             show_progress=show_progress,
         )
 
+    def open(self, remote_path: str, block_size: Optional[int] = None) -> RemoteFile:
+        return http_open(remote_path, block_size=block_size)
+
     def upload(self, local_path: str, remote_path: str) -> None:
         raise NotImplementedError
 
@@ -0,0 +1,54 @@
+import os
+import threading
+import contextlib
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+__all__ = ["file_lock"]
+
+_thread_locks: dict[str, threading.Lock] = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(lock_path: str) -> threading.Lock:
+    with _thread_locks_lock:
+        if lock_path not in _thread_locks:
+            _thread_locks[lock_path] = threading.Lock()
+        return _thread_locks[lock_path]
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str) -> Iterator[bool]:
+    """Holds an exclusive lock on ``lock_path`` across threads and processes.
+
+    Yields True if the lock was held by someone else and had to be waited
+    for. Without ``fcntl`` (e.g. on Windows) only threads of this process
+    are excluded.
+    """
+    lock_path = os.path.abspath(lock_path)
+    thread_lock = _thread_lock(lock_path)
+    waited = not thread_lock.acquire(blocking=False)
+    if waited:
+        thread_lock.acquire()
+
+    try:
+        if fcntl is None:
+            yield waited
+            return
+
+        with open(lock_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield waited
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        thread_lock.release()
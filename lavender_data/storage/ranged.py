@@ -0,0 +1,97 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+__all__ = [
+    "MULTIPART_CHUNKSIZE",
+    "get_download_part_size",
+    "get_download_concurrency",
+    "ranged_download",
+]
+
+MULTIPART_CHUNKSIZE = 1 << 23
+
+
+def get_download_part_size() -> int:
+    return int(os.getenv("LAVENDER_DATA_DOWNLOAD_PART_SIZE", MULTIPART_CHUNKSIZE))
+
+
+def get_download_concurrency() -> int:
+    return int(os.getenv("LAVENDER_DATA_DOWNLOAD_CONCURRENCY", 8))
+
+
+def _download_part(
+    fd: int,
+    read_range: Callable[[int, int], Iterator[bytes]],
+    start: int,
+    end: int,
+    retry: int,
+    backoff: float,
+    on_part: Optional[Callable[[int], None]],
+) -> None:
+    for i in range(retry + 1):
+        try:
+            offset = start
+            for chunk in read_range(start, end):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+            if offset != end + 1:
+                raise IOError(
+                    f"Incomplete part {start}-{end} ({offset - start} of {end - start + 1} bytes)"
+                )
+            if on_part is not None:
+                on_part(end - start + 1)
+            return
+        except Exception:
+            if i == retry:
+                raise
+            time.sleep(backoff * (i + 1))
+
+
+def ranged_download(
+    read_range: Callable[[int, int], Iterator[bytes]],
+    size: int,
+    local_path: str,
+    *,
+    part_size: int,
+    concurrency: int,
+    retry: int = 3,
+    backoff: float = 0.5,
+    on_part: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Downloads ``size`` bytes into ``local_path`` by parts in parallel.
+
+    ``read_range(start, end)`` yields the bytes of the inclusive range
+    ``start``-``end``. Each part is written at its offset as it arrives, and
+    a failed part is retried alone. ``on_part`` is called with the size of
+    each part once it is downloaded, so a retried part is counted once.
+    """
+    with open(local_path, "wb") as f:
+        f.truncate(size)
+
+    fd = os.open(local_path, os.O_WRONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    _download_part,
+                    fd,
+                    read_range,
+                    start,
+                    min(start + part_size, size) - 1,
+                    retry,
+                    backoff,
+                    on_part,
+                )
+                for start in range(0, size, part_size)
+            ]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception:
+                    for f in futures:
+                        f.cancel()
+                    raise
+    finally:
+        os.close(fd)
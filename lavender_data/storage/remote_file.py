@@ -0,0 +1,151 @@
+import io
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+__all__ = ["RemoteFile", "get_remote_read_block_size"]
+
+REMOTE_READ_BLOCK_SIZE = 1 << 20
+
+
+def get_remote_read_block_size() -> int:
+    return int(
+        os.getenv("LAVENDER_DATA_REMOTE_READ_BLOCK_SIZE", REMOTE_READ_BLOCK_SIZE)
+    )
+
+
+class RemoteFile(io.RawIOBase):
+    """A read-only, seekable file over byte-range reads of a remote object.
+
+    ``read_range(start, end)`` returns the bytes of the inclusive range
+    ``start``-``end``. Reads are aligned to blocks of ``block_size`` bytes,
+    missing blocks that are next to each other are fetched in a single
+    request, and the last ``cache_blocks`` blocks read are kept in memory.
+    A failed request is retried up to ``retry`` times.
+    """
+
+    def __init__(
+        self,
+        read_range: Callable[[int, int], bytes],
+        size: int,
+        *,
+        name: str = "",
+        block_size: int = REMOTE_READ_BLOCK_SIZE,
+        cache_blocks: int = 32,
+        retry: int = 3,
+        backoff: float = 0.5,
+    ):
+        super().__init__()
+        self.name = name
+        self.size = size
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.retry = retry
+        self.backoff = backoff
+        self.requests = 0
+        self.bytes_read = 0
+
+        self._read_range = read_range
+        self._position = 0
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def _fetch(self, first: int, last: int) -> dict[int, bytes]:
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, self.size) - 1
+        for i in range(self.retry + 1):
+            try:
+                self.requests += 1
+                data = self._read_range(start, end)
+                if len(data) != end - start + 1:
+                    raise IOError(
+                        f"Incomplete range {start}-{end} of {self.name} ({len(data)} of {end - start + 1} bytes)"
+                    )
+                break
+            except Exception:
+                if i == self.retry:
+                    raise
+                time.sleep(self.backoff * (i + 1))
+        self.bytes_read += len(data)
+        return {
+            block: data[
+                (block - first)
+                * self.block_size : (block - first + 1)
+                * self.block_size
+            ]
+            for block in range(first, last + 1)
+        }
+
+    def _get_blocks(self, first: int, last: int) -> dict[int, bytes]:
+        blocks = {}
+        missing = []
+        for block in range(first, last + 1):
+            if block in self._blocks:
+                self._blocks.move_to_end(block)
+                blocks[block] = self._blocks[block]
+            else:
+                missing.append(block)
+
+        # one request for each run of consecutive missing blocks
+        runs = []
+        for block in missing:
+            if runs and runs[-1][1] == block - 1:
+                runs[-1][1] = block
+            else:
+                runs.append([block, block])
+        for run_first, run_last in runs:
+            blocks.update(self._fetch(run_first, run_last))
+
+        for block in missing:
+            self._blocks[block] = blocks[block]
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return blocks
+
+    def readinto(self, buffer) -> int:
+        with self._lock:
+            start = self._position
+            end = min(start + len(buffer), self.size)
+            if start >= end:
+                return 0
+
+            first = start // self.block_size
+            last = (end - 1) // self.block_size
+            data = b"".join(
+                block_data
+                for _, block_data in sorted(self._get_blocks(first, last).items())
+            )
+            offset = start - first * self.block_size
+            n = end - start
+            memoryview(buffer)[:n] = data[offset : offset + n]
+            self._position = end
+            return n
+
+    def close(self) -> None:
+        self._blocks.clear()
+        super().close()
@@ -5,9 +5,17 @@ from pathlib import Path
 from typing import Optional
 
 from lavender_data.storage.abc import Storage
-
-
-MULTIPART_CHUNKSIZE = 1 << 23
+from lavender_data.storage.ranged import (
+    MULTIPART_CHUNKSIZE,
+    get_download_part_size,
+    get_download_concurrency,
+    ranged_download,
+)
+from lavender_data.storage.remote_file import RemoteFile, get_remote_read_block_size
+from lavender_data.storage.validation import (
+    read_validation_record,
+    write_validation_record,
+)
 
 
 class S3Storage(Storage):
@@ -38,61 +46,117 @@ class S3Storage(Storage):
             config=config,
         )
 
-    def download(self, remote_path: str, local_path: str) -> None:
+    def _head(self, remote_path: str) -> dict:
         parsed = urllib.parse.urlparse(remote_path)
         bucket = parsed.netloc
         key = parsed.path[1:]
 
-        if Path(local_path).exists():
-            # md5 check
-            try:
-                etag = self.client.head_object(Bucket=bucket, Key=key)["ETag"]
-            except Exception as e:
-                if "404" in str(e):
-                    raise FileNotFoundError(f"File not found: {remote_path}")
-                raise
-
-            etag = etag.strip('"')
-            etag_parts = etag.split("-")
-            if len(etag_parts) == 1:
-                etag_hash = etag_parts[0]
-                chunk_count = 0
-            elif len(etag_parts) == 2:
-                etag_hash = etag_parts[0]
-                chunk_count = int(etag_parts[1])
-            else:
-                raise ValueError(f"Invalid etag: {etag}")
-
-            read_chunk_count = 0
-            chunks = b""
-            with open(local_path, "rb") as f:
-                for chunk in iter(lambda: f.read(MULTIPART_CHUNKSIZE), b""):
-                    if chunk_count > 0:
-                        chunks += hashlib.md5(chunk).digest()
-                        read_chunk_count += 1
-                    else:
-                        chunks += chunk
-
-            if read_chunk_count == chunk_count:
-                md5_hash = hashlib.md5(chunks).hexdigest()
-
-                if md5_hash == etag_hash:
-                    return
-
-        if not Path(local_path).parent.exists():
-            Path(local_path).parent.mkdir(parents=True, exist_ok=True)
-
         try:
-            self.client.download_file(
-                Bucket=bucket,
-                Key=key,
-                Filename=local_path,
-            )
+            return self.client.head_object(Bucket=bucket, Key=key)
         except Exception as e:
             if "404" in str(e):
                 raise FileNotFoundError(f"File not found: {remote_path}")
             raise
 
+    def _md5_matches(self, local_path: str, etag: str) -> bool:
+        etag = etag.strip('"')
+        etag_parts = etag.split("-")
+        if len(etag_parts) == 1:
+            etag_hash = etag_parts[0]
+            chunk_count = 0
+        elif len(etag_parts) == 2:
+            etag_hash = etag_parts[0]
+            chunk_count = int(etag_parts[1])
+        else:
+            raise ValueError(f"Invalid etag: {etag}")
+
+        read_chunk_count = 0
+        chunks = b""
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(MULTIPART_CHUNKSIZE), b""):
+                if chunk_count > 0:
+                    chunks += hashlib.md5(chunk).digest()
+                    read_chunk_count += 1
+                else:
+                    chunks += chunk
+
+        if read_chunk_count != chunk_count:
+            return False
+        return hashlib.md5(chunks).hexdigest() == etag_hash
+
+    def is_up_to_date(self, remote_path: str, local_path: str) -> bool:
+        if not Path(local_path).exists():
+            return False
+
+        etag = self._head(remote_path)["ETag"]
+        record = read_validation_record(local_path)
+        if record is not None:
+            return (
+                record.remote_path == remote_path
+                and record.etag == etag
+                and record.matches(local_path)
+            )
+
+        # downloaded before the validation records were written, hashed once
+        if self._md5_matches(local_path, etag):
+            write_validation_record(local_path, remote_path, etag)
+            return True
+        return False
+
+    def verify(self, remote_path: str, local_path: str) -> bool:
+        record = read_validation_record(local_path)
+        if record is None or record.remote_path != remote_path:
+            return True
+        return self._md5_matches(local_path, record.etag)
+
+    def download(self, remote_path: str, local_path: str) -> None:
+        parsed = urllib.parse.urlparse(remote_path)
+        bucket = parsed.netloc
+        key = parsed.path[1:]
+
+        if not Path(local_path).parent.exists():
+            Path(local_path).parent.mkdir(parents=True, exist_ok=True)
+
+        head = self._head(remote_path)
+        etag = head["ETag"]
+
+        def read_range(start: int, end: int):
+            # the parts fail instead of mixing versions if the object changes
+            body = self.client.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag
+            )["Body"]
+            yield from body.iter_chunks()
+
+        # parts are downloaded by ranged GETs in parallel, retried one by one
+        # and written at their offsets
+        ranged_download(
+            read_range,
+            head["ContentLength"],
+            local_path,
+            part_size=get_download_part_size(),
+            concurrency=get_download_concurrency(),
+        )
+        write_validation_record(local_path, remote_path, etag)
+
+    def open(self, remote_path: str, block_size: Optional[int] = None) -> RemoteFile:
+        parsed = urllib.parse.urlparse(remote_path)
+        bucket = parsed.netloc
+        key = parsed.path[1:]
+
+        size = self._head(remote_path)["ContentLength"]
+
+        def read_range(start: int, end: int) -> bytes:
+            return self.client.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+            )["Body"].read()
+
+        return RemoteFile(
+            read_range,
+            size,
+            name=remote_path,
+            block_size=block_size or get_remote_read_block_size(),
+        )
+
     def upload(self, local_path: str, remote_path: str) -> None:
         if not Path(local_path).exists():
             raise FileNotFoundError(f"File not found: {local_path}")
@@ -0,0 +1,94 @@
+import os
+import json
+from dataclasses import dataclass, asdict
+from typing import Iterator, Optional
+
+__all__ = [
+    "ValidationRecord",
+    "get_validation_record_path",
+    "read_validation_record",
+    "write_validation_record",
+    "move_validation_record",
+    "remove_validation_record",
+    "iter_validation_records",
+]
+
+
+@dataclass
+class ValidationRecord:
+    """What a downloaded file was downloaded from, written next to it so that
+    it can be validated against the remote with a stat instead of a hash."""
+
+    remote_path: str
+    etag: str
+    size: int
+    mtime_ns: int
+
+    def matches(self, local_path: str) -> bool:
+        """Whether ``local_path`` was not modified since it was downloaded."""
+        try:
+            stat = os.stat(local_path)
+        except FileNotFoundError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+
+def get_validation_record_path(local_path: str) -> str:
+    # hidden so that it is not picked up as a cached file
+    return os.path.join(
+        os.path.dirname(local_path), f".{os.path.basename(local_path)}.meta.json"
+    )
+
+
+def read_validation_record(local_path: str) -> Optional[ValidationRecord]:
+    try:
+        with open(get_validation_record_path(local_path)) as f:
+            return ValidationRecord(**json.load(f))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+
+def write_validation_record(local_path: str, remote_path: str, etag: str) -> None:
+    """Records that ``local_path`` has just been downloaded from ``remote_path``."""
+    stat = os.stat(local_path)
+    record = ValidationRecord(
+        remote_path=remote_path,
+        etag=etag,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+    )
+    with open(get_validation_record_path(local_path), "w") as f:
+        json.dump(asdict(record), f)
+
+
+def move_validation_record(src_path: str, dst_path: str) -> None:
+    """Moves the record of a file that was renamed from ``src_path`` to
+    ``dst_path``. A stale record of ``dst_path`` is removed if ``src_path``
+    has none."""
+    try:
+        os.replace(
+            get_validation_record_path(src_path), get_validation_record_path(dst_path)
+        )
+    except FileNotFoundError:
+        remove_validation_record(dst_path)
+
+
+def remove_validation_record(local_path: str) -> None:
+    try:
+        os.remove(get_validation_record_path(local_path))
+    except FileNotFoundError:
+        pass
+
+
+def iter_validation_records(
+    dirname: str,
+) -> Iterator[tuple[str, ValidationRecord]]:
+    """Yields the files under ``dirname`` that have a record, with the record."""
+    for root, _, files in os.walk(dirname):
+        for file in files:
+            if not (file.startswith(".") and file.endswith(".meta.json")):
+                continue
+            local_path = os.path.join(root, file[1 : -len(".meta.json")])
+            record = read_validation_record(local_path)
+            if record is not None:
+                yield local_path, record
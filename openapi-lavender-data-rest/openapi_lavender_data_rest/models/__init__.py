@@ -40,6 +40,7 @@ from .iteration_collater import IterationCollater
 from .iteration_collater_params import IterationCollaterParams
 from .iteration_filter import IterationFilter
 from .iteration_filter_params import IterationFilterParams
+from .iteration_mixture_component import IterationMixtureComponent
 from .iteration_preprocessor import IterationPreprocessor
 from .iteration_preprocessor_params import IterationPreprocessorParams
 from .iteration_public import IterationPublic
@@ -100,6 +101,7 @@ __all__ = (
     "IterationCollaterParams",
     "IterationFilter",
     "IterationFilterParams",
+    "IterationMixtureComponent",
     "IterationPreprocessor",
     "IterationPreprocessorParams",
     "IterationPublic",
@@ -10,6 +10,7 @@ if TYPE_CHECKING:
     from ..models.iteration_categorizer import IterationCategorizer
     from ..models.iteration_collater import IterationCollater
     from ..models.iteration_filter import IterationFilter
+    from ..models.iteration_mixture_component import IterationMixtureComponent
     from ..models.iteration_preprocessor import IterationPreprocessor
 
 
@@ -26,10 +27,16 @@ class CreateIterationParams:
         categorizer (Union['IterationCategorizer', None, Unset]):
         collater (Union['IterationCollater', None, Unset]):
         preprocessors (Union[None, Unset, list['IterationPreprocessor']]):
+        mixture (Union[None, Unset, list['IterationMixtureComponent']]):
         shuffle (Union[None, Unset, bool]):
         shuffle_seed (Union[None, Unset, int]):
         shuffle_block_size (Union[None, Unset, int]):
+        shuffle_mode (Union[None, Unset, str]):
+        shuffle_buffer_size (Union[None, Unset, int]):
         batch_size (Union[None, Unset, int]):
+        batch_token_budget (Union[None, Unset, int]):
+        batch_length_column (Union[None, Unset, str]):
+        batch_window_size (Union[None, Unset, int]):
         replication_pg (Union[None, Unset, list[list[int]]]):
         rank (Union[None, Unset, int]):
         world_size (Union[None, Unset, int]):
@@ -38,6 +45,8 @@ class CreateIterationParams:
         max_retry_count (Union[None, Unset, int]):
         num_workers (Union[None, Unset, int]):
         prefetch_factor (Union[None, Unset, int]):
+        prefetch_autotune (Union[None, Unset, bool]):
+        prefetch_priority (Union[None, Unset, float]):
         in_order (Union[None, Unset, bool]):
     """
 
@@ -47,10 +56,16 @@ class CreateIterationParams:
     categorizer: Union["IterationCategorizer", None, Unset] = UNSET
     collater: Union["IterationCollater", None, Unset] = UNSET
     preprocessors: Union[None, Unset, list["IterationPreprocessor"]] = UNSET
+    mixture: Union[None, Unset, list["IterationMixtureComponent"]] = UNSET
     shuffle: Union[None, Unset, bool] = UNSET
     shuffle_seed: Union[None, Unset, int] = UNSET
     shuffle_block_size: Union[None, Unset, int] = UNSET
+    shuffle_mode: Union[None, Unset, str] = UNSET
+    shuffle_buffer_size: Union[None, Unset, int] = UNSET
     batch_size: Union[None, Unset, int] = UNSET
+    batch_token_budget: Union[None, Unset, int] = UNSET
+    batch_length_column: Union[None, Unset, str] = UNSET
+    batch_window_size: Union[None, Unset, int] = UNSET
     replication_pg: Union[None, Unset, list[list[int]]] = UNSET
     rank: Union[None, Unset, int] = UNSET
     world_size: Union[None, Unset, int] = UNSET
@@ -59,6 +74,8 @@ class CreateIterationParams:
     max_retry_count: Union[None, Unset, int] = UNSET
     num_workers: Union[None, Unset, int] = UNSET
     prefetch_factor: Union[None, Unset, int] = UNSET
+    prefetch_autotune: Union[None, Unset, bool] = UNSET
+    prefetch_priority: Union[None, Unset, float] = UNSET
     in_order: Union[None, Unset, bool] = UNSET
     additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
 
@@ -117,6 +134,18 @@ class CreateIterationParams:
         else:
             preprocessors = self.preprocessors
 
+        mixture: Union[None, Unset, list[dict[str, Any]]]
+        if isinstance(self.mixture, Unset):
+            mixture = UNSET
+        elif isinstance(self.mixture, list):
+            mixture = []
+            for mixture_type_0_item_data in self.mixture:
+                mixture_type_0_item = mixture_type_0_item_data.to_dict()
+                mixture.append(mixture_type_0_item)
+
+        else:
+            mixture = self.mixture
+
         shuffle: Union[None, Unset, bool]
         if isinstance(self.shuffle, Unset):
             shuffle = UNSET
@@ -135,12 +164,42 @@ class CreateIterationParams:
         else:
             shuffle_block_size = self.shuffle_block_size
 
+        shuffle_mode: Union[None, Unset, str]
+        if isinstance(self.shuffle_mode, Unset):
+            shuffle_mode = UNSET
+        else:
+            shuffle_mode = self.shuffle_mode
+
+        shuffle_buffer_size: Union[None, Unset, int]
+        if isinstance(self.shuffle_buffer_size, Unset):
+            shuffle_buffer_size = UNSET
+        else:
+            shuffle_buffer_size = self.shuffle_buffer_size
+
         batch_size: Union[None, Unset, int]
         if isinstance(self.batch_size, Unset):
             batch_size = UNSET
         else:
             batch_size = self.batch_size
 
+        batch_token_budget: Union[None, Unset, int]
+        if isinstance(self.batch_token_budget, Unset):
+            batch_token_budget = UNSET
+        else:
+            batch_token_budget = self.batch_token_budget
+
+        batch_length_column: Union[None, Unset, str]
+        if isinstance(self.batch_length_column, Unset):
+            batch_length_column = UNSET
+        else:
+            batch_length_column = self.batch_length_column
+
+        batch_window_size: Union[None, Unset, int]
+        if isinstance(self.batch_window_size, Unset):
+            batch_window_size = UNSET
+        else:
+            batch_window_size = self.batch_window_size
+
         replication_pg: Union[None, Unset, list[list[int]]]
         if isinstance(self.replication_pg, Unset):
             replication_pg = UNSET
@@ -196,6 +255,18 @@ class CreateIterationParams:
         else:
             prefetch_factor = self.prefetch_factor
 
+        prefetch_autotune: Union[None, Unset, bool]
+        if isinstance(self.prefetch_autotune, Unset):
+            prefetch_autotune = UNSET
+        else:
+            prefetch_autotune = self.prefetch_autotune
+
+        prefetch_priority: Union[None, Unset, float]
+        if isinstance(self.prefetch_priority, Unset):
+            prefetch_priority = UNSET
+        else:
+            prefetch_priority = self.prefetch_priority
+
         in_order: Union[None, Unset, bool]
         if isinstance(self.in_order, Unset):
             in_order = UNSET
@@ -219,14 +290,26 @@ class CreateIterationParams:
             field_dict["collater"] = collater
         if preprocessors is not UNSET:
             field_dict["preprocessors"] = preprocessors
+        if mixture is not UNSET:
+            field_dict["mixture"] = mixture
         if shuffle is not UNSET:
             field_dict["shuffle"] = shuffle
         if shuffle_seed is not UNSET:
             field_dict["shuffle_seed"] = shuffle_seed
         if shuffle_block_size is not UNSET:
             field_dict["shuffle_block_size"] = shuffle_block_size
+        if shuffle_mode is not UNSET:
+            field_dict["shuffle_mode"] = shuffle_mode
+        if shuffle_buffer_size is not UNSET:
+            field_dict["shuffle_buffer_size"] = shuffle_buffer_size
         if batch_size is not UNSET:
             field_dict["batch_size"] = batch_size
+        if batch_token_budget is not UNSET:
+            field_dict["batch_token_budget"] = batch_token_budget
+        if batch_length_column is not UNSET:
+            field_dict["batch_length_column"] = batch_length_column
+        if batch_window_size is not UNSET:
+            field_dict["batch_window_size"] = batch_window_size
         if replication_pg is not UNSET:
             field_dict["replication_pg"] = replication_pg
         if rank is not UNSET:
@@ -243,6 +326,10 @@ class CreateIterationParams:
             field_dict["num_workers"] = num_workers
         if prefetch_factor is not UNSET:
             field_dict["prefetch_factor"] = prefetch_factor
+        if prefetch_autotune is not UNSET:
+            field_dict["prefetch_autotune"] = prefetch_autotune
+        if prefetch_priority is not UNSET:
+            field_dict["prefetch_priority"] = prefetch_priority
         if in_order is not UNSET:
             field_dict["in_order"] = in_order
 
@@ -253,6 +340,7 @@ class CreateIterationParams:
         from ..models.iteration_categorizer import IterationCategorizer
         from ..models.iteration_collater import IterationCollater
         from ..models.iteration_filter import IterationFilter
+        from ..models.iteration_mixture_component import IterationMixtureComponent
         from ..models.iteration_preprocessor import IterationPreprocessor
 
         d = dict(src_dict)
@@ -353,6 +441,28 @@ class CreateIterationParams:
 
         preprocessors = _parse_preprocessors(d.pop("preprocessors", UNSET))
 
+        def _parse_mixture(data: object) -> Union[None, Unset, list["IterationMixtureComponent"]]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            try:
+                if not isinstance(data, list):
+                    raise TypeError()
+                mixture_type_0 = []
+                _mixture_type_0 = data
+                for mixture_type_0_item_data in _mixture_type_0:
+                    mixture_type_0_item = IterationMixtureComponent.from_dict(mixture_type_0_item_data)
+
+                    mixture_type_0.append(mixture_type_0_item)
+
+                return mixture_type_0
+            except:  # noqa: E722
+                pass
+            return cast(Union[None, Unset, list["IterationMixtureComponent"]], data)
+
+        mixture = _parse_mixture(d.pop("mixture", UNSET))
+
         def _parse_shuffle(data: object) -> Union[None, Unset, bool]:
             if data is None:
                 return data
@@ -380,6 +490,24 @@ class CreateIterationParams:
 
         shuffle_block_size = _parse_shuffle_block_size(d.pop("shuffle_block_size", UNSET))
 
+        def _parse_shuffle_mode(data: object) -> Union[None, Unset, str]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, str], data)
+
+        shuffle_mode = _parse_shuffle_mode(d.pop("shuffle_mode", UNSET))
+
+        def _parse_shuffle_buffer_size(data: object) -> Union[None, Unset, int]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, int], data)
+
+        shuffle_buffer_size = _parse_shuffle_buffer_size(d.pop("shuffle_buffer_size", UNSET))
+
         def _parse_batch_size(data: object) -> Union[None, Unset, int]:
             if data is None:
                 return data
@@ -389,6 +517,33 @@ class CreateIterationParams:
 
         batch_size = _parse_batch_size(d.pop("batch_size", UNSET))
 
+        def _parse_batch_token_budget(data: object) -> Union[None, Unset, int]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, int], data)
+
+        batch_token_budget = _parse_batch_token_budget(d.pop("batch_token_budget", UNSET))
+
+        def _parse_batch_length_column(data: object) -> Union[None, Unset, str]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, str], data)
+
+        batch_length_column = _parse_batch_length_column(d.pop("batch_length_column", UNSET))
+
+        def _parse_batch_window_size(data: object) -> Union[None, Unset, int]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, int], data)
+
+        batch_window_size = _parse_batch_window_size(d.pop("batch_window_size", UNSET))
+
         def _parse_replication_pg(data: object) -> Union[None, Unset, list[list[int]]]:
             if data is None:
                 return data
@@ -474,6 +629,24 @@ class CreateIterationParams:
 
         prefetch_factor = _parse_prefetch_factor(d.pop("prefetch_factor", UNSET))
 
+        def _parse_prefetch_autotune(data: object) -> Union[None, Unset, bool]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, bool], data)
+
+        prefetch_autotune = _parse_prefetch_autotune(d.pop("prefetch_autotune", UNSET))
+
+        def _parse_prefetch_priority(data: object) -> Union[None, Unset, float]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, float], data)
+
+        prefetch_priority = _parse_prefetch_priority(d.pop("prefetch_priority", UNSET))
+
         def _parse_in_order(data: object) -> Union[None, Unset, bool]:
             if data is None:
                 return data
@@ -490,10 +663,16 @@ class CreateIterationParams:
             categorizer=categorizer,
             collater=collater,
             preprocessors=preprocessors,
+            mixture=mixture,
             shuffle=shuffle,
             shuffle_seed=shuffle_seed,
             shuffle_block_size=shuffle_block_size,
+            shuffle_mode=shuffle_mode,
+            shuffle_buffer_size=shuffle_buffer_size,
             batch_size=batch_size,
+            batch_token_budget=batch_token_budget,
+            batch_length_column=batch_length_column,
+            batch_window_size=batch_window_size,
             replication_pg=replication_pg,
             rank=rank,
             world_size=world_size,
@@ -502,6 +681,8 @@ class CreateIterationParams:
             max_retry_count=max_retry_count,
             num_workers=num_workers,
             prefetch_factor=prefetch_factor,
+            prefetch_autotune=prefetch_autotune,
+            prefetch_priority=prefetch_priority,
             in_order=in_order,
         )
 
@@ -13,6 +13,7 @@ if TYPE_CHECKING:
     from ..models.iteration_categorizer import IterationCategorizer
     from ..models.iteration_collater import IterationCollater
     from ..models.iteration_filter import IterationFilter
+    from ..models.iteration_mixture_component import IterationMixtureComponent
     from ..models.iteration_preprocessor import IterationPreprocessor
     from ..models.shardset_with_shards import ShardsetWithShards
 
@@ -34,10 +35,16 @@ class GetIterationResponse:
         categorizer (Union['IterationCategorizer', None, Unset]):
         collater (Union['IterationCollater', None, Unset]):
         preprocessors (Union[None, Unset, list['IterationPreprocessor']]):
+        mixture (Union[None, Unset, list['IterationMixtureComponent']]):
         shuffle (Union[Unset, bool]):  Default: False.
         shuffle_seed (Union[None, Unset, int]):
         shuffle_block_size (Union[None, Unset, int]):
+        shuffle_mode (Union[None, Unset, str]):
+        shuffle_buffer_size (Union[None, Unset, int]):
         batch_size (Union[Unset, int]):  Default: 0.
+        batch_token_budget (Union[None, Unset, int]):
+        batch_length_column (Union[None, Unset, str]):
+        batch_window_size (Union[None, Unset, int]):
         replication_pg (Union[None, Unset, list[list[int]]]):
     """
 
@@ -51,10 +58,16 @@ class GetIterationResponse:
     categorizer: Union["IterationCategorizer", None, Unset] = UNSET
     collater: Union["IterationCollater", None, Unset] = UNSET
     preprocessors: Union[None, Unset, list["IterationPreprocessor"]] = UNSET
+    mixture: Union[None, Unset, list["IterationMixtureComponent"]] = UNSET
     shuffle: Union[Unset, bool] = False
     shuffle_seed: Union[None, Unset, int] = UNSET
     shuffle_block_size: Union[None, Unset, int] = UNSET
+    shuffle_mode: Union[None, Unset, str] = UNSET
+    shuffle_buffer_size: Union[None, Unset, int] = UNSET
     batch_size: Union[Unset, int] = 0
+    batch_token_budget: Union[None, Unset, int] = UNSET
+    batch_length_column: Union[None, Unset, str] = UNSET
+    batch_window_size: Union[None, Unset, int] = UNSET
     replication_pg: Union[None, Unset, list[list[int]]] = UNSET
     additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
 
@@ -117,6 +130,18 @@ class GetIterationResponse:
         else:
             preprocessors = self.preprocessors
 
+        mixture: Union[None, Unset, list[dict[str, Any]]]
+        if isinstance(self.mixture, Unset):
+            mixture = UNSET
+        elif isinstance(self.mixture, list):
+            mixture = []
+            for mixture_type_0_item_data in self.mixture:
+                mixture_type_0_item = mixture_type_0_item_data.to_dict()
+                mixture.append(mixture_type_0_item)
+
+        else:
+            mixture = self.mixture
+
         shuffle = self.shuffle
 
         shuffle_seed: Union[None, Unset, int]
@@ -131,8 +156,38 @@ class GetIterationResponse:
         else:
             shuffle_block_size = self.shuffle_block_size
 
+        shuffle_mode: Union[None, Unset, str]
+        if isinstance(self.shuffle_mode, Unset):
+            shuffle_mode = UNSET
+        else:
+            shuffle_mode = self.shuffle_mode
+
+        shuffle_buffer_size: Union[None, Unset, int]
+        if isinstance(self.shuffle_buffer_size, Unset):
+            shuffle_buffer_size = UNSET
+        else:
+            shuffle_buffer_size = self.shuffle_buffer_size
+
         batch_size = self.batch_size
 
+        batch_token_budget: Union[None, Unset, int]
+        if isinstance(self.batch_token_budget, Unset):
+            batch_token_budget = UNSET
+        else:
+            batch_token_budget = self.batch_token_budget
+
+        batch_length_column: Union[None, Unset, str]
+        if isinstance(self.batch_length_column, Unset):
+            batch_length_column = UNSET
+        else:
+            batch_length_column = self.batch_length_column
+
+        batch_window_size: Union[None, Unset, int]
+        if isinstance(self.batch_window_size, Unset):
+            batch_window_size = UNSET
+        else:
+            batch_window_size = self.batch_window_size
+
         replication_pg: Union[None, Unset, list[list[int]]]
         if isinstance(self.replication_pg, Unset):
             replication_pg = UNSET
@@ -168,14 +223,26 @@ class GetIterationResponse:
             field_dict["collater"] = collater
         if preprocessors is not UNSET:
             field_dict["preprocessors"] = preprocessors
+        if mixture is not UNSET:
+            field_dict["mixture"] = mixture
         if shuffle is not UNSET:
             field_dict["shuffle"] = shuffle
         if shuffle_seed is not UNSET:
             field_dict["shuffle_seed"] = shuffle_seed
         if shuffle_block_size is not UNSET:
             field_dict["shuffle_block_size"] = shuffle_block_size
+        if shuffle_mode is not UNSET:
+            field_dict["shuffle_mode"] = shuffle_mode
+        if shuffle_buffer_size is not UNSET:
+            field_dict["shuffle_buffer_size"] = shuffle_buffer_size
         if batch_size is not UNSET:
             field_dict["batch_size"] = batch_size
+        if batch_token_budget is not UNSET:
+            field_dict["batch_token_budget"] = batch_token_budget
+        if batch_length_column is not UNSET:
+            field_dict["batch_length_column"] = batch_length_column
+        if batch_window_size is not UNSET:
+            field_dict["batch_window_size"] = batch_window_size
         if replication_pg is not UNSET:
             field_dict["replication_pg"] = replication_pg
 
@@ -187,6 +254,7 @@ class GetIterationResponse:
         from ..models.iteration_categorizer import IterationCategorizer
         from ..models.iteration_collater import IterationCollater
         from ..models.iteration_filter import IterationFilter
+        from ..models.iteration_mixture_component import IterationMixtureComponent
         from ..models.iteration_preprocessor import IterationPreprocessor
         from ..models.shardset_with_shards import ShardsetWithShards
 
@@ -286,6 +354,28 @@ class GetIterationResponse:
 
         preprocessors = _parse_preprocessors(d.pop("preprocessors", UNSET))
 
+        def _parse_mixture(data: object) -> Union[None, Unset, list["IterationMixtureComponent"]]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            try:
+                if not isinstance(data, list):
+                    raise TypeError()
+                mixture_type_0 = []
+                _mixture_type_0 = data
+                for mixture_type_0_item_data in _mixture_type_0:
+                    mixture_type_0_item = IterationMixtureComponent.from_dict(mixture_type_0_item_data)
+
+                    mixture_type_0.append(mixture_type_0_item)
+
+                return mixture_type_0
+            except:  # noqa: E722
+                pass
+            return cast(Union[None, Unset, list["IterationMixtureComponent"]], data)
+
+        mixture = _parse_mixture(d.pop("mixture", UNSET))
+
         shuffle = d.pop("shuffle", UNSET)
 
         def _parse_shuffle_seed(data: object) -> Union[None, Unset, int]:
@@ -306,8 +396,53 @@ class GetIterationResponse:
 
         shuffle_block_size = _parse_shuffle_block_size(d.pop("shuffle_block_size", UNSET))
 
+        def _parse_shuffle_mode(data: object) -> Union[None, Unset, str]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, str], data)
+
+        shuffle_mode = _parse_shuffle_mode(d.pop("shuffle_mode", UNSET))
+
+        def _parse_shuffle_buffer_size(data: object) -> Union[None, Unset, int]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, int], data)
+
+        shuffle_buffer_size = _parse_shuffle_buffer_size(d.pop("shuffle_buffer_size", UNSET))
+
         batch_size = d.pop("batch_size", UNSET)
 
+        def _parse_batch_token_budget(data: object) -> Union[None, Unset, int]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, int], data)
+
+        batch_token_budget = _parse_batch_token_budget(d.pop("batch_token_budget", UNSET))
+
+        def _parse_batch_length_column(data: object) -> Union[None, Unset, str]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, str], data)
+
+        batch_length_column = _parse_batch_length_column(d.pop("batch_length_column", UNSET))
+
+        def _parse_batch_window_size(data: object) -> Union[None, Unset, int]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, int], data)
+
+        batch_window_size = _parse_batch_window_size(d.pop("batch_window_size", UNSET))
+
         def _parse_replication_pg(data: object) -> Union[None, Unset, list[list[int]]]:
             if data is None:
                 return data
@@ -341,10 +476,16 @@ class GetIterationResponse:
             categorizer=categorizer,
             collater=collater,
             preprocessors=preprocessors,
+            mixture=mixture,
             shuffle=shuffle,
             shuffle_seed=shuffle_seed,
             shuffle_block_size=shuffle_block_size,
+            shuffle_mode=shuffle_mode,
+            shuffle_buffer_size=shuffle_buffer_size,
             batch_size=batch_size,
+            batch_token_budget=batch_token_budget,
+            batch_length_column=batch_length_column,
+            batch_window_size=batch_window_size,
             replication_pg=replication_pg,
         )
 
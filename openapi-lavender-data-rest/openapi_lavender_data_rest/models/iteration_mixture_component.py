@@ -0,0 +1,100 @@
+from collections.abc import Mapping
+from typing import Any, TypeVar, Union, cast
+
+from attrs import define as _attrs_define
+from attrs import field as _attrs_field
+
+from ..types import UNSET, Unset
+
+T = TypeVar("T", bound="IterationMixtureComponent")
+
+
+@_attrs_define
+class IterationMixtureComponent:
+    """
+    Attributes:
+        dataset_id (str):
+        weight (float):
+        shardsets (Union[None, Unset, list[str]]):
+    """
+
+    dataset_id: str
+    weight: float
+    shardsets: Union[None, Unset, list[str]] = UNSET
+    additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        dataset_id = self.dataset_id
+
+        weight = self.weight
+
+        shardsets: Union[None, Unset, list[str]]
+        if isinstance(self.shardsets, Unset):
+            shardsets = UNSET
+        elif isinstance(self.shardsets, list):
+            shardsets = self.shardsets
+
+        else:
+            shardsets = self.shardsets
+
+        field_dict: dict[str, Any] = {}
+        field_dict.update(self.additional_properties)
+        field_dict.update(
+            {
+                "dataset_id": dataset_id,
+                "weight": weight,
+            }
+        )
+        if shardsets is not UNSET:
+            field_dict["shardsets"] = shardsets
+
+        return field_dict
+
+    @classmethod
+    def from_dict(cls: type[T], src_dict: Mapping[str, Any]) -> T:
+        d = dict(src_dict)
+        dataset_id = d.pop("dataset_id")
+
+        weight = d.pop("weight")
+
+        def _parse_shardsets(data: object) -> Union[None, Unset, list[str]]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            try:
+                if not isinstance(data, list):
+                    raise TypeError()
+                shardsets_type_0 = cast(list[str], data)
+
+                return shardsets_type_0
+            except:  # noqa: E722
+                pass
+            return cast(Union[None, Unset, list[str]], data)
+
+        shardsets = _parse_shardsets(d.pop("shardsets", UNSET))
+
+        iteration_mixture_component = cls(
+            dataset_id=dataset_id,
+            weight=weight,
+            shardsets=shardsets,
+        )
+
+        iteration_mixture_component.additional_properties = d
+        return iteration_mixture_component
+
+    @property
+    def additional_keys(self) -> list[str]:
+        return list(self.additional_properties.keys())
+
+    def __getitem__(self, key: str) -> Any:
+        return self.additional_properties[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.additional_properties[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.additional_properties[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.additional_properties
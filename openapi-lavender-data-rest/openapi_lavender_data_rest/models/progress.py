@@ -1,9 +1,11 @@
 from collections.abc import Mapping
-from typing import TYPE_CHECKING, Any, TypeVar
+from typing import TYPE_CHECKING, Any, TypeVar, Union
 
 from attrs import define as _attrs_define
 from attrs import field as _attrs_field
 
+from ..types import UNSET, Unset
+
 if TYPE_CHECKING:
     from ..models.in_progress_index import InProgressIndex
 
@@ -21,6 +23,8 @@ class Progress:
         completed (int):
         filtered (int):
         failed (int):
+        batched_tokens (Union[Unset, int]):  Default: 0.
+        padded_tokens (Union[Unset, int]):  Default: 0.
     """
 
     total: int
@@ -29,6 +33,8 @@ class Progress:
     completed: int
     filtered: int
     failed: int
+    batched_tokens: Union[Unset, int] = 0
+    padded_tokens: Union[Unset, int] = 0
     additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
 
     def to_dict(self) -> dict[str, Any]:
@@ -47,6 +53,10 @@ class Progress:
 
         failed = self.failed
 
+        batched_tokens = self.batched_tokens
+
+        padded_tokens = self.padded_tokens
+
         field_dict: dict[str, Any] = {}
         field_dict.update(self.additional_properties)
         field_dict.update(
@@ -59,6 +69,10 @@ class Progress:
                 "failed": failed,
             }
         )
+        if batched_tokens is not UNSET:
+            field_dict["batched_tokens"] = batched_tokens
+        if padded_tokens is not UNSET:
+            field_dict["padded_tokens"] = padded_tokens
 
         return field_dict
 
@@ -84,6 +98,10 @@ class Progress:
 
         failed = d.pop("failed")
 
+        batched_tokens = d.pop("batched_tokens", UNSET)
+
+        padded_tokens = d.pop("padded_tokens", UNSET)
+
         progress = cls(
             total=total,
             current=current,
@@ -91,6 +109,8 @@ class Progress:
             completed=completed,
             filtered=filtered,
             failed=failed,
+            batched_tokens=batched_tokens,
+            padded_tokens=padded_tokens,
         )
 
         progress.additional_properties = d
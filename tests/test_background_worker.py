@@ -2,13 +2,23 @@ import os
 import random
 import time
 import unittest
+from multiprocessing import shared_memory
+from unittest import mock
+
+import numpy as np
 
 from lavender_data.server.cache import setup_cache
 from lavender_data.server.background_worker import (
     TaskStatus,
     setup_background_worker,
     get_background_worker,
+    share_arrays,
+    load_arrays,
+    mapped_arrays,
+    free_arrays,
 )
+from lavender_data.server.background_worker import memory
+from lavender_data.server.background_worker.memory import SharedArray
 
 
 def write_task(filename: str):
@@ -57,3 +67,67 @@ class TestBackgroundWorker(unittest.TestCase):
                 raise Exception("Timeout")
 
         os.remove(filename)
+
+
+class TestSharedArrays(unittest.TestCase):
+    def test_share_arrays(self):
+        image = np.random.randint(0, 255, (4, 128, 128, 3), dtype=np.uint8)
+        crops = [np.random.rand(128, 128) for _ in range(2)]
+        ids = np.array([1, 2, 3, 4])
+        batch = {"image": image, "crops": crops, "id": ids, "caption": ["a"] * 4}
+
+        shared = share_arrays(batch)
+        self.assertIsInstance(shared["image"], SharedArray)
+        self.assertTrue(all(isinstance(c, SharedArray) for c in shared["crops"]))
+        # small arrays are pickled as they are
+        self.assertIs(shared["id"], ids)
+        self.assertEqual(shared["caption"], batch["caption"])
+
+        loaded = load_arrays(shared)
+        np.testing.assert_array_equal(loaded["image"], image)
+        self.assertEqual(loaded["image"].dtype, np.uint8)
+        for crop, original in zip(loaded["crops"], crops):
+            np.testing.assert_array_equal(crop, original)
+        np.testing.assert_array_equal(loaded["id"], ids)
+
+        # the memory is freed once loaded
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shared["image"].name)
+
+        # or when the batch is not loaded, and again without failing
+        shared = share_arrays(batch)
+        free_arrays(shared)
+        free_arrays(shared)
+        for value in [shared["image"], *shared["crops"]]:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=value.name)
+
+    def test_mapped_arrays(self):
+        image = np.random.randint(0, 255, (4, 128, 128, 3), dtype=np.uint8)
+        batch = {"image": image, "crops": [image[:2].copy()], "id": [1, 2, 3, 4]}
+
+        # handed over to the process that maps the batch
+        with mock.patch.object(memory.resource_tracker, "unregister") as unregister:
+            shared = share_arrays(batch)
+        self.assertEqual(unregister.call_count, 2)
+
+        with mapped_arrays(shared) as mapped:
+            # views on the shared memory, not copies
+            self.assertFalse(mapped["image"].flags.owndata)
+            np.testing.assert_array_equal(mapped["image"], image)
+            np.testing.assert_array_equal(mapped["crops"][0], image[:2])
+            self.assertEqual(mapped["id"], [1, 2, 3, 4])
+            # unlinked right away, the mapping stays valid
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=shared["image"].name)
+            result = share_arrays({"image": mapped["image"] + 1})
+            kept = mapped["crops"][0]
+        self.assertEqual(mapped, {})
+        np.testing.assert_array_equal(load_arrays(result)["image"], image + 1)
+
+        # a view kept after the context defers the unmapping to the next batch
+        self.assertEqual(len(memory._unclosed_memories), 1)
+        del kept
+        with mapped_arrays({}):
+            pass
+        self.assertEqual(memory._unclosed_memories, [])
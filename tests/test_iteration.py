@@ -1,8 +1,13 @@
 import unittest
+import threading
 import time
 import shutil
 import tqdm
 import os
+from unittest import mock
+
+import httpx
+import numpy as np
 
 from lavender_data.server import (
     Preprocessor,
@@ -13,12 +18,20 @@ from lavender_data.client.api import (
     init,
     create_dataset,
     create_shardset,
+    get_progress,
+    get_dataset,
     DatasetColumnOptions,
 )
 from lavender_data.client import LavenderDataLoader
 from lavender_data.client.api import LavenderDataApiError
+from lavender_data.server.cache import setup_cache
+from lavender_data.server.iteration.prefetcher import (
+    IterationPrefetcher,
+    PrefetchDepthTuner,
+)
+from lavender_data.server.iteration.scheduler import PrefetchScheduler
 
-from tests.utils.shards import create_test_shards
+from tests.utils.shards import create_test_shard, create_test_shards
 from tests.utils.start_server import (
     get_free_port,
     start_server,
@@ -57,6 +70,17 @@ class FailOnceInTwoSamples(Preprocessor):
             return sample
 
 
+class ImagePreprocessor(Preprocessor):
+    name = "image_preprocessor"
+
+    def process(self, batch: dict) -> dict:
+        ids = np.asarray(batch["id"])
+        return {
+            "pid": os.getpid(),
+            "image": np.broadcast_to(ids[:, None, None], (len(ids), 128, 128)).copy(),
+        }
+
+
 class AspectRatioCategorizer(Categorizer):
     name = "aspect_ratio_categorizer"
 
@@ -322,6 +346,158 @@ class TestIteration(unittest.TestCase):
                 self.assertEqual(batch["width"][i], width)
                 self.assertEqual(batch["height"][i], height)
 
+    def test_iteration_with_token_budget(self):
+        dataloader = LavenderDataLoader(
+            self.dataset_id,
+            shardsets=[self.shardset_id],
+            batch_size=10,
+            batch_token_budget=6400,
+            batch_length_column="width",
+            batch_window_size=40,
+        )
+        ids = []
+        batched_tokens = 0
+        padded_tokens = 0
+        for batch in tqdm.tqdm(dataloader, desc="test_iteration_with_token_budget"):
+            self.assertGreater(len(batch["width"]), 0)
+            self.assertLessEqual(len(batch["width"]), 10)
+            self.assertLessEqual(max(batch["width"]) * len(batch["width"]), 6400)
+            ids.extend(batch["id"])
+            batched_tokens += sum(batch["width"])
+            padded_tokens += max(batch["width"]) * len(batch["width"])
+        self.assertEqual(sorted(ids), list(range(self.total_samples)))
+
+        progress = get_progress(dataloader._iteration_id)
+        self.assertEqual(progress.batched_tokens, batched_tokens)
+        self.assertEqual(progress.padded_tokens, padded_tokens)
+
+    def test_iteration_with_mixture(self):
+        response = create_dataset(f"test-dataset-{time.time()}", uid_column_name="id")
+        dataset_id = response.id
+        test_dir = f".cache/{dataset_id}"
+        os.makedirs(test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, test_dir)
+        for i in range(6):
+            create_test_shard(
+                f"{test_dir}/shard.{i:05d}.csv",
+                [
+                    {
+                        "id": 1000 + i * 10 + j,
+                        "image_url": f"https://example.com/image-{i * 10 + j:05d}.png",
+                        "caption": f"Caption for image {i * 10 + j:05d}",
+                        "width": 640,
+                        "height": 360,
+                    }
+                    for j in range(10)
+                ],
+            )
+        # batches mix the samples of both, so they have the same columns
+        response = create_shardset(
+            dataset_id=dataset_id,
+            location=f"file://{test_dir}",
+            columns=[
+                DatasetColumnOptions(name=c.name, type_=c.type_)
+                for c in get_dataset(self.dataset_id).columns
+            ],
+        )
+        time.sleep(3)
+
+        dataloader = LavenderDataLoader(
+            mixture=[
+                {"dataset_id": self.dataset_id, "weight": 3},
+                {"dataset_id": dataset_id, "shardsets": [response.id], "weight": 1},
+            ],
+            batch_size=4,
+        )
+        self.assertEqual(dataloader._total, self.total_samples + 60)
+
+        batches = [
+            batch for batch in tqdm.tqdm(dataloader, desc="test_iteration_with_mixture")
+        ]
+        # 3 samples of the first dataset for each of the second one, until the
+        # first one runs out
+        for batch in batches[:33]:
+            self.assertEqual([id >= 1000 for id in batch["id"]], [False] * 3 + [True])
+        ids = [id for batch in batches for id in batch["id"]]
+        self.assertEqual(
+            sorted(ids), list(range(self.total_samples)) + list(range(1000, 1060))
+        )
+
+    def test_iteration_with_process_preprocessing(self):
+        port = get_free_port()
+        server = start_server(
+            port,
+            {
+                "LAVENDER_DATA_DISABLE_AUTH": "true",
+                "LAVENDER_DATA_DB_URL": f"sqlite:///{self.db}",
+                "LAVENDER_DATA_MODULES_DIR": "./tests/",
+                "LAVENDER_DATA_PREPROCESS_MODE": "process",
+            },
+        )
+        self.addCleanup(stop_server, server)
+        wait_server_ready(server, port)
+
+        ids = []
+        for batch in tqdm.tqdm(
+            LavenderDataLoader(
+                self.dataset_id,
+                shardsets=[self.shardset_id],
+                batch_size=10,
+                preprocessors=["image_preprocessor"],
+                api_url=f"http://localhost:{port}",
+            ),
+            desc="test_iteration_with_process_preprocessing",
+        ):
+            # preprocessed in a worker process, not the server
+            self.assertNotEqual(batch["pid"], server.pid)
+            self.assertEqual(batch["image"].shape, (10, 128, 128))
+            for id, image in zip(batch["id"], batch["image"]):
+                self.assertTrue(np.all(image == id))
+            ids.extend(batch["id"])
+        self.assertEqual(sorted(ids), list(range(self.total_samples)))
+
+    def test_iteration_with_prefetch_autotune(self):
+        dataloader = LavenderDataLoader(
+            self.dataset_id,
+            shardsets=[self.shardset_id],
+            batch_size=10,
+            num_workers=2,
+            prefetch_autotune=True,
+        )
+        ids = []
+        for batch in tqdm.tqdm(
+            dataloader, desc="test_iteration_with_prefetch_autotune"
+        ):
+            ids.extend(batch["id"])
+            time.sleep(0.05)
+        self.assertEqual(sorted(ids), list(range(self.total_samples)))
+
+        stats = httpx.get(
+            f"{self.api_url}/iterations/{dataloader._iteration_id}/prefetcher-stats"
+        ).json()
+        self.assertTrue(stats["0"]["autotune"])
+        self.assertGreaterEqual(stats["0"]["depth"], 1)
+        self.assertGreater(stats["0"]["consume_interval"], 0)
+        self.assertGreater(stats["0"]["produce_latency"], 0)
+
+    def test_iteration_with_prefetch_priority(self):
+        dataloader = LavenderDataLoader(
+            self.dataset_id,
+            shardsets=[self.shardset_id],
+            batch_size=10,
+            prefetch_priority=2.0,
+        )
+        ids = []
+        for batch in tqdm.tqdm(
+            dataloader, desc="test_iteration_with_prefetch_priority"
+        ):
+            ids.extend(batch["id"])
+
+            stats = httpx.get(f"{self.api_url}/iterations/prefetch-scheduler-stats")
+            owner = stats.json()["owners"][f"{dataloader._iteration_id}:0"]
+            self.assertEqual(owner["weight"], 2.0)
+        self.assertEqual(sorted(ids), list(range(self.total_samples)))
+
     def test_iteration_with_preprocessor(self):
         read_samples = 0
         for i, sample in tqdm.tqdm(
@@ -358,3 +534,149 @@ class TestIteration(unittest.TestCase):
             self.assertEqual(sample["caption"], f"Caption for image {i:05d}")
             read_samples += 1
         self.assertEqual(read_samples, self.total_samples)
+
+
+class TestPrefetchDepthTuner(unittest.TestCase):
+    def test_depth_covers_produce_latency(self):
+        tuner = PrefetchDepthTuner(initial_depth=2, max_depth=64, cache_ttl=300)
+        self.assertEqual(tuner.depth, 2)
+
+        now = 0.0
+        for _ in range(20):
+            tuner.produced(0.95)
+            tuner.consumed(now)
+            now += 0.1
+        # 0.95 seconds to produce a batch, a batch taken every 0.1 seconds
+        self.assertEqual(tuner.depth, 10)
+
+        # the consumer slows down
+        for _ in range(50):
+            tuner.produced(0.95)
+            tuner.consumed(now)
+            now += 0.6
+        self.assertEqual(tuner.depth, 2)
+
+    def test_depth_grows_on_starvation(self):
+        tuner = PrefetchDepthTuner(initial_depth=1, max_depth=64, cache_ttl=300)
+        now = 0.0
+        for _ in range(5):
+            tuner.produced(0.05)
+            tuner.starved()
+            tuner.consumed(now)
+            now += 0.1
+        self.assertEqual(tuner.depth, 1 + 5)
+
+        # the headroom is given back once the consumer is not starved
+        for _ in range(100):
+            tuner.produced(0.05)
+            tuner.consumed(now)
+            now += 0.1
+        self.assertEqual(tuner.depth, 1)
+
+    def test_depth_is_bounded(self):
+        tuner = PrefetchDepthTuner(initial_depth=1, max_depth=8, cache_ttl=300)
+        now = 0.0
+        for _ in range(5):
+            tuner.produced(10.0)
+            tuner.consumed(now)
+            now += 0.01
+        self.assertEqual(tuner.depth, 8)
+
+        # batches must not wait in the cache for more than half the TTL
+        tuner = PrefetchDepthTuner(initial_depth=1, max_depth=64, cache_ttl=10)
+        now = 0.0
+        for _ in range(5):
+            tuner.produced(100.0)
+            tuner.consumed(now)
+            now += 1.0
+        self.assertEqual(tuner.depth, 5)
+
+
+class TestPrefetchScheduler(unittest.TestCase):
+    def test_weighted_fair_share(self):
+        scheduler = PrefetchScheduler(workers=1)
+        self.addCleanup(scheduler.shutdown)
+        scheduler.register("a", weight=1.0)
+        scheduler.register("b", weight=3.0)
+
+        done = []
+        lock = threading.Lock()
+
+        def task(owner: str):
+            time.sleep(0.01)
+            with lock:
+                done.append(owner)
+
+        for _ in range(40):
+            scheduler.submit("a", task, "a")
+            scheduler.submit("b", task, "b")
+
+        time.sleep(0.6)
+        with lock:
+            ran = list(done)
+        # b is given about three times the time of a while both are busy
+        self.assertGreater(ran.count("b"), 2 * ran.count("a"))
+        self.assertGreater(ran.count("a"), 0)
+
+    def test_concurrency_and_remove(self):
+        scheduler = PrefetchScheduler(workers=4)
+        self.addCleanup(scheduler.shutdown)
+        scheduler.register("a", concurrency=2)
+
+        running = 0
+        max_running = 0
+        lock = threading.Lock()
+
+        def task():
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+
+        for _ in range(10):
+            scheduler.submit("a", task)
+        time.sleep(0.12)
+        self.assertTrue(scheduler.remove("a", timeout=5.0))
+        self.assertEqual(max_running, 2)
+        self.assertEqual(running, 0)
+        self.assertEqual(scheduler.stats().queued, 0)
+
+        # the tasks of a removed owner are dropped
+        scheduler.submit("a", task)
+        self.assertEqual(scheduler.stats().queued, 0)
+
+
+class TestIterationPrefetcher(unittest.TestCase):
+    def test_submit_error(self):
+        setup_cache()
+        scheduler = PrefetchScheduler(workers=1)
+        self.addCleanup(scheduler.shutdown)
+        with mock.patch.dict(
+            os.environ, {"LAVENDER_DATA_READER_LOOKAHEAD_SHARDS": "0"}
+        ):
+            prefetcher = IterationPrefetcher(
+                "test-submit-error",
+                state=mock.MagicMock(),
+                max_retry_count=0,
+                no_cache=False,
+                num_workers=1,
+                prefetch_factor=1,
+                in_order=True,
+                scheduler=scheduler,
+            )
+
+        with mock.patch.object(
+            prefetcher, "_submit_prefetch", side_effect=ValueError("broken state")
+        ):
+            prefetcher.start(0)
+            prefetcher.done_event[0].wait(5.0)
+
+            # the error is raised instead of waiting for batches forever
+            with self.assertRaisesRegex(ValueError, "broken state"):
+                prefetcher.get_next(0)
+            self.assertFalse(prefetcher.submitting[0])
+            self.assertTrue(prefetcher.all_submitted_event[0].is_set())
+            prefetcher.shutdown()
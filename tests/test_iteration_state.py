@@ -2,7 +2,10 @@ import os
 import unittest
 import random
 import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
+from unittest import mock
 import numpy as np
 import tqdm
 from datetime import datetime
@@ -13,12 +16,23 @@ from lavender_data.server.db.models import (
     DatasetColumn,
     Shard,
     Dataset,
+    ShardStatistics,
 )
 from lavender_data.server.shardset import span
 from lavender_data.server.iteration import (
+    MixtureIterationState,
+    open_iteration_state,
     IterationState,
     IterationStateException,
 )
+from lavender_data.server.iteration.iteration_state.packing import (
+    pack_by_length,
+    sample_length,
+)
+from lavender_data.server.iteration.iteration_state.permutation import (
+    FeistelPermutation,
+    permuted_indices,
+)
 
 
 class TestIterationState(unittest.TestCase):
@@ -40,7 +54,10 @@ class TestIterationState(unittest.TestCase):
         shuffle: bool = False,
         shuffle_seed: Optional[int] = None,
         shuffle_block_size: Optional[int] = None,
+        shuffle_mode: Optional[str] = None,
+        shuffle_buffer_size: Optional[int] = None,
         replication_pg: Optional[list[list[int]]] = None,
+        filters: Optional[list[dict]] = None,
     ):
         for key in self.cache.keys(f"test:it-{uid}:*"):
             self.cache.delete(key)
@@ -52,7 +69,10 @@ class TestIterationState(unittest.TestCase):
             shuffle=shuffle,
             shuffle_seed=shuffle_seed,
             shuffle_block_size=shuffle_block_size,
+            shuffle_mode=shuffle_mode,
+            shuffle_buffer_size=shuffle_buffer_size,
             replication_pg=replication_pg,
+            filters=filters,
             batch_size=0,
             worker_endpoint=None,
             dataset=Dataset(
@@ -82,7 +102,7 @@ class TestIterationState(unittest.TestCase):
                     location="test_location_1",
                     shards=[
                         Shard(
-                            id=f"test:sd-{uid}-1",
+                            id=f"test:sd-{uid}-{i}",
                             shardset_id=f"test:ss-{uid}-1",
                             location="test_location_1",
                             filesize=1000,
@@ -113,6 +133,23 @@ class TestIterationState(unittest.TestCase):
             ],
         )
 
+    def _next_items_concurrently(
+        self, iteration_state: IterationState, ranks: list[int]
+    ) -> list[int]:
+        # two threads per rank, popping until the iteration is exhausted
+        def pop_all(rank: int) -> list[int]:
+            retrieved = []
+            while True:
+                try:
+                    retrieved.extend(
+                        i.index for i in iteration_state.next_items(rank, 64)
+                    )
+                except IterationStateException:
+                    return retrieved
+
+        with ThreadPoolExecutor(len(ranks) * 2) as executor:
+            return sum(executor.map(pop_all, ranks * 2), [])
+
     def test_pop_index_no_shuffle(self):
         # Setup
         rank = 0
@@ -170,6 +207,15 @@ class TestIterationState(unittest.TestCase):
                     current_bin = 0
             current_bin += index
 
+        # each block is shuffled differently, the offsets within the shards
+        # would repeat if the same permutation was applied to every block
+        block = shuffle_block_size * self.samples_per_shard
+        offsets = [
+            [i % self.samples_per_shard for i in retrieved_indices[j : j + block]]
+            for j in range(0, self.total_samples, block)
+        ]
+        self.assertEqual(len(set(map(tuple, offsets))), len(offsets))
+
     def test_pop_index_no_shuffle_multiple_ranks(self):
         # Setup
         ranks = [0, 1, 2]
@@ -266,6 +312,362 @@ class TestIterationState(unittest.TestCase):
             self.assertEqual(main_shard.filesize, expected_main_shard.filesize)
             self.assertEqual(main_shard.samples, expected_main_shard.samples)
 
+    def test_next_items(self):
+        rank = 0
+        batch_size = 37
+        iteration = self.get_iteration("test_next_items")
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        items = iteration_state.next_items(rank, batch_size)
+        self.assertEqual([i.index for i in items], list(range(batch_size)))
+        self.assertEqual(
+            sorted(i.index for i in iteration_state.get_progress().inprogress),
+            list(range(batch_size)),
+        )
+
+        # unused indices go back to the head of the queue
+        iteration_state._pushback_indices(rank, [i.index for i in items[10:]])
+        self.assertEqual(len(iteration_state.get_progress().inprogress), 10)
+        self.assertEqual(iteration_state.next_item(rank).index, 10)
+
+        retrieved = list(range(11))
+        while True:
+            try:
+                items = iteration_state.next_items(rank, batch_size)
+            except IterationStateException:
+                break
+            self.assertLessEqual(len(items), batch_size)
+            retrieved.extend(i.index for i in items)
+        self.assertEqual(retrieved, list(range(self.total_samples)))
+
+    def test_next_items_multiple_threads(self):
+        ranks = [0, 1, 2, 3]
+        iteration = self.get_iteration(
+            "test_next_items_multiple_threads",
+            shuffle=True,
+            shuffle_seed=0,
+            shuffle_block_size=3,
+        )
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        retrieved = self._next_items_concurrently(iteration_state, ranks)
+
+        self.assertEqual(len(set(retrieved)), len(retrieved), "duplicate indices")
+        self.assertEqual(set(retrieved), set(range(self.total_samples)))
+        self.assertEqual(
+            len(iteration_state.get_progress().inprogress), self.total_samples
+        )
+
+    def test_feistel_permutation(self):
+        for size in [1, 2, 7, 100, 1000, 4097]:
+            permutation = FeistelPermutation(size, [size, 0])
+            permuted = permutation(np.arange(size))
+            self.assertEqual(sorted(permuted.tolist()), list(range(size)))
+            self.assertEqual(
+                permuted.tolist(),
+                FeistelPermutation(size, [size, 0])(np.arange(size)).tolist(),
+            )
+        self.assertNotEqual(
+            FeistelPermutation(1000, [0, 0])(np.arange(1000)).tolist(),
+            FeistelPermutation(1000, [1, 0])(np.arange(1000)).tolist(),
+        )
+
+        indices = permuted_indices([(10, 19), (50, 54)], [0, 0], 0, 15)
+        self.assertEqual(sorted(indices), list(range(10, 20)) + list(range(50, 55)))
+        self.assertEqual(
+            permuted_indices([(10, 19), (50, 54)], [0, 0], 3, 8), indices[3:8]
+        )
+
+    def test_pack_by_length(self):
+        lengths = [30, 10, 100, 20, 10, 40, 50]
+        batches = pack_by_length(lengths, budget=80, max_samples=3)
+        self.assertEqual(batches, [[1, 4, 3], [0, 5], [6], [2]])
+        for batch in batches:
+            longest = max(lengths[i] for i in batch)
+            self.assertTrue(len(batch) == 1 or longest * len(batch) <= 80)
+        self.assertEqual(sorted(sum(batches, [])), list(range(len(lengths))))
+
+        self.assertEqual(sample_length(np.int64(7)), 7)
+        self.assertEqual(sample_length([1, 2, 3]), 3)
+        self.assertEqual(sample_length(b"abcd"), 4)
+        self.assertEqual(sample_length(np.zeros((5, 2))), 5)
+
+    def test_pop_index_permutation_multiple_threads(self):
+        ranks = [0, 1, 2, 3]
+        iteration = self.get_iteration(
+            "test_pop_index_permutation_multiple_threads",
+            shuffle=True,
+            shuffle_seed=0,
+            shuffle_block_size=3,
+            shuffle_mode="permutation",
+        )
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        retrieved = self._next_items_concurrently(iteration_state, ranks)
+
+        self.assertEqual(len(set(retrieved)), len(retrieved), "duplicate indices")
+        self.assertEqual(set(retrieved), set(range(self.total_samples)))
+        progress = iteration_state.get_progress()
+        self.assertEqual(progress.current, self.total_samples)
+        self.assertEqual(len(progress.inprogress), self.total_samples)
+
+    def test_pop_index_permutation(self):
+        def pop_all(uid: str, shuffle_seed: int) -> list[int]:
+            iteration = self.get_iteration(
+                uid,
+                shuffle=True,
+                shuffle_seed=shuffle_seed,
+                shuffle_block_size=10,
+                shuffle_mode="permutation",
+            )
+            iteration_state = IterationState(iteration.id, self.cache)
+            iteration_state.init(iteration)
+
+            retrieved = []
+            pushed_back = False
+            while True:
+                try:
+                    retrieved.append(iteration_state._pop_index(0))
+                except IterationStateException:
+                    return retrieved
+                if len(retrieved) == 15 and not pushed_back:
+                    pushed_back = True
+                    # cursor of the first block and the pushed back ones
+                    self.assertEqual(iteration_state.get_progress().current, 15)
+                    iteration_state._pushback_indices(0, retrieved[10:])
+                    self.assertEqual(iteration_state.get_progress().current, 10)
+                    retrieved = retrieved[:10]
+
+        retrieved = pop_all("test_pop_index_permutation", 42)
+        self.assertEqual(sorted(retrieved), list(range(self.total_samples)))
+        self.assertNotEqual(retrieved, sorted(retrieved))
+        self.assertEqual(retrieved, pop_all("test_pop_index_permutation", 42))
+        self.assertNotEqual(retrieved, pop_all("test_pop_index_permutation", 43))
+
+    def test_pop_index_permutation_replication_pg(self):
+        replication_pg = [[0, 1], [2, 3]]
+        iteration = self.get_iteration(
+            "test_pop_index_permutation_replication_pg",
+            shuffle=True,
+            shuffle_seed=0,
+            shuffle_block_size=4,
+            shuffle_mode="permutation",
+            replication_pg=replication_pg,
+        )
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        retrieved_per_rank = {rank: [] for pg in replication_pg for rank in pg}
+        done = set()
+        while len(done) < len(retrieved_per_rank):
+            for rank in retrieved_per_rank:
+                try:
+                    retrieved_per_rank[rank].extend(
+                        i.index for i in iteration_state.next_items(rank, 37)
+                    )
+                except IterationStateException:
+                    done.add(rank)
+
+        for pg in replication_pg:
+            self.assertEqual(retrieved_per_rank[pg[0]], retrieved_per_rank[pg[1]])
+        self.assertEqual(
+            sorted(retrieved_per_rank[0] + retrieved_per_rank[2]),
+            list(range(self.total_samples)),
+        )
+
+    def test_pop_index_buffer(self):
+        shuffle_buffer_size = 1000
+
+        def pop_all(shuffle_seed: int) -> list[int]:
+            iteration = self.get_iteration(
+                "test_pop_index_buffer",
+                shuffle=True,
+                shuffle_seed=shuffle_seed,
+                shuffle_block_size=2,
+                shuffle_mode="buffer",
+                shuffle_buffer_size=shuffle_buffer_size,
+            )
+            iteration_state = IterationState(iteration.id, self.cache)
+            iteration_state.init(iteration)
+
+            retrieved = []
+            ranks_done = set()
+            for i in range(self.total_samples * 2):
+                if len(ranks_done) == 3:
+                    break
+                try:
+                    retrieved.append(iteration_state._pop_index(i % 3))
+                except IterationStateException:
+                    ranks_done.add(i % 3)
+                    continue
+                # at most the buffer and a block of shards are open
+                self.assertLessEqual(
+                    self.cache.llen(iteration_state._key("shuffle_buffer")),
+                    shuffle_buffer_size + 2 * self.samples_per_shard,
+                )
+            return retrieved
+
+        retrieved = pop_all(42)
+        self.assertEqual(len(set(retrieved)), len(retrieved), "duplicate indices")
+        self.assertEqual(set(retrieved), set(range(self.total_samples)))
+        self.assertEqual(retrieved, pop_all(42))
+        self.assertNotEqual(retrieved, pop_all(43))
+
+        # mixed across more shards than a block
+        shards = [i // self.samples_per_shard for i in retrieved[:200]]
+        self.assertGreater(len(set(shards)), 2)
+        # yet the shards are still read roughly in order
+        first_half = [i // self.samples_per_shard for i in retrieved[:5000]]
+        self.assertLess(np.mean(first_half), self.num_shards / 2)
+
+    def test_lpop_random(self):
+        key = "test_lpop_random"
+        self.cache.delete(key)
+        self.cache.rpush(key, *range(5))
+
+        # the popped items are swapped with the last one
+        popped = self.cache.lpop_random(key, 2, [0.0, 0.99, 0.5, 0.5])
+        self.assertEqual([int(i) for i in popped], [0, 3, 1])
+        self.assertEqual([int(i) for i in self.cache.lrange(key, 0, -1)], [4, 2])
+
+        popped = self.cache.lpop_random(key, 0, [0.5, 0.5, 0.5])
+        self.assertEqual([int(i) for i in popped], [2, 4])
+        self.assertEqual(self.cache.llen(key), 0)
+
+    def test_get_ranks(self):
+        replication_pg = [[0, 1], [2, 3]]
+        iteration = self.get_iteration("test_get_ranks", replication_pg=replication_pg)
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+        self.assertEqual(iteration_state.get_ranks(), [])
+
+        with mock.patch.object(
+            self.cache, "keys", side_effect=AssertionError("keyspace scanned")
+        ):
+            iteration_state.next_items(0, 150)
+            self.assertEqual(iteration_state.get_ranks(), [0, 1])
+            iteration_state.next_items(2, 10)
+            self.assertEqual(iteration_state.get_ranks(), [0, 1, 2, 3])
+            self.assertEqual(iteration_state.get_progress().current, 150 + 10)
+
+    def test_pruned_shards(self):
+        from lavender_data.server.registries import FilterRegistry
+        from lavender_data.server.registries.built_in.min_max_filter import (
+            MinMaxFilter,
+        )
+
+        FilterRegistry.initialize(MinMaxFilter.name)
+        iteration = self.get_iteration(
+            "test_pruned_shards",
+            filters=[
+                {
+                    "name": MinMaxFilter.name,
+                    "params": {"column": "test_column", "min_value": 50},
+                }
+            ],
+        )
+        # shard i has values from i to i + 10
+        for shard in iteration.shardsets[0].shards:
+            shard.statistics = ShardStatistics(
+                shard_id=shard.id,
+                data={
+                    "test_column": {
+                        "type": "numeric",
+                        "nan_count": 0,
+                        "count": shard.samples,
+                        "min": shard.index,
+                        "max": shard.index + 10,
+                    }
+                },
+            )
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        retrieved = []
+        while True:
+            try:
+                retrieved.append(iteration_state._pop_index(0))
+            except IterationStateException:
+                break
+
+        # shards 0 to 40 have no value above 50
+        self.assertEqual(
+            retrieved,
+            list(range(41 * self.samples_per_shard, self.total_samples)),
+        )
+        self.assertEqual(
+            iteration_state.get_progress().filtered, 41 * self.samples_per_shard
+        )
+
+    def test_shard_layout(self):
+        iteration = self.get_iteration("test_shard_layout")
+        shards = iteration.shardsets[0].shards
+        for shard in shards:
+            # including empty shards
+            shard.samples = shard.index % 3
+        shard_samples = [s.samples for s in shards]
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        layout = iteration_state._layout()
+        for index in range(sum(shard_samples)):
+            main_shard, feature_shards = layout.get_shards_from_index(index)
+            self.assertEqual(
+                (main_shard.index, main_shard.sample_index),
+                span(index, shard_samples),
+            )
+            self.assertEqual(main_shard.samples, shard_samples[main_shard.index])
+            self.assertEqual(feature_shards, [])
+        with self.assertRaises(IterationStateException):
+            layout.get_shards_from_index(sum(shard_samples))
+
+        # decoded once, not read from the cache again
+        with mock.patch.object(self.cache, "lrange", side_effect=AssertionError):
+            self.assertIs(iteration_state._layout(), layout)
+
+        # loaded again when the iteration is initialized again
+        for key in self.cache.keys(f"{iteration.id}:*"):
+            self.cache.delete(key)
+        shards[0].samples = 5
+        iteration_state.init(iteration)
+        self.assertIsNot(iteration_state._layout(), layout)
+        self.assertEqual(iteration_state._layout().offsets[1], 5)
+
+    def test_get_upcoming_shards(self):
+        rank = 0
+        iteration = self.get_iteration(
+            "test_get_upcoming_shards",
+            shuffle=True,
+            shuffle_seed=0,
+            shuffle_block_size=1,
+        )
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        upcoming = [s.index for s in iteration_state.get_upcoming_shards(3)]
+        self.assertEqual(len(upcoming), 3)
+
+        popped = []
+        for _ in range(self.samples_per_shard):
+            shard_index = iteration_state.next_item(rank).main_shard.index
+            if shard_index not in popped:
+                popped.append(shard_index)
+        self.assertEqual(popped, upcoming[:1])
+        self.assertEqual(
+            [s.index for s in iteration_state.get_upcoming_shards(2)], upcoming[1:]
+        )
+
     def test_pop_index_no_shuffle_replication_pg(self):
         ranks = [0, 1, 2, 3, 4, 5, 6, 7]
         replication_pg = [[0, 1], [2, 3], [4, 5], [6, 7]]
@@ -334,3 +736,105 @@ class TestIterationState(unittest.TestCase):
         self.assertEqual(progress.current, 5)
         self.assertEqual(progress.completed, 5)
         self.assertEqual(len(progress.inprogress), 0)
+
+    def test_categorizer_buckets(self):
+        iteration = self.get_iteration("test_categorizer_buckets")
+
+        iteration_state = IterationState(iteration.id, self.cache)
+        iteration_state.init(iteration)
+
+        items = iteration_state.next_items(0, 10)
+        emitted = []
+        for item in items[:7]:
+            emitted.extend(
+                iteration_state._add_to_bucket(
+                    "even" if item.index % 2 == 0 else "odd", item, 4
+                )
+            )
+        # indices 0, 2, 4, 6 fill the bucket of even ones
+        self.assertEqual([item.index for item in emitted], [0, 2, 4, 6])
+
+        # the odd ones are below both the budget and the ttl
+        self.assertEqual(iteration_state._flush_bucket(4, budget=10, ttl=60), [])
+
+        # over the budget
+        flushed = iteration_state._flush_bucket(4, budget=2)
+        self.assertEqual([item.index for item in flushed], [1, 3, 5])
+        self.assertEqual(iteration_state._flush_bucket(4, budget=2), [])
+
+        for item in items[7:]:
+            iteration_state._add_to_bucket(
+                "even" if item.index % 2 == 0 else "odd", item, 4
+            )
+        time.sleep(1.1)
+        flushed = iteration_state._flush_bucket(4, ttl=1)
+        self.assertEqual([item.index for item in flushed], [8])
+        flushed = iteration_state._flush_bucket(4, ttl=1)
+        self.assertEqual([item.index for item in flushed], [7, 9])
+        self.assertEqual(iteration_state._flush_bucket(4, ttl=1), [])
+
+    def test_mixture(self):
+        components = [
+            self.get_iteration("test_mixture_a"),
+            self.get_iteration("test_mixture_b"),
+        ]
+        for component in components:
+            for shardset in component.shardsets:
+                shardset.dataset = component.dataset
+        for key in self.cache.keys("test:it-test_mixture:*"):
+            self.cache.delete(key)
+
+        iteration = Iteration(
+            id="test:it-test_mixture",
+            dataset_id=components[0].dataset_id,
+            total=self.total_samples * 2,
+            batch_size=0,
+            dataset=components[0].dataset,
+            shardsets=components[0].shardsets + components[1].shardsets,
+            mixture=[
+                {
+                    "dataset_id": component.dataset_id,
+                    "shardsets": [s.id for s in component.shardsets],
+                    "weight": weight,
+                }
+                for component, weight in zip(components, [3, 1])
+            ],
+        )
+        iteration_state = open_iteration_state(iteration.id, self.cache, mixture=True)
+        iteration_state.init(iteration)
+        self.assertIsInstance(
+            open_iteration_state(iteration.id, self.cache), MixtureIterationState
+        )
+
+        # 3 samples of the first dataset for each of the second one
+        items = iteration_state.next_items(0, 40)
+        self.assertEqual(
+            [item.index >= self.total_samples for item in items],
+            [False, False, False, True] * 10,
+        )
+        self.assertEqual(
+            [item.index for item in items[:8]],
+            [0, 1, 2, self.total_samples, 3, 4, 5, self.total_samples + 1],
+        )
+        for item in items[:20]:
+            iteration_state.complete(item.index)
+
+        progress = iteration_state.get_progress()
+        self.assertEqual(progress.total, self.total_samples * 2)
+        self.assertEqual(progress.current, 40)
+        self.assertEqual(progress.completed, 20)
+        self.assertEqual(
+            sorted(i.index for i in progress.inprogress),
+            sorted(item.index for item in items[20:]),
+        )
+
+        iteration_state._pushback_indices(0, [items[-2].index])
+        self.assertEqual(iteration_state.next_item(0).index, items[-2].index)
+
+        indices = [item.index for item in items]
+        while True:
+            try:
+                indices.extend(i.index for i in iteration_state.next_items(0, 100))
+            except IterationStateException:
+                break
+        self.assertEqual(sorted(indices), list(range(self.total_samples * 2)))
@@ -1,6 +1,9 @@
 import unittest
 import shutil
 import os
+import threading
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import numpy as np
 
@@ -11,6 +14,8 @@ from lavender_data.server.reader import (
     ShardInfo,
     InnerJoinSampleInsufficient,
 )
+from lavender_data.server.reader.disk_cache import DiskCache
+from lavender_data.server.reader.lookahead import ShardLookahead
 
 from tests.utils.shards import create_test_shard
 
@@ -141,4 +146,388 @@ class TestReader(unittest.TestCase):
         with self.assertRaises(InnerJoinSampleInsufficient):
             self.reader.get_sample(index, join="inner")
 
-    # TODO cache size test
+    def test_memory_cache_size(self):
+        reader = ServerSideReader(
+            disk_cache_size=self.disk_cache_size,
+            memory_cache_size=1,
+            dirname=".cache/reader",
+        )
+        shards = [
+            ShardInfo(
+                shardset_id="test-reader",
+                index=i,
+                samples=samples,
+                location=f"file://{shard}",
+                format="csv",
+                filesize=1,
+                columns=columns,
+            )
+            for i, (shard, samples, columns) in enumerate(
+                [
+                    (self.image_url_shard, 3, {"id": "int", "image_url": "string"}),
+                    (self.caption_shard, 2, {"id": "int", "caption": "string"}),
+                ]
+            )
+        ]
+
+        with reader.pinned(shards[0]):
+            reader.get_reader(shards[0], "id", "int").get_item_by_index(0)
+            reader.get_reader(shards[1], "id", "int").get_item_by_index(0)
+            reader.get_reader(shards[0], "id", "int").get_item_by_index(0)
+
+            stats = reader.stats().memory
+            # the pinned reader stays even though it is over the capacity
+            self.assertEqual(stats.readers, 1)
+            self.assertEqual(stats.pinned, 1)
+            self.assertGreater(stats.evictions, 0)
+            self.assertEqual(stats.hits, 1)
+            self.assertEqual(stats.misses, 2)
+
+        stats = reader.stats().memory
+        self.assertEqual(stats.readers, 0)
+        self.assertEqual(stats.size, 0)
+        self.assertTrue(os.path.exists(self.image_url_shard))
+        self.assertTrue(os.path.exists(self.caption_shard))
+
+    def test_parquet_reader_random_access(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from lavender_data.shard.readers import Reader
+
+        shard = f"{self.test_dir}/random_access.parquet"
+        pq.write_table(
+            pa.Table.from_pydict(
+                {"id": list(range(100)), "value": [f"v{i}" for i in range(100)]}
+            ),
+            shard,
+            row_group_size=10,
+        )
+
+        reader = Reader.get(
+            format="parquet",
+            location=f"file://{shard}",
+            filepath=shard,
+            uid_column_name="id",
+            uid_column_type="int64",
+        )
+
+        self.assertEqual(len(reader), 100)
+        self.assertEqual(reader.get_item_by_index(42), {"id": 42, "value": "v42"})
+        self.assertEqual(reader.get_item_by_index(-1), {"id": 99, "value": "v99"})
+        with self.assertRaises(IndexError):
+            reader.get_item_by_index(100)
+
+        # only the touched row groups are decoded, not the whole shard
+        self.assertFalse(reader.loaded)
+        self.assertEqual(list(reader._row_groups.keys()), [4, 9])
+
+        for i in range(100):
+            self.assertEqual(reader.get_item_by_index(i)["id"], i)
+        self.assertLessEqual(len(reader._row_groups), reader.row_group_cache_size)
+
+        self.assertEqual(reader.get_item_by_uid(7)["value"], "v7")
+
+        # concurrent readers open the file once
+        reader.clear(delete_files=False)
+        barrier = threading.Barrier(8)
+        results = []
+
+        def read(i: int):
+            barrier.wait()
+            results.append(reader.get_item_by_index(i * 10)["id"])
+
+        with mock.patch.object(pq, "ParquetFile", wraps=pq.ParquetFile) as opened:
+            threads = [threading.Thread(target=read, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(results), [i * 10 for i in range(8)])
+        self.assertEqual(opened.call_count, 1)
+
+    def test_parquet_reader_uid_index(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from lavender_data.shard.readers import Reader
+
+        shard = f"{self.test_dir}/uid_index.parquet"
+        uids = [(i * 7919) % 100 for i in range(100)]
+        pq.write_table(
+            pa.Table.from_pydict({"id": uids, "value": [f"v{u}" for u in uids]}),
+            shard,
+            row_group_size=10,
+        )
+        uid_index_filepath = f"{self.test_dir}/uid-index/uid_index.npy"
+
+        reader = Reader.get(
+            format="parquet",
+            location=f"file://{shard}",
+            filepath=shard,
+            uid_column_name="id",
+            uid_column_type="int64",
+            uid_index_filepath=uid_index_filepath,
+        )
+        self.assertEqual(reader.get_item_by_uid(42), {"id": 42, "value": "v42"})
+        self.assertEqual(reader.get_item_by_uid("13"), {"id": 13, "value": "v13"})
+        with self.assertRaises(KeyError):
+            reader.get_item_by_uid(100)
+        self.assertFalse(reader.loaded)
+        self.assertTrue(os.path.exists(uid_index_filepath))
+
+        # the index is reused by the next reader of the same shard
+        reader = Reader.get(
+            format="parquet",
+            location=f"file://{shard}",
+            filepath=shard,
+            uid_column_name="id",
+            uid_column_type="int64",
+            uid_index_filepath=uid_index_filepath,
+        )
+        reader.read_uids = None
+        self.assertEqual(reader.get_item_by_uid(99)["value"], "v99")
+
+    def test_parquet_reader_remote(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from lavender_data.shard.readers import Reader
+
+        shard = f"{self.test_dir}/remote.parquet"
+        pq.write_table(
+            pa.Table.from_pydict(
+                {
+                    "id": list(range(1000)),
+                    "value": [os.urandom(1000) for _ in range(1000)],
+                }
+            ),
+            shard,
+            row_group_size=100,
+            compression="none",
+        )
+        with open(shard, "rb") as f:
+            ShardRequestHandler.content = f.read()
+        ShardRequestHandler.bytes_sent = 0
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ShardRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with mock.patch.dict(
+            os.environ, {"LAVENDER_DATA_REMOTE_READ_BLOCK_SIZE": "16384"}
+        ):
+            reader = Reader.get(
+                format="parquet",
+                location=f"http://127.0.0.1:{server.server_address[1]}/remote.parquet",
+                dirname=self.test_dir + "/remote",
+                uid_column_name="id",
+                uid_column_type="int64",
+                remote=True,
+            )
+            self.assertTrue(reader.remote)
+            self.assertEqual(reader.columns, {"id": "int64", "value": "binary"})
+            self.assertEqual(len(reader), 1000)
+            self.assertEqual(reader.get_item_by_index(512)["id"], 512)
+            self.assertEqual(reader.get_item_by_index(999)["id"], 999)
+
+        # the shard is not downloaded, only the footer and two row groups are read
+        self.assertFalse(os.path.exists(reader.filepath))
+        self.assertLess(
+            ShardRequestHandler.bytes_sent, len(ShardRequestHandler.content) / 2
+        )
+        reader.clear()
+
+    def test_uid_index(self):
+        from lavender_data.shard.readers.uid_index import UidIndex
+
+        index = UidIndex.build(["c", "a", "b", "a"])
+        self.assertEqual(index.lookup("b"), 2)
+        self.assertEqual(index.lookup("a"), 3)
+        with self.assertRaises(KeyError):
+            index.lookup("d")
+
+        filepath = f"{self.test_dir}/uid-index/strings.npy"
+        index.save(filepath)
+        loaded = UidIndex.load(filepath)
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.lookup("c"), 0)
+
+
+class ShardRequestHandler(BaseHTTPRequestHandler):
+    content = b""
+    bytes_sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.content)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        start, end = [
+            int(v) for v in self.headers["Range"].removeprefix("bytes=").split("-")
+        ]
+        body = self.content[start : end + 1]
+        ShardRequestHandler.bytes_sent += len(body)
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = ".cache/test-disk-cache"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name: str, size: int) -> str:
+        path = os.path.join(self.test_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"0" * size)
+        return path
+
+    def _test_eviction(self, index: str):
+        existing = self._write("existing", 10)
+        evicted = []
+        disk_cache = DiskCache(
+            self.test_dir, 30, index=index, on_evicted=evicted.append
+        )
+        self.assertEqual(disk_cache.stats().files, 1)
+        self.assertEqual(disk_cache.stats().size, 10)
+
+        disk_cache.touch_interval = 0
+        a = self._write("a", 10)
+        disk_cache.record(a)
+        b = self._write("b", 10)
+        disk_cache.record(b)
+        disk_cache.ensure_size()
+        self.assertEqual(disk_cache.stats().evictions, 0)
+
+        # least recently accessed first, "existing" is pinned
+        disk_cache.pin(existing)
+        disk_cache.touch(a)
+        c = self._write("c", 10)
+        disk_cache.record(c)
+        disk_cache.ensure_size()
+        self.assertTrue(os.path.exists(existing))
+        self.assertTrue(os.path.exists(a))
+        self.assertFalse(os.path.exists(b))
+        self.assertTrue(os.path.exists(c))
+
+        disk_cache.unpin(existing)
+        d = self._write("d", 10)
+        disk_cache.record(d)
+        disk_cache.ensure_size()
+        self.assertFalse(os.path.exists(existing))
+
+        stats = disk_cache.stats()
+        self.assertEqual(stats.evictions, 2)
+        self.assertEqual(evicted, [b, existing])
+        self.assertEqual(stats.files, 3)
+        self.assertEqual(stats.size, 30)
+        self.assertEqual(stats.pinned, 0)
+        self.assertFalse(disk_cache.touch(b))
+
+    def test_memory_index(self):
+        self._test_eviction("memory")
+
+    def test_sqlite_index(self):
+        self._test_eviction("sqlite")
+
+        # the index is persisted
+        disk_cache = DiskCache(self.test_dir, 30, index="sqlite")
+        self.assertEqual(disk_cache.stats().files, 3)
+        self.assertEqual(disk_cache.stats().size, 30)
+
+        # nested pins are counted locally, and written once
+        path = os.path.join(self.test_dir, "a")
+        disk_cache.pin(path)
+        disk_cache.pin(path)
+        self.assertEqual(
+            disk_cache.index._execute("SELECT COUNT(*) FROM pins")[0][0], 1
+        )
+        disk_cache.unpin(path)
+        self.assertEqual(disk_cache.index.pinned(), {path})
+        disk_cache.unpin(path)
+        self.assertEqual(disk_cache.index.pinned(), set())
+
+        # the access times of the files evicted by another process are dropped
+        for name in ["a", "c", "d"]:
+            disk_cache.touch(os.path.join(self.test_dir, name))
+        DiskCache(self.test_dir, 10, index="sqlite").ensure_size()
+        disk_cache.touch(self._write("e", 10))
+        self.assertEqual(disk_cache.stats().files, 2)
+        self.assertEqual(len(disk_cache._last_touched), 2)
+
+
+class TestShardLookahead(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = ".cache/test-shard-lookahead"
+        os.makedirs(f"{self.test_dir}/remote", exist_ok=True)
+        os.makedirs(f"{self.test_dir}/cache", exist_ok=True)
+
+        self.location = f"file://{self.test_dir}/remote/shard.csv"
+        create_test_shard(
+            self.location.removeprefix("file://"),
+            [{"id": 0, "caption": "Caption for image 0"}],
+        )
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.test_dir)
+
+    def test_download_ahead(self):
+        lookahead = ShardLookahead(workers=2)
+        filepath = f"{self.test_dir}/cache/shard.csv"
+        downloaded = []
+
+        lookahead.submit(self.location, filepath, 1, on_downloaded=downloaded.append)
+        # submitted twice, downloaded once
+        lookahead.submit(self.location, filepath, 1, on_downloaded=downloaded.append)
+
+        self.assertTrue(lookahead.wait(filepath))
+        self.assertTrue(os.path.exists(filepath))
+        self.assertEqual(downloaded, [filepath])
+        # consumed by the first reader
+        self.assertFalse(lookahead.wait(filepath))
+
+        stats = lookahead.stats()
+        self.assertEqual(stats.downloaded, 1)
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.inflight, 0)
+        self.assertEqual(stats.failed, 0)
+
+        lookahead.submit(
+            f"file://{self.test_dir}/remote/missing.csv",
+            f"{self.test_dir}/cache/missing.csv",
+            1,
+        )
+        self.assertFalse(lookahead.wait(f"{self.test_dir}/cache/missing.csv"))
+        self.assertEqual(lookahead.stats().failed, 1)
+        lookahead.shutdown()
+
+    def test_forget_evicted(self):
+        lookahead = ShardLookahead(workers=1)
+        lookahead.max_downloaded = 1
+        filepaths = [f"{self.test_dir}/cache/shard-{i}.csv" for i in range(2)]
+        for filepath in filepaths:
+            lookahead.submit(self.location, filepath, 1)
+            lookahead._inflight.get(filepath).result()
+        # only the latest downloads are remembered
+        self.assertEqual(list(lookahead._downloaded), filepaths[1:])
+
+        # evicted before being read, then downloaded again
+        os.remove(filepaths[1])
+        lookahead.forget(filepaths[1])
+        self.assertFalse(lookahead.wait(filepaths[1]))
+        lookahead.submit(self.location, filepaths[1], 1)
+        self.assertTrue(lookahead.wait(filepaths[1]))
+        self.assertTrue(os.path.exists(filepaths[1]))
+        lookahead.shutdown()
@@ -1,9 +1,10 @@
 import time
+import threading
 import unittest
 import numpy as np
 import sys
 
-from lavender_data.server.registries.abc import Registry
+from lavender_data.server.registries.abc import Registry, to_columns, to_rows
 from lavender_data.server.registries import (
     Preprocessor,
     PreprocessorRegistry,
@@ -14,6 +15,7 @@ from lavender_data.server.registries import (
     Categorizer,
     CategorizerRegistry,
 )
+from lavender_data.server.iteration.executor import PreprocessorExecutor
 
 
 # Test registries
@@ -75,7 +77,7 @@ if sys.version_info >= (3, 11):
 
     # Test collaters
     class CountCollater(Collater, name="count"):
-        def collate(self, samples: list[dict]) -> dict:
+        def collate(self, samples: list[dict], **kwargs) -> dict:
             return {"count": len(samples)}
 
 else:
@@ -142,7 +144,7 @@ else:
     class CountCollater(Collater):
         name = "count"
 
-        def collate(self, samples: list[dict]) -> dict:
+        def collate(self, samples: list[dict], **kwargs) -> dict:
             return {"count": len(samples)}
 
 
@@ -185,6 +187,59 @@ class RegistriesTest(unittest.TestCase):
         processed_batch = preprocessor1.process(batch, multiply=2)
         self.assertEqual(processed_batch["multiplied"].tolist(), [2, 4, 6])
 
+    def test_preprocessor_executor(self):
+        executor = PreprocessorExecutor(workers=2)
+        self.addCleanup(executor.shutdown)
+
+        multiply = PreprocessorRegistry.get("multiply")
+        add = PreprocessorRegistry.get("add")
+        batch = executor.process(
+            ("iteration", 0),
+            [(multiply, {"multiply": 2}), (add, {"add": 1})],
+            {"value": np.array([1, 2, 3])},
+        )
+        self.assertEqual(batch["multiplied"].tolist(), [2, 4, 6])
+        self.assertEqual(batch["added"].tolist(), [2, 3, 4])
+
+        with self.assertRaises(KeyError):
+            executor.process(("iteration", 0), [(multiply, {})], {})
+
+        stats = executor.stats()
+        self.assertEqual(stats.workers, 2)
+        self.assertEqual(stats.queued, 0)
+        self.assertEqual(stats.running, 0)
+        self.assertEqual(stats.preprocessors["multiply"].count, 2)
+        self.assertEqual(stats.preprocessors["multiply"].failed, 1)
+        self.assertEqual(stats.preprocessors["add"].count, 1)
+        self.assertEqual(stats.preprocessors["add"].failed, 0)
+
+    def test_preprocessor_executor_fairness(self):
+        executor = PreprocessorExecutor(workers=1)
+        self.addCleanup(executor.shutdown)
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        executor.submit("a", "block", block)
+        started.wait()
+
+        order = []
+        futures = [
+            executor.submit(owner, "append", order.append, owner)
+            for owner in ["a", "a", "a", "b"]
+        ]
+        self.assertEqual(executor.stats().queued, 4)
+        release.set()
+        for future in futures:
+            future.result()
+
+        # b does not wait for every task of a
+        self.assertEqual(order, ["a", "b", "a", "a"])
+
     def test_filter_registry(self):
         # Test registration
         self.assertIn("mod", FilterRegistry.all())
@@ -200,6 +255,99 @@ class RegistriesTest(unittest.TestCase):
             else:
                 self.assertFalse(filter1.filter(sample, mod=2))
 
+    def test_filter_batch(self):
+        filter1 = FilterRegistry.get("mod")
+        batch = {"value": [1, 2, 3, 4]}
+        self.assertEqual(
+            filter1.filter_batch(batch, mod=2).tolist(), [False, True, False, True]
+        )
+
+    def test_to_columns(self):
+        samples = [
+            {"i": 1, "f": 0.5, "s": "a", "mixed": 1, "none": None, "ids": [1, 2]},
+            {"i": 2, "f": 1.5, "s": "bc", "mixed": "x", "none": 1, "ids": [3]},
+        ]
+        batch = to_columns(samples)
+        self.assertEqual(batch["i"].dtype, np.int64)
+        self.assertEqual(batch["f"].dtype, np.float64)
+        self.assertEqual(batch["s"].dtype.kind, "U")
+        for k in ["mixed", "none", "ids"]:
+            self.assertEqual(batch[k].dtype, object)
+            self.assertEqual(batch[k].shape, (2,))
+        # back to Python values
+        self.assertEqual(to_rows(batch), samples)
+        self.assertIsInstance(to_rows(batch)[0]["i"], int)
+
+    def test_min_max_filter_batch(self):
+        from lavender_data.server.registries.built_in.min_max_filter import (
+            MinMaxFilter,
+        )
+
+        min_max = MinMaxFilter()
+        for values in [
+            [0.5, 1, 2, 3.5, 10, float("nan")],
+            [1, "2", None, "a", 5],
+            [1.0, None, 5.0],
+            [None, None],
+        ]:
+            samples = [{"value": v} for v in values]
+            batch = to_columns(samples)
+            for params in [
+                {"min_value": 1},
+                {"max_value": 3.5},
+                {"min_value": 0.5, "max_value": 10},
+                {},
+            ]:
+                self.assertEqual(
+                    min_max.filter_batch(batch, column="value", **params).tolist(),
+                    [min_max.filter(s, column="value", **params) for s in samples],
+                )
+
+        self.assertEqual(
+            min_max.filter_batch(batch, column="missing").tolist(), [False] * 2
+        )
+
+    def test_min_max_filter_prune_shard(self):
+        from lavender_data.server.registries.built_in.min_max_filter import (
+            MinMaxFilter,
+        )
+
+        min_max = MinMaxFilter()
+        numeric = {"type": "numeric", "nan_count": 0, "count": 10, "min": 1, "max": 5}
+        categorical = {
+            "type": "categorical",
+            "nan_count": 0,
+            "n_unique": 2,
+            "frequencies": {"1": 5, "5": 5},
+        }
+        for statistics in [numeric, categorical]:
+            statistics = {"value": statistics}
+            columns = {"value": "int"}
+            self.assertTrue(
+                min_max.prune_shard(statistics, columns, column="value", min_value=5)
+            )
+            self.assertTrue(
+                min_max.prune_shard(statistics, columns, column="value", max_value=1)
+            )
+            self.assertFalse(
+                min_max.prune_shard(statistics, columns, column="value", min_value=4)
+            )
+            # the statistics of text columns are of the lengths
+            self.assertFalse(
+                min_max.prune_shard(
+                    statistics, {"value": "text"}, column="value", min_value=5
+                )
+            )
+
+        self.assertFalse(
+            min_max.prune_shard(
+                {"value": {**numeric, "nan_count": 1}},
+                {"value": "float"},
+                column="value",
+                min_value=5,
+            )
+        )
+
     def test_categorizer_registry(self):
         # Test registration
         self.assertIn("aspect_ratio", CategorizerRegistry.all())
@@ -215,6 +363,13 @@ class RegistriesTest(unittest.TestCase):
             categorizer1.categorize({"width": 1920, "height": 1080}), "1920x1080"
         )
 
+    def test_categorize_batch(self):
+        categorizer1 = CategorizerRegistry.get("aspect_ratio")
+        batch = {"width": [1280, 1920], "height": [720, 1080]}
+        self.assertEqual(
+            categorizer1.categorize_batch(batch), ["1280x720", "1920x1080"]
+        )
+
     def test_collater_registry(self):
         # Test registration
         self.assertIn("count", CollaterRegistry.all())
@@ -226,3 +381,63 @@ class RegistriesTest(unittest.TestCase):
         samples = [{"sample": 1}, {"sample": 2}]
         collated = collater1.collate(samples)
         self.assertEqual(collated.get("count"), 2)
+
+        # params of an iteration are passed to the default collater too
+        from lavender_data.server.registries.built_in.default_collater import (
+            DefaultCollater,
+        )
+
+        collated = DefaultCollater().collate(samples, unused=True)
+        self.assertEqual(list(collated["sample"]), [1, 2])
+
+    def test_packing_collater(self):
+        from lavender_data.server.registries.built_in.packing_collater import (
+            PackingCollater,
+        )
+
+        packing = PackingCollater()
+        samples = [
+            {"uid": 0, "input_ids": [1, 2, 3, 4, 5]},
+            {"uid": 1, "input_ids": np.array([6, 7, 8])},
+            {"uid": 2, "input_ids": [9, 10]},
+            {"uid": 3, "input_ids": [11, 12, 13, 14, 15, 16, 17, 18, 19]},
+        ]
+        # the last token of uid 3 fits in the room left in the second row
+        batch = packing.collate(samples, max_length=8, pad_token_id=-1)
+
+        self.assertEqual(batch["uid"], [0, 1, 2, 3])
+        self.assertEqual(
+            batch["input_ids"].tolist(),
+            [
+                [1, 2, 3, 4, 5, 6, 7, 8],
+                [9, 10, 19, -1, -1, -1, -1, -1],
+                [11, 12, 13, 14, 15, 16, 17, 18],
+            ],
+        )
+        self.assertEqual(
+            batch["position_ids"].tolist(),
+            [
+                [0, 1, 2, 3, 4, 0, 1, 2],
+                [0, 1, 0, 0, 0, 0, 0, 0],
+                [0, 1, 2, 3, 4, 5, 6, 7],
+            ],
+        )
+        self.assertEqual(
+            batch["segment_ids"].tolist(),
+            [
+                [1, 1, 1, 1, 1, 2, 2, 2],
+                [1, 1, 2, 0, 0, 0, 0, 0],
+                [1, 1, 1, 1, 1, 1, 1, 1],
+            ],
+        )
+
+        # the room left in the first rows is filled first
+        batch = packing.collate(
+            [{"input_ids": [1] * 6}, {"input_ids": [2] * 6}, {"input_ids": [3] * 2}],
+            max_length=8,
+        )
+        self.assertEqual(batch["segment_ids"].tolist()[0], [1] * 6 + [2] * 2)
+        self.assertEqual(batch["input_ids"].shape, (2, 8))
+
+        with self.assertRaises(ValueError):
+            packing.collate([{"input_ids": "text"}], max_length=8)
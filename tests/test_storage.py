@@ -0,0 +1,379 @@
+import io
+import os
+import time
+import shutil
+import unittest
+import importlib.util
+import unittest.mock
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from lavender_data.storage import (
+    Storage,
+    S3Storage,
+    download_file,
+    open_file,
+    scrub_files,
+)
+from lavender_data.storage.validation import (
+    read_validation_record,
+    write_validation_record,
+)
+from lavender_data.storage.http import http_download
+from lavender_data.storage.ranged import ranged_download
+
+test_dir = ".cache/test-storage"
+
+
+class CountingStorage(Storage):
+    scheme = "counting"
+
+    def download(self, remote_path: str, local_path: str) -> None:
+        with open(os.path.join(test_dir, "downloads.log"), "a") as f:
+            f.write(f"{remote_path}\n")
+        with open(local_path, "wb") as f:
+            f.write(b"partial")
+            f.flush()
+            time.sleep(0.5)
+            f.write(b" and complete")
+
+    def upload(self, local_path: str, remote_path: str) -> None:
+        raise NotImplementedError
+
+    def list(self, remote_path: str, limit: Optional[int] = None) -> list[str]:
+        raise NotImplementedError
+
+    def get_url(self, remote_path: str) -> str:
+        return remote_path
+
+
+def _download(local_path: str):
+    download_file("counting://shard", local_path)
+    with open(local_path, "rb") as f:
+        return f.read()
+
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        os.makedirs(test_dir, exist_ok=True)
+        self.local_path = os.path.join(test_dir, "shard")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(test_dir)
+
+    def _download_count(self) -> int:
+        with open(os.path.join(test_dir, "downloads.log")) as f:
+            return len(f.readlines())
+
+    def test_download_file_single_flight_threads(self):
+        with ThreadPoolExecutor(8) as executor:
+            contents = list(executor.map(_download, [self.local_path] * 8))
+
+        self.assertEqual(self._download_count(), 1)
+        self.assertEqual(set(contents), {b"partial and complete"})
+        # no temporary files left
+        self.assertEqual(
+            sorted(f for f in os.listdir(test_dir) if not f.endswith(".lock")),
+            ["downloads.log", "shard"],
+        )
+
+    def test_download_file_single_flight_processes(self):
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            contents = pool.map(_download, [self.local_path] * 4)
+
+        self.assertEqual(self._download_count(), 1)
+        self.assertEqual(set(contents), {b"partial and complete"})
+
+    def test_download_file_again(self):
+        _download(self.local_path)
+        _download(self.local_path)
+        # not coalesced when nobody is downloading
+        self.assertEqual(self._download_count(), 2)
+
+
+class ChecksumStorage(Storage):
+    scheme = "checksum"
+    content = b"content"
+
+    def download(self, remote_path: str, local_path: str) -> None:
+        with open(local_path, "wb") as f:
+            f.write(self.content)
+        write_validation_record(local_path, remote_path, etag="etag")
+
+    def verify(self, remote_path: str, local_path: str) -> bool:
+        with open(local_path, "rb") as f:
+            return f.read() == self.content
+
+    def upload(self, local_path: str, remote_path: str) -> None:
+        raise NotImplementedError
+
+    def list(self, remote_path: str, limit: Optional[int] = None) -> list[str]:
+        raise NotImplementedError
+
+    def get_url(self, remote_path: str) -> str:
+        return remote_path
+
+
+class TestValidationRecord(unittest.TestCase):
+    def setUp(self):
+        os.makedirs(test_dir, exist_ok=True)
+        self.local_path = os.path.join(test_dir, "shard")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(test_dir)
+
+    def test_record_follows_download(self):
+        download_file("checksum://shard", self.local_path)
+
+        record = read_validation_record(self.local_path)
+        self.assertEqual(record.remote_path, "checksum://shard")
+        self.assertEqual(record.etag, "etag")
+        self.assertTrue(record.matches(self.local_path))
+        # no record of the temporary file left
+        self.assertEqual(
+            sorted(f for f in os.listdir(test_dir) if not f.endswith(".lock")),
+            [".shard.meta.json", "shard"],
+        )
+
+        with open(self.local_path, "ab") as f:
+            f.write(b"modified")
+        self.assertFalse(record.matches(self.local_path))
+
+    def test_scrub_files(self):
+        download_file("checksum://shard", self.local_path)
+        self.assertEqual(scrub_files(test_dir), [])
+
+        # corrupted without changing its size and mtime
+        stat = os.stat(self.local_path)
+        with open(self.local_path, "r+b") as f:
+            f.write(b"C")
+        os.utime(self.local_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        self.assertEqual(scrub_files(test_dir), [self.local_path])
+        self.assertFalse(os.path.exists(self.local_path))
+        self.assertIsNone(read_validation_record(self.local_path))
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("botocore") is not None, "botocore is not installed"
+    )
+    def test_s3_is_up_to_date(self):
+        from botocore.stub import Stubber
+
+        storage = S3Storage()
+        remote_path = "s3://bucket/shard"
+        with open(self.local_path, "wb") as f:
+            f.write(b"content")
+
+        with Stubber(storage.client) as stubber:
+            for _ in range(4):
+                stubber.add_response(
+                    "head_object",
+                    {"ETag": '"etag"', "ContentLength": 7},
+                    {"Bucket": "bucket", "Key": "shard"},
+                )
+
+            # no record and the checksum does not match the etag
+            self.assertFalse(storage.is_up_to_date(remote_path, self.local_path))
+
+            write_validation_record(self.local_path, remote_path, '"etag"')
+            # one HEAD and a stat, the file is not hashed
+            with unittest.mock.patch.object(
+                storage, "_md5_matches", side_effect=AssertionError
+            ):
+                self.assertTrue(storage.is_up_to_date(remote_path, self.local_path))
+
+            write_validation_record(self.local_path, remote_path, '"old-etag"')
+            self.assertFalse(storage.is_up_to_date(remote_path, self.local_path))
+
+            write_validation_record(self.local_path, remote_path, '"etag"')
+            os.utime(self.local_path, ns=(0, 0))
+            self.assertFalse(storage.is_up_to_date(remote_path, self.local_path))
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    content = os.urandom(1000)
+    failed_ranges = set()
+    range_requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.content)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        if range_header is None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(self.content)))
+            self.end_headers()
+            self.wfile.write(self.content)
+            return
+
+        self.range_requests.append(range_header)
+        start, end = [int(v) for v in range_header.removeprefix("bytes=").split("-")]
+        if start == 500 and range_header not in self.failed_ranges:
+            # fail once in the middle of the part
+            self.failed_ranges.add(range_header)
+            self.send_response(206)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            self.wfile.write(self.content[start : start + 10])
+            self.close_connection = True
+            return
+
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.content)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(self.content[start : end + 1])
+
+
+class FakeS3Body:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+
+class FakeS3Client:
+    content = os.urandom(1000)
+
+    def __init__(self):
+        self.ranges = []
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {"ETag": '"etag"', "ContentLength": len(self.content)}
+
+    def get_object(self, Bucket: str, Key: str, Range: str, IfMatch: str) -> dict:
+        assert IfMatch == '"etag"'
+        self.ranges.append(Range)
+        start, end = [int(v) for v in Range.removeprefix("bytes=").split("-")]
+        return {"Body": FakeS3Body(self.content[start : end + 1])}
+
+
+class TestRangedDownload(unittest.TestCase):
+    def setUp(self):
+        os.makedirs(test_dir, exist_ok=True)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(test_dir)
+
+    def test_s3_download(self):
+        storage = S3Storage.__new__(S3Storage)
+        storage.client = FakeS3Client()
+        local_path = os.path.join(test_dir, "shard")
+
+        with unittest.mock.patch.dict(
+            os.environ,
+            {
+                "LAVENDER_DATA_DOWNLOAD_PART_SIZE": "300",
+                "LAVENDER_DATA_DOWNLOAD_CONCURRENCY": "2",
+            },
+        ):
+            storage.download("s3://bucket/shard", local_path)
+
+        with open(local_path, "rb") as f:
+            self.assertEqual(f.read(), FakeS3Client.content)
+        self.assertEqual(
+            sorted(storage.client.ranges),
+            ["bytes=0-299", "bytes=300-599", "bytes=600-899", "bytes=900-999"],
+        )
+        self.assertEqual(read_validation_record(local_path).etag, '"etag"')
+
+    def test_progress_of_retried_part(self):
+        content = os.urandom(1000)
+        failed = set()
+
+        def read_range(start: int, end: int):
+            yield content[start : start + 10]
+            if start == 500 and start not in failed:
+                failed.add(start)
+                raise IOError("connection reset")
+            yield content[start + 10 : end + 1]
+
+        parts = []
+        local_path = os.path.join(test_dir, "shard")
+        ranged_download(
+            read_range,
+            len(content),
+            local_path,
+            part_size=100,
+            concurrency=4,
+            backoff=0,
+            on_part=parts.append,
+        )
+        with open(local_path, "rb") as f:
+            self.assertEqual(f.read(), content)
+        # the failed attempt is not counted
+        self.assertEqual(sum(parts), len(content))
+
+
+class TestHttpStorage(unittest.TestCase):
+    def setUp(self):
+        os.makedirs(test_dir, exist_ok=True)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/shard"
+        RangeRequestHandler.range_requests.clear()
+        RangeRequestHandler.failed_ranges.clear()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(test_dir)
+
+    def test_ranged_download(self):
+        local_path = os.path.join(test_dir, "shard")
+        http_download(self.url, local_path, part_size=100, concurrency=4)
+
+        with open(local_path, "rb") as f:
+            self.assertEqual(f.read(), RangeRequestHandler.content)
+        # 10 parts, the failed one is retried alone
+        self.assertEqual(len(RangeRequestHandler.range_requests), 11)
+        self.assertEqual(RangeRequestHandler.range_requests.count("bytes=500-599"), 2)
+
+    def test_sequential_download(self):
+        local_path = os.path.join(test_dir, "shard")
+        http_download(self.url, local_path, part_size=100, concurrency=1)
+
+        with open(local_path, "rb") as f:
+            self.assertEqual(f.read(), RangeRequestHandler.content)
+        self.assertEqual(len(RangeRequestHandler.range_requests), 0)
+
+    def test_remote_file(self):
+        content = RangeRequestHandler.content
+        f = open_file(self.url, block_size=100)
+        self.assertEqual(f.size, len(content))
+
+        f.seek(450)
+        self.assertEqual(f.read(100), content[450:550])
+        # the two blocks are fetched in a single request
+        self.assertEqual(RangeRequestHandler.range_requests, ["bytes=400-599"])
+
+        f.seek(-50, io.SEEK_END)
+        self.assertEqual(f.read(), content[-50:])
+        f.seek(520)
+        self.assertEqual(f.read(10), content[520:530])
+        # cached blocks are not fetched again
+        self.assertEqual(
+            RangeRequestHandler.range_requests, ["bytes=400-599", "bytes=900-999"]
+        )
+        self.assertEqual(f.read(10000), content[530:])
+        self.assertEqual(f.read(), b"")
+
+        # a failed block is retried
+        f = open_file(self.url, block_size=100)
+        f.seek(510)
+        self.assertEqual(f.read(10), content[510:520])
+        self.assertEqual(RangeRequestHandler.range_requests.count("bytes=500-599"), 2)
+        f.close()